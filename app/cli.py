@@ -0,0 +1,250 @@
+import click
+import os
+import time
+from app import db
+
+def register_commands(app):
+    """Register maintenance commands on the Flask CLI"""
+    
+    @app.cli.command("seed-db")
+    @click.option('--create-tables', is_flag=True, help='Create missing tables first (for databases not managed by migrations).')
+    @click.option('--year', type=int, default=2025, show_default=True, help='Year to seed quarterly tax periods for.')
+    def seed_db_command(create_tables, year):
+        """Idempotently seed user types, the admin user, tax types and tax periods."""
+        from app.services.seed_service import seed_reference_data
+        if create_tables:
+            db.create_all()
+        counts = seed_reference_data(year=year)
+        db.session.commit()
+        for table, inserted in counts.items():
+            print(f"{table}: {inserted} inserted")
+    
+    @app.cli.command("rebuild-revenue-rollup")
+    def rebuild_revenue_rollup_command():
+        """Rebuild the daily revenue rollup from the payments table."""
+        from app.services.reporting_service import rebuild_revenue_rollup
+        rows = rebuild_revenue_rollup()
+        db.session.commit()
+        print(f"Revenue rollup rebuilt with {rows} rows.")
+    
+    @app.cli.command("verify-ledger-balances")
+    @click.option('--fix', is_flag=True, help='Rewrite drifted ledger rows and balance snapshots.')
+    def verify_ledger_balances_command(fix):
+        """Recompute running ledger balances and report drift against stored values."""
+        from app.services.ledger_service import verify_balances
+        row_drift, snapshot_drift = verify_balances(fix=fix)
+        
+        for account_id, tax_type_id, stored, expected in snapshot_drift:
+            print(f"Account {account_id} / tax type {tax_type_id}: snapshot {stored}, ledger {expected}")
+        print(f"{len(row_drift)} ledger rows and {len(snapshot_drift)} balance snapshots drifted.")
+        
+        if fix:
+            db.session.commit()
+            print("Drifted balances rewritten.")
+    
+    @app.cli.command("notification-worker")
+    @click.option('--once', is_flag=True, help='Process the pending jobs and exit instead of polling.')
+    @click.option('--interval', type=float, default=2.0, show_default=True, help='Seconds to sleep when the queue is empty.')
+    @click.option('--batch-size', type=int, default=100, show_default=True, help='Jobs to deliver per polling cycle.')
+    def notification_worker_command(once, interval, batch_size):
+        """Deliver queued notification fan-out jobs."""
+        import time
+        from app.services.notification_service import process_notification_jobs
+        while True:
+            delivered = process_notification_jobs(limit=batch_size)
+            if delivered:
+                print(f"Delivered {delivered} notification jobs.")
+            if once:
+                break
+            if not delivered:
+                db.session.remove()
+                time.sleep(interval)
+    
+    @app.cli.command("send-notification")
+    @click.option('--audience', type=click.Choice(['all', 'admins']), default='all', show_default=True, help='Users to notify.')
+    @click.option('--title', required=True, help='Notification title.')
+    @click.option('--message', required=True, help='Notification text.')
+    @click.option('--priority', type=click.Choice(['Low', 'Normal', 'High']), default='Normal', show_default=True)
+    def send_notification_command(audience, title, message, priority):
+        """Queue a notification copied to every user in an audience; the notification-worker delivers it."""
+        from app.services.notification_service import enqueue_notification_job
+        job = enqueue_notification_job(audience, title, message, notification_type='System', priority=priority)
+        db.session.commit()
+        print(f"Queued notification job {job.id} for audience '{audience}'.")
+    
+    @app.cli.command("reconcile-notification-counters")
+    def reconcile_notification_counters_command():
+        """Recompute the cached unread notification counters and fix any drift."""
+        from app.services.notification_service import reconcile_notification_counters
+        corrected = reconcile_notification_counters()
+        db.session.commit()
+        print(f"Rewrote {corrected} notification counters.")
+    
+    @app.cli.command("report-worker")
+    @click.option('--once', is_flag=True, help='Run the queued jobs and exit instead of polling.')
+    @click.option('--interval', type=float, default=5.0, show_default=True, help='Seconds to sleep when the queue is empty.')
+    @click.option('--processes', type=int, default=1, show_default=True, help='Worker processes to run side by side.')
+    def report_worker_command(once, interval, processes):
+        """Run queued background report jobs."""
+        import multiprocessing
+        import time
+        from app.services.report_job_service import process_report_jobs
+    
+        def work():
+            while True:
+                completed = process_report_jobs()
+                if completed:
+                    print(f"Completed {completed} report jobs.")
+                if once:
+                    break
+                if not completed:
+                    db.session.remove()
+                    time.sleep(interval)
+    
+        if processes <= 1:
+            work()
+            return
+    
+        def forked_work():
+            # Forked workers must not reuse the parent's pooled connections
+            db.session.remove()
+            db.engine.dispose(close=False)
+            work()
+    
+        db.session.remove()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=forked_work) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    
+    @app.cli.command("rebuild-search-index")
+    @click.option('--entity', 'entity_types', multiple=True, type=click.Choice(['person', 'organization', 'property']),
+                  help='Entity type to rebuild; repeatable. Defaults to all.')
+    @click.option('--batch-size', type=int, default=1000, show_default=True, help='Entities indexed per statement.')
+    def rebuild_search_index_command(entity_types, batch_size):
+        """Rebuild the registry search documents for persons, organizations and properties."""
+        from app.services.search_service import rebuild_search_index
+        counts = rebuild_search_index(list(entity_types) or None, batch_size=batch_size)
+        db.session.commit()
+        for entity_type, count in counts.items():
+            print(f"Indexed {count} {entity_type} records.")
+    
+    @app.cli.command("backfill-reference-registry")
+    @click.option('--batch-size', type=int, default=1000, show_default=True, help='References registered per statement.')
+    def backfill_reference_registry_command(batch_size):
+        """Register the reference numbers of existing records for reference tracking."""
+        from app.services.reference_service import backfill_reference_registry
+        counts = backfill_reference_registry(batch_size=batch_size)
+        db.session.commit()
+        for entity_type, count in counts.items():
+            print(f"Registered {count} {entity_type} references.")
+    
+    @app.cli.command("reflag-returns")
+    @click.option('--rule', 'rules', multiple=True, help='Flag rule to re-evaluate; repeatable. Defaults to all; reasons from other rules are kept.')
+    @click.option('--tax-type-id', type=int, help='Only re-flag returns of this tax type.')
+    @click.option('--chunk-size', type=int, default=5000, show_default=True, help='Returns evaluated and updated per chunk.')
+    @click.option('--dry-run', is_flag=True, help='Report what would change without writing it.')
+    def reflag_returns_command(rules, tax_type_id, chunk_size, dry_run):
+        """Re-evaluate the auto-flag rules over all filed tax returns."""
+        from app.services.flagging_service import FLAG_RULES, reflag_returns
+        unknown = [rule for rule in rules if rule not in FLAG_RULES]
+        if unknown:
+            raise click.BadParameter(f"Unknown rule(s): {', '.join(unknown)}. Known: {', '.join(FLAG_RULES)}",
+                                     param_hint='--rule')
+        started = time.perf_counter()
+        stats = reflag_returns(chunk_size=chunk_size, rules=list(rules) or None, tax_type_id=tax_type_id,
+                               dry_run=dry_run)
+        action = 'Would change' if dry_run else 'Changed'
+        print(f"Scanned {stats['scanned']} returns in {time.perf_counter() - started:.1f}s. "
+              f"{action} {stats['changed']}: {stats['flagged']} flagged, {stats['unflagged']} cleared.")
+        for rule, count in stats['by_rule'].items():
+            print(f"  {rule}: {count}")
+    
+    @app.cli.command("set-rate-schedule")
+    @click.argument('tax_type_code')
+    @click.option('--effective-from', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+                  help='Date the schedule takes effect (YYYY-MM-DD).')
+    @click.option('--bracket', 'brackets', multiple=True, required=True,
+                  help='LOWER_BOUND:RATE marginal bracket, e.g. 50000:0.15; repeatable.')
+    @click.option('--description', help='Note shown with the schedule, e.g. the enacting budget.')
+    def set_rate_schedule_command(tax_type_code, effective_from, brackets, description):
+        """Create or replace a tax type's rate schedule from a given date."""
+        from decimal import Decimal, InvalidOperation
+        from app.models.tax import TaxType
+        from app.services.rate_service import set_rate_schedule
+        tax_type = TaxType.query.filter_by(code=tax_type_code).first()
+        if tax_type is None:
+            raise click.BadParameter(f"No tax type with code {tax_type_code}", param_hint='TAX_TYPE_CODE')
+        try:
+            pairs = [tuple(Decimal(part) for part in bracket.split(':')) for bracket in brackets]
+        except InvalidOperation:
+            pairs = []
+        if len(pairs) != len(brackets) or any(len(pair) != 2 for pair in pairs):
+            raise click.BadParameter('Brackets are written LOWER_BOUND:RATE, e.g. 50000:0.15', param_hint='--bracket')
+        try:
+            schedule = set_rate_schedule(tax_type.id, effective_from.date(), pairs, description)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--bracket')
+        db.session.commit()
+        print(f"{tax_type.code} from {schedule.effective_from}: "
+              + ", ".join(f"{(bracket.rate * 100).normalize():f}% above {bracket.lower_bound}" for bracket in schedule.brackets))
+    
+    @app.cli.command("simulate-tax-policy")
+    @click.option('--schedule', 'schedules', multiple=True, required=True,
+                  help='CODE=LOWER:RATE,LOWER:RATE alternative schedule for a tax type; repeatable.')
+    @click.option('--start-date', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+                  help='Simulate returns of periods ending on or after this date.')
+    @click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+                  help='Simulate returns of periods ending on or before this date.')
+    @click.option('--segment-by', type=click.Choice(['tax_type', 'taxpayer_type', 'income_band']), default='tax_type',
+                  show_default=True, help='How to break the revenue delta down.')
+    @click.option('--processes', type=int, default=os.cpu_count() or 1, show_default=True,
+                  help='Worker processes re-pricing chunks side by side.')
+    @click.option('--chunk-size', type=int, default=10000, show_default=True, help='Returns read and re-priced per chunk.')
+    def simulate_tax_policy_command(schedules, start_date, end_date, segment_by, processes, chunk_size):
+        """Re-price filed returns under alternative rate schedules and report the revenue delta."""
+        from app.models.tax import TaxType
+        from app.services.simulation_service import parse_brackets, run_simulation
+        tax_type_ids = dict(db.session.query(TaxType.code, TaxType.id).all())
+        alternatives = {}
+        for schedule in schedules:
+            code, separator, brackets = schedule.partition('=')
+            if code not in tax_type_ids or not brackets:
+                raise click.BadParameter(f"Expected CODE=LOWER:RATE,... with a known tax type code, got {schedule}",
+                                         param_hint='--schedule')
+            try:
+                alternatives[tax_type_ids[code]] = parse_brackets(brackets)
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint='--schedule')
+    
+        result = run_simulation(alternatives, start_date.date(), end_date.date(), segment_by, processes=processes,
+                                chunk_size=chunk_size)
+        summary = result['summary']
+        print(f"{summary['returns']} returns re-priced in {summary['elapsed_seconds']}s. "
+              f"Revenue {summary['current_revenue']:,.2f} -> {summary['simulated_revenue']:,.2f} "
+              f"({summary['delta']:+,.2f}"
+              + (f", {summary['delta_percent']:+.2f}%)" if summary['delta_percent'] is not None else ")"))
+        print(f"{'Segment':24s} {'Returns':>10s} {'Current':>16s} {'Simulated':>16s} {'Delta':>16s} {'Up':>8s} {'Down':>8s}")
+        for row in result['segments']:
+            print(f"{str(row['segment']):24s} {row['returns']:10d} {row['current_revenue']:16,.2f} "
+                  f"{row['simulated_revenue']:16,.2f} {row['delta']:+16,.2f} {row['increased']:8d} {row['decreased']:8d}")
+    
+    @app.cli.command("import-bank-file")
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(['csv', 'fixed']), default='csv', show_default=True,
+                  help='Layout of the bank file.')
+    @click.option('--resume', is_flag=True, help='Take over an import left running by a crashed process.')
+    def import_bank_file_command(path, file_format, resume):
+        """Post the payments in a bank settlement file; unmatched lines go to suspense."""
+        from app.services.bank_import_service import import_bank_file
+        with open(path, 'rb') as stream:
+            try:
+                bank_import = import_bank_file(stream, os.path.basename(path), file_format, resume=resume)
+            except ValueError as e:
+                raise click.ClickException(str(e))
+        print(f"{bank_import.status}: {bank_import.total_lines} lines, {bank_import.matched_lines} posted "
+              f"({bank_import.matched_amount}), {bank_import.suspense_lines} in suspense.")
+        if bank_import.status != 'Completed':
+            raise click.ClickException(bank_import.last_error or 'Import failed')
@@ -23,8 +23,31 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
     
+    # Cross-request cache of user permissions and account ids, in seconds (0 disables)
+    AUTH_CONTEXT_CACHE_TTL = int(os.environ.get('AUTH_CONTEXT_CACHE_TTL') or 0)
+    
+    # Staff dashboard metrics cache, in seconds (0 disables). DASHBOARD_METRICS_CACHE_BACKEND
+    # may be set to a shared backend object; the default is a per-process cache.
+    DASHBOARD_METRICS_CACHE_TTL = int(os.environ.get('DASHBOARD_METRICS_CACHE_TTL') or 300)
+    DASHBOARD_METRICS_CACHE_BACKEND = None
+    
+    # Per-process cache of tax rate schedules, in seconds (0 reloads them for every calculation)
+    RATE_SCHEDULE_CACHE_TTL = int(os.environ.get('RATE_SCHEDULE_CACHE_TTL') or 300)
+    
+    # Policy simulations on the report worker: pool processes (0 uses every CPU) and returns per chunk
+    SIMULATION_PROCESSES = int(os.environ.get('SIMULATION_PROCESSES') or 0)
+    SIMULATION_CHUNK_SIZE = int(os.environ.get('SIMULATION_CHUNK_SIZE') or 10000)
+    
+    # Reports spanning more days than this run on the report worker instead of in the request
+    REPORT_SYNC_MAX_DAYS = int(os.environ.get('REPORT_SYNC_MAX_DAYS') or 366)
+    # Seconds a finished report is reused for identical requests, and before a running job is presumed dead
+    REPORT_JOB_RESULT_TTL = int(os.environ.get('REPORT_JOB_RESULT_TTL') or 3600)
+    REPORT_JOB_TIMEOUT = int(os.environ.get('REPORT_JOB_TIMEOUT') or 1800)
+    
     # App Constants
     ITEMS_PER_PAGE = 20
+    # Show an estimated total on keyset-paginated listings (planner estimate on PostgreSQL)
+    LISTING_APPROXIMATE_COUNT = os.environ.get('LISTING_APPROXIMATE_COUNT', '').lower() in ('1', 'true')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload
     
     # Security
@@ -23,6 +23,9 @@ class Document(db.Model):
 
 class Correspondence(db.Model):
     __tablename__ = 'correspondences'
+    __table_args__ = (
+        db.Index('ix_correspondences_account_id', 'account_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -43,6 +46,9 @@ class Correspondence(db.Model):
 
 class WorkItem(db.Model):
     __tablename__ = 'work_items'
+    __table_args__ = (
+        db.Index('ix_work_items_assigned_status_due_date', 'assigned_to', 'status', 'due_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -95,6 +101,9 @@ class WorkListItem(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created_at', 'user_id', 'is_read', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -112,8 +121,77 @@ class Notification(db.Model):
     def __repr__(self):
         return f'<Notification {self.id}>'
 
+class BroadcastNotification(db.Model):
+    __tablename__ = 'broadcast_notifications'
+    __table_args__ = (
+        db.Index('ix_broadcast_notifications_audience_created_at', 'audience', 'created_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    audience = db.Column(db.String(20), nullable=False)  # all, admins
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), default='System')  # System, Tax, Reminder, Alert
+    priority = db.Column(db.String(10), default='Normal')  # Low, Normal, High
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    receipts = db.relationship('NotificationReceipt', backref='broadcast', lazy='dynamic')
+    
+    def __repr__(self):
+        return f'<BroadcastNotification {self.id} {self.audience}>'
+
+class NotificationReceipt(db.Model):
+    __tablename__ = 'notification_receipts'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'broadcast_id', name='uq_notification_receipts_user_broadcast'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    broadcast_id = db.Column(db.Integer, db.ForeignKey('broadcast_notifications.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    read_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationReceipt {self.broadcast_id}/{self.user_id}>'
+
+class NotificationCounter(db.Model):
+    __tablename__ = 'notification_counters'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)  # Unread direct notifications and broadcasts
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<NotificationCounter {self.user_id}: {self.unread_count}>'
+
+class NotificationJob(db.Model):
+    __tablename__ = 'notification_jobs'
+    __table_args__ = (
+        db.Index('ix_notification_jobs_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    audience = db.Column(db.String(20), nullable=False, default='admins')  # Recipient set to fan out to
+    title = db.Column(db.String(200), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    notification_type = db.Column(db.String(50), default='System')
+    priority = db.Column(db.String(10), default='Normal')
+    status = db.Column(db.String(20), nullable=False, default='Pending')  # Pending, Completed, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    recipient_count = db.Column(db.Integer)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<NotificationJob {self.id} {self.status}>'
+
 class Case(db.Model):
     __tablename__ = 'cases'
+    __table_args__ = (
+        db.Index('ix_cases_assigned_status_created_at', 'assigned_to', 'status', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -206,4 +284,17 @@ class NonFiscalPayment(db.Model):
     account = db.relationship('Account')
     
     def __repr__(self):
-        return f'<NonFiscalPayment {self.reference_number}>'
\ No newline at end of file
+        return f'<NonFiscalPayment {self.reference_number}>'
+
+class ReferenceRegistry(db.Model):
+    __tablename__ = 'reference_registry'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    reference_number = db.Column(db.String(50), unique=True, nullable=False)
+    prefix = db.Column(db.String(10), nullable=False, index=True)  # TX, PMT, REF, OBJ, AUD, ...
+    entity_type = db.Column(db.String(30), nullable=False)  # Key of reference_service.REFERENCE_ENTITIES
+    entity_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ReferenceRegistry {self.reference_number} -> {self.entity_type}/{self.entity_id}>'
@@ -59,6 +59,9 @@ class Organization(db.Model):
 
 class AccountHolder(db.Model):
     __tablename__ = 'account_holders'
+    __table_args__ = (
+        db.Index('ix_account_holders_account_id', 'account_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -75,6 +78,9 @@ class AccountHolder(db.Model):
 
 class Property(db.Model):
     __tablename__ = 'properties'
+    __table_args__ = (
+        db.Index('ix_properties_account_id', 'account_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -100,6 +106,10 @@ class Property(db.Model):
 
 class Request(db.Model):
     __tablename__ = 'requests'
+    __table_args__ = (
+        db.Index('ix_requests_account_submission_date', 'account_id', 'submission_date'),
+        db.Index('ix_requests_status_submission_date', 'status', 'submission_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     request_type = db.Column(db.String(50), nullable=False)  # Registration, Amendment, Certificate, etc.
@@ -120,10 +130,16 @@ class Request(db.Model):
 
 class Audit(db.Model):
     __tablename__ = 'audits'
+    __table_args__ = (
+        db.Index('ix_audits_account_id', 'account_id'),
+        db.Index('ix_audits_auditor_status', 'auditor_id', 'status'),
+        db.Index('ix_audits_status_start_date', 'status', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
     tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'), nullable=False)
+    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_returns.id'), index=True)  # Return selected for audit
     audit_type = db.Column(db.String(50), nullable=False)  # Desk, Field, Comprehensive
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date)
@@ -138,6 +154,7 @@ class Audit(db.Model):
     # Relationships
     account = db.relationship('Account')
     tax_type = db.relationship('TaxType')
+    tax_return = db.relationship('TaxReturn')
     auditor = db.relationship('User')
     
     def __repr__(self):
@@ -145,6 +162,10 @@ class Audit(db.Model):
 
 class Collection(db.Model):
     __tablename__ = 'collections'
+    __table_args__ = (
+        db.Index('ix_collections_account_id', 'account_id'),
+        db.Index('ix_collections_status_start_date', 'status', 'start_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -225,4 +246,38 @@ class RiskAssessment(db.Model):
     assessor = db.relationship('User')
     
     def __repr__(self):
-        return f'<RiskAssessment {self.id}>'
\ No newline at end of file
+        return f'<RiskAssessment {self.id}>'
+
+class SearchDocument(db.Model):
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.UniqueConstraint('entity_type', 'entity_id', name='uq_search_documents_entity'),
+    )
+    # On PostgreSQL the migration also adds a generated search_vector tsvector column
+    # with a GIN index, and a pg_trgm GIN index on document
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)  # person, organization, property
+    entity_id = db.Column(db.Integer, nullable=False)
+    document = db.Column(db.Text, nullable=False)  # Normalized searchable text
+    ngram_count = db.Column(db.Integer, nullable=False, default=0)  # Distinct trigrams in document
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SearchDocument {self.entity_type} {self.entity_id}>'
+
+class SearchNgram(db.Model):
+    __tablename__ = 'search_ngrams'
+    __table_args__ = (
+        db.Index('ix_search_ngrams_lookup', 'entity_type', 'ngram', 'entity_id'),
+        db.Index('ix_search_ngrams_entity', 'entity_type', 'entity_id'),
+    )
+    # Trigram index maintained in Python for databases without pg_trgm (SQLite)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    ngram = db.Column(db.String(3), nullable=False)
+    
+    def __repr__(self):
+        return f'<SearchNgram {self.entity_type} {self.entity_id} {self.ngram!r}>'
@@ -4,6 +4,9 @@ from app.models.process import Property
 
 class Registration(db.Model):
     __tablename__ = 'registrations'
+    __table_args__ = (
+        db.Index('ix_registrations_account_id', 'account_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     registration_type = db.Column(db.String(50), nullable=False)  # Individual, Non-Individual, Sole Proprietor
@@ -110,6 +113,10 @@ class PropertyRegistration(db.Model):
 
 class TaxpayerLedger(db.Model):
     __tablename__ = 'taxpayer_ledgers'
+    __table_args__ = (
+        db.Index('ix_taxpayer_ledgers_account_tax_type_date', 'account_id', 'tax_type_id', 'transaction_date'),
+        db.Index('ix_taxpayer_ledgers_reference_number', 'reference_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -132,12 +139,36 @@ class TaxpayerLedger(db.Model):
     def __repr__(self):
         return f'<TaxpayerLedger {self.id}>'
 
+class AccountBalance(db.Model):
+    __tablename__ = 'account_balances'
+    __table_args__ = (
+        db.UniqueConstraint('account_id', 'tax_type_id', name='uq_account_balances_account_tax_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
+    tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'), nullable=False)
+    balance = db.Column(db.Numeric(14, 2), nullable=False, default=0)  # Debits minus credits
+    last_ledger_id = db.Column(db.Integer, db.ForeignKey('taxpayer_ledgers.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    account = db.relationship('Account')
+    tax_type = db.relationship('TaxType')
+    
+    def __repr__(self):
+        return f'<AccountBalance {self.account_id}/{self.tax_type_id} {self.balance}>'
+
 class AuditCase(db.Model):
     __tablename__ = 'audit_cases'
+    __table_args__ = (
+        db.Index('ix_audit_cases_audit_id', 'audit_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
     audit_id = db.Column(db.Integer, db.ForeignKey('audits.id'), nullable=False)
+    tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_returns.id'), index=True)
     case_number = db.Column(db.String(50), unique=True, nullable=False)
     status = db.Column(db.String(20), default='Open')  # Open, In Progress, Closed
     open_date = db.Column(db.Date, nullable=False)
@@ -147,6 +178,7 @@ class AuditCase(db.Model):
     # Relationships
     account = db.relationship('Account')
     audit = db.relationship('Audit')
+    tax_return = db.relationship('TaxReturn')
     
     def __repr__(self):
         return f'<AuditCase {self.case_number}>'
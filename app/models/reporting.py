@@ -0,0 +1,48 @@
+from app import db
+from datetime import datetime
+
+class RevenueDailyRollup(db.Model):
+    __tablename__ = 'revenue_daily_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('rollup_date', 'tax_type_id', 'payment_method', name='uq_revenue_daily_rollup_key'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    rollup_date = db.Column(db.Date, nullable=False)
+    tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'), nullable=False)
+    payment_method = db.Column(db.String(20), nullable=False)  # Bank, Cash, Online
+    total_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)  # Completed payments only
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    tax_type = db.relationship('TaxType')
+    
+    def __repr__(self):
+        return f'<RevenueDailyRollup {self.rollup_date} {self.tax_type_id} {self.payment_method}>'
+
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index('ix_report_jobs_status_id', 'status', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # report_type:start_date:end_date:tax_type_id[:parameters hash], shared by identical requests
+    request_key = db.Column(db.String(100), unique=True, nullable=False)
+    report_type = db.Column(db.String(50), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'))
+    status = db.Column(db.String(20), nullable=False, default='Pending')  # Pending, Running, Completed, Failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    parameters = db.Column(db.Text)  # Extra inputs as JSON, e.g. the schedules of a policy simulation
+    result = db.Column(db.Text)  # generate_report output as JSON
+    last_error = db.Column(db.Text)
+    requested_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ReportJob {self.id} {self.request_key} {self.status}>'
@@ -18,8 +18,46 @@ class TaxType(db.Model):
     def __repr__(self):
         return f'<TaxType {self.code}>'
 
+class TaxRateSchedule(db.Model):
+    __tablename__ = 'tax_rate_schedules'
+    __table_args__ = (
+        db.UniqueConstraint('tax_type_id', 'effective_from', name='uq_tax_rate_schedules_tax_type_effective_from'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'), nullable=False)
+    effective_from = db.Column(db.Date, nullable=False)  # In force until the next schedule of the tax type
+    description = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    tax_type = db.relationship('TaxType', backref=db.backref('rate_schedules', lazy='dynamic'))
+    brackets = db.relationship('TaxRateBracket', backref='schedule', cascade='all, delete-orphan',
+                               order_by='TaxRateBracket.lower_bound')
+    
+    def __repr__(self):
+        return f'<TaxRateSchedule {self.tax_type_id} from {self.effective_from}>'
+
+class TaxRateBracket(db.Model):
+    __tablename__ = 'tax_rate_brackets'
+    __table_args__ = (
+        db.UniqueConstraint('schedule_id', 'lower_bound', name='uq_tax_rate_brackets_schedule_lower_bound'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    schedule_id = db.Column(db.Integer, db.ForeignKey('tax_rate_schedules.id'), nullable=False)
+    lower_bound = db.Column(db.Numeric(16, 2), nullable=False)  # Taxable income where the rate starts
+    rate = db.Column(db.Numeric(7, 6), nullable=False)  # Marginal rate, 0.15 for 15%
+    
+    def __repr__(self):
+        return f'<TaxRateBracket {self.lower_bound}: {self.rate}>'
+
 class TaxPeriod(db.Model):
     __tablename__ = 'tax_periods'
+    __table_args__ = (
+        db.Index('ix_tax_periods_tax_type_start_date', 'tax_type_id', 'start_date'),
+        db.Index('ix_tax_periods_due_date', 'due_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tax_type_id = db.Column(db.Integer, db.ForeignKey('tax_types.id'), nullable=False)
@@ -38,6 +76,9 @@ class TaxPeriod(db.Model):
 
 class TaxObligation(db.Model):
     __tablename__ = 'tax_obligations'
+    __table_args__ = (
+        db.Index('ix_tax_obligations_account_tax_type', 'account_id', 'tax_type_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -52,6 +93,12 @@ class TaxObligation(db.Model):
 
 class TaxReturn(db.Model):
     __tablename__ = 'tax_returns'
+    __table_args__ = (
+        db.Index('ix_tax_returns_account_status_created_at', 'account_id', 'status', 'created_at'),
+        db.Index('ix_tax_returns_tax_type_status', 'tax_type_id', 'status'),
+        db.Index('ix_tax_returns_tax_period_id', 'tax_period_id'),
+        db.Index('ix_tax_returns_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -63,7 +110,7 @@ class TaxReturn(db.Model):
     assessment_date = db.Column(db.DateTime)
     assessment_type = db.Column(db.String(20))  # Self, Official, Estimated
     reference_number = db.Column(db.String(20), unique=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     # --- Flagging fields ---
     is_flagged = db.Column(db.Boolean, default=False, nullable=False)
@@ -79,6 +126,11 @@ class TaxReturn(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_tax_return_status', 'tax_return_id', 'status'),
+        db.Index('ix_payments_payment_date', 'payment_date'),
+        db.Index('ix_payments_collection_id', 'collection_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_returns.id'), nullable=False)
@@ -88,6 +140,7 @@ class Payment(db.Model):
     payment_method = db.Column(db.String(20), nullable=False)  # Bank, Cash, Online
     reference_number = db.Column(db.String(50), unique=True)
     status = db.Column(db.String(20), default='Pending')  # Pending, Completed, Failed, Refunded
+    idempotency_key = db.Column(db.String(64), unique=True)  # Client key; a retried submission returns this payment
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
@@ -95,6 +148,10 @@ class Payment(db.Model):
 
 class Refund(db.Model):
     __tablename__ = 'refunds'
+    __table_args__ = (
+        db.Index('ix_refunds_account_request_date', 'account_id', 'request_date'),
+        db.Index('ix_refunds_status_request_date', 'status', 'request_date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_id = db.Column(db.Integer, db.ForeignKey('accounts.id'), nullable=False)
@@ -111,6 +168,9 @@ class Refund(db.Model):
 
 class Objection(db.Model):
     __tablename__ = 'objections'
+    __table_args__ = (
+        db.Index('ix_objections_tax_return_status', 'tax_return_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     tax_return_id = db.Column(db.Integer, db.ForeignKey('tax_returns.id'), nullable=False)
@@ -122,4 +182,50 @@ class Objection(db.Model):
     reference_number = db.Column(db.String(50), unique=True)
     
     def __repr__(self):
-        return f'<Objection {self.reference_number}>'
\ No newline at end of file
+        return f'<Objection {self.reference_number}>'
+
+class BankImport(db.Model):
+    __tablename__ = 'bank_imports'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    file_format = db.Column(db.String(20), nullable=False)  # csv, fixed
+    checksum = db.Column(db.String(64), unique=True, nullable=False)  # SHA-256 of the file, so it imports once
+    status = db.Column(db.String(20), nullable=False, default='Running')  # Running, Completed, Failed
+    total_lines = db.Column(db.Integer, nullable=False, default=0)
+    matched_lines = db.Column(db.Integer, nullable=False, default=0)
+    suspense_lines = db.Column(db.Integer, nullable=False, default=0)
+    matched_amount = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    imported_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    
+    # Relationships
+    suspense_payments = db.relationship('SuspensePayment', backref='bank_import', lazy='dynamic')
+    
+    def __repr__(self):
+        return f'<BankImport {self.filename} {self.status}>'
+
+class SuspensePayment(db.Model):
+    __tablename__ = 'suspense_payments'
+    __table_args__ = (
+        db.Index('ix_suspense_payments_status_created_at', 'status', 'created_at'),
+        db.Index('ix_suspense_payments_bank_import_id', 'bank_import_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    bank_import_id = db.Column(db.Integer, db.ForeignKey('bank_imports.id'), nullable=False)
+    line_number = db.Column(db.Integer, nullable=False)
+    bank_reference = db.Column(db.String(50))
+    payment_reference = db.Column(db.String(50))  # Reference quoted by the payer, expected to be a return's
+    amount = db.Column(db.Numeric(14, 2))
+    value_date = db.Column(db.Date)
+    payer_name = db.Column(db.String(120))
+    reason = db.Column(db.String(200), nullable=False)  # Why the line could not be posted
+    raw_line = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False, default='Unresolved')  # Unresolved, Resolved
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SuspensePayment {self.bank_import_id}:{self.line_number}>'
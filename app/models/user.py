@@ -72,6 +72,9 @@ class User(UserMixin, db.Model):
 
 class Account(db.Model):
     __tablename__ = 'accounts'
+    __table_args__ = (
+        db.Index('ix_accounts_user_id', 'user_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     account_number = db.Column(db.String(20), unique=True, nullable=False)
@@ -2,27 +2,38 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User, Account
-from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund
+from app.models.tax import TaxPeriod, TaxReturn, Payment, Refund
 from app.models.process import Person, Organization, Property, Request, Audit, Collection
 from app.models.functionality import Notification, Case, WorkItem, WorkList
-from app.services.auth_service import get_user_permissions
-from datetime import datetime, timedelta
-import calendar
+from app.services.auth_service import get_user_permissions, get_user_account_ids
+from app.services.notification_service import notification_feed_query, get_unread_count, mark_broadcast_read, mark_all_read
+from app.services.reporting_service import get_total_revenue
+from app.services.dashboard_service import dashboard_metrics
+from datetime import datetime
 import json
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
 
+@dashboard_bp.app_context_processor
+def inject_unread_notifications_count():
+    # Evaluated lazily so only pages that render the navbar badge pay for the lookup
+    def unread_notifications_count():
+        if not current_user.is_authenticated:
+            return 0
+        return get_unread_count(current_user)
+    return {'unread_notifications_count': unread_notifications_count}
+
 @dashboard_bp.route('/')
 @login_required
 def index():
     # Get user permissions
     permissions = get_user_permissions(current_user)
     
-    # Get notifications for the user (limited to 2 for dashboard)
-    notifications = Notification.query.filter_by(user_id=current_user.id, is_read=False).order_by(Notification.created_at.desc()).limit(2).all()
+    # Get unread direct and broadcast notifications for the user (limited to 2 for dashboard)
+    notifications = notification_feed_query(current_user, unread_only=True).limit(2).all()
     
     # Get total count of unread notifications for the badge
-    notifications_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
+    notifications_count = get_unread_count(current_user)
     
     # Get assigned work items
     work_items = WorkItem.query.filter_by(assigned_to=current_user.id, status='Pending').order_by(WorkItem.due_date.asc()).limit(5).all()
@@ -39,15 +50,14 @@ def index():
         stats['active_accounts'] = Account.query.filter_by(is_active=True).count()
         stats['total_returns'] = TaxReturn.query.filter(TaxReturn.status != 'Not Filed').count()
         stats['pending_returns'] = TaxReturn.query.filter_by(status='Not Filed').count()
-        # Calculate sum of payment amounts instead of count
-        stats['total_payments'] = db.session.query(db.func.sum(Payment.amount)).filter_by(status='Completed').scalar() or 0
+        # Sum of completed payment amounts, read from the daily revenue rollup
+        stats['total_payments'] = get_total_revenue()
         stats['total_refunds'] = Refund.query.filter_by(status='Pending').count()
         stats['total_audits'] = Audit.query.count()
         stats['total_collections'] = Collection.query.count()
     else:
         # For regular users
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         
         stats['total_accounts'] = len(account_ids)
         stats['active_accounts'] = Account.query.filter(Account.id.in_(account_ids), Account.is_active==True).count()
@@ -70,8 +80,7 @@ def index():
         recent_payments = Payment.query.order_by(Payment.payment_date.desc()).limit(5).all()
     else:
         # For regular users, show only their activities
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         
         recent_returns = TaxReturn.query.filter(TaxReturn.account_id.in_(account_ids), 
                                             TaxReturn.status != 'Not Filed').order_by(TaxReturn.filing_date.desc()).limit(5).all()
@@ -124,69 +133,13 @@ def analytics():
         flash('You do not have permission to access analytics', 'danger')
         return redirect(url_for('dashboard.index'))
     
-    # Get date range for analytics
-    end_date = datetime.utcnow().date()
-    start_date = end_date - timedelta(days=365)  # Last year
-    
-    # Tax collection by type
-    tax_types = TaxType.query.all()
-    tax_collection_data = []
-    
-    for tax_type in tax_types:
-        total_amount = db.session.query(db.func.sum(Payment.amount)).join(TaxReturn).filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            Payment.payment_date.between(start_date, end_date)
-        ).scalar() or 0
-        
-        tax_collection_data.append({
-            'name': tax_type.name,
-            'amount': float(total_amount),
-            'is_core': tax_type.is_core
-        })
-    
-    # Monthly collection trend
-    monthly_trend = []
-    for i in range(12):
-        month_date = end_date - timedelta(days=30 * i)
-        month_start = datetime(month_date.year, month_date.month, 1).date()
-        month_end = datetime(month_date.year, month_date.month, calendar.monthrange(month_date.year, month_date.month)[1]).date()
-        
-        total_amount = db.session.query(db.func.sum(Payment.amount)).filter(
-            Payment.payment_date.between(month_start, month_end)
-        ).scalar() or 0
-        
-        monthly_trend.append({
-            'month': month_start.strftime('%b %Y'),
-            'amount': float(total_amount)
-        })
-    
-    monthly_trend.reverse()  # Show oldest to newest
-    
-    # Return filing compliance
-    compliance_data = []
-    for tax_type in tax_types:
-        total_returns = TaxReturn.query.filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            TaxReturn.due_amount > 0
-        ).count()
-        
-        filed_returns = TaxReturn.query.filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']),
-            TaxReturn.due_amount > 0
-        ).count()
-        
-        compliance_rate = (filed_returns / total_returns * 100) if total_returns > 0 else 0
-        
-        compliance_data.append({
-            'name': tax_type.name,
-            'compliance_rate': round(compliance_rate, 2)
-        })
+    # Revenue by tax type, monthly trend and compliance over the last year (cached)
+    metrics = dashboard_metrics.get()
     
     return render_template('dashboard/analytics.html',
-                           tax_collection_data=json.dumps(tax_collection_data),
-                           monthly_trend=json.dumps(monthly_trend),
-                           compliance_data=json.dumps(compliance_data))
+                           tax_collection_data=json.dumps(metrics['tax_collection_data']),
+                           monthly_trend=json.dumps(metrics['monthly_trend']),
+                           compliance_data=json.dumps(metrics['compliance_data']))
 
 @dashboard_bp.route('/notifications')
 @login_required
@@ -194,10 +147,8 @@ def notifications():
     page = request.args.get('page', 1, type=int)
     per_page = 5  # Changed from 20 to 5 for pagination in groups of 5
     
-    notifications = Notification.query.filter_by(user_id=current_user.id).order_by(
-        Notification.is_read.asc(),
-        Notification.created_at.desc()
-    ).paginate(page=page, per_page=per_page)
+    # Direct and broadcast notifications, unread first
+    notifications = notification_feed_query(current_user).paginate(page=page, per_page=per_page)
     
     return render_template('dashboard/notifications.html', notifications=notifications)
 
@@ -215,24 +166,21 @@ def mark_notification_read(notification_id):
     
     return jsonify({'success': True})
 
+@dashboard_bp.route('/notifications/broadcast/mark-read/<int:broadcast_id>', methods=['POST'])
+@login_required
+def mark_broadcast_notification_read(broadcast_id):
+    if not mark_broadcast_read(current_user, broadcast_id):
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    
+    db.session.commit()
+    
+    return jsonify({'success': True})
+
 @dashboard_bp.route('/notifications/mark-all-read', methods=['POST'])
 @login_required
 def mark_all_notifications_read():
-    # Find all unread notifications for the current user
-    unread_count = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).count()
-    
-    # Mark all as read
-    now = datetime.utcnow()
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).update({
-        'is_read': True,
-        'read_at': now
-    })
+    # Mark direct notifications read and record receipts for unread broadcasts
+    unread_count = mark_all_read(current_user)
     
     db.session.commit()
     
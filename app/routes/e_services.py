@@ -5,7 +5,10 @@ from app.models.user import User, Account
 from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund
 from app.models.process import Request
 from app.models.functionality import Document
-from app.services.auth_service import get_user_permissions
+from app.services.auth_service import get_user_permissions, get_user_account_ids
+from app.services.tax_service import return_balances_query
+from app.services.reference_service import resolve_reference, normalize_reference, is_valid_reference
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 import uuid
 import os
@@ -68,8 +71,7 @@ def view_account(account_id):
     
     # Check if user has permission to view this account
     if not 'view_all_accounts' in permissions:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if account_id not in account_ids:
             flash('You do not have permission to view this account', 'danger')
             return redirect(url_for('e_services.account_management'))
@@ -183,38 +185,42 @@ def returns_filing():
 def tax_payments():
     # Get user permissions
     permissions = get_user_permissions(current_user)
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
     
-    # Get accounts accessible to the user
+    # Restrict to the user's own accounts unless they can see all accounts
     if 'view_all_accounts' in permissions:
-        accounts = Account.query.all()
+        accounts = []
+        account_ids = None
     else:
         accounts = Account.query.filter_by(user_id=current_user.id).all()
+        account_ids = [account.id for account in accounts]
     
-    # Get pending tax returns (not fully paid)
-    pending_returns = []
+    # Get pending tax returns (not fully paid), with balances computed in one grouped query
+    query = return_balances_query(account_ids, outstanding_only=True).filter(
+        TaxReturn.status != 'Finalized'
+    ).options(
+        joinedload(TaxReturn.tax_type), joinedload(TaxReturn.period), joinedload(TaxReturn.account)
+    )
+    pagination = query.order_by(TaxReturn.id.desc()).paginate(page=page, per_page=per_page)
     
-    for account in accounts:
-        returns = TaxReturn.query.filter_by(account_id=account.id).filter(TaxReturn.status != 'Finalized').all()
-        for tax_return in returns:
-            # Calculate remaining balance
-            total_paid = db.session.query(db.func.sum(Payment.amount)).filter_by(tax_return_id=tax_return.id).scalar() or 0
-            remaining = tax_return.due_amount - total_paid
-            
-            if remaining > 0:
-                pending_returns.append({
-                    'id': tax_return.id,
-                    'reference': tax_return.reference_number,
-                    'tax_type': tax_return.tax_type.name,
-                    'due_date': tax_return.period.due_date,
-                    'total_amount': tax_return.due_amount,
-                    'paid_amount': total_paid,
-                    'remaining': remaining,
-                    'account': account.name
-                })
+    pending_returns = []
+    for tax_return, paid_amount, remaining, has_pending_objection in pagination.items:
+        pending_returns.append({
+            'id': tax_return.id,
+            'reference': tax_return.reference_number,
+            'tax_type': tax_return.tax_type.name,
+            'due_date': tax_return.period.due_date,
+            'total_amount': remaining + paid_amount,
+            'paid_amount': paid_amount,
+            'remaining': remaining,
+            'account': tax_return.account.name
+        })
     
     return render_template('e_services/tax_payments.html', 
                            accounts=accounts, 
                            pending_returns=pending_returns, 
+                           pagination=pagination, 
                            permissions=permissions)
 
 @e_services_bp.route('/filing-objections')
@@ -222,36 +228,40 @@ def tax_payments():
 def filing_objections():
     # Get user permissions
     permissions = get_user_permissions(current_user)
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
     
-    # Get accounts accessible to the user
+    # Restrict to the user's own accounts unless they can see all accounts
     if 'view_all_accounts' in permissions:
-        accounts = Account.query.all()
+        accounts = []
+        account_ids = None
     else:
         accounts = Account.query.filter_by(user_id=current_user.id).all()
+        account_ids = [account.id for account in accounts]
     
-    # Get eligible tax returns for objections
-    eligible_returns = []
+    # Get eligible tax returns for objections (no pending objection)
+    query = return_balances_query(account_ids, exclude_pending_objections=True).filter(
+        TaxReturn.status.in_(['Filed', 'Assessed'])
+    ).options(
+        joinedload(TaxReturn.tax_type), joinedload(TaxReturn.account)
+    )
+    pagination = query.order_by(TaxReturn.id.desc()).paginate(page=page, per_page=per_page)
     
-    for account in accounts:
-        returns = TaxReturn.query.filter_by(account_id=account.id).filter(TaxReturn.status.in_(['Filed', 'Assessed'])).all()
-        for tax_return in returns:
-            # Check if there's no pending objection
-            from app.models.tax import Objection
-            pending_objection = Objection.query.filter_by(tax_return_id=tax_return.id).filter(Objection.status.in_(['Pending', 'In Progress'])).first()
-            
-            if not pending_objection:
-                eligible_returns.append({
-                    'id': tax_return.id,
-                    'reference': tax_return.reference_number,
-                    'tax_type': tax_return.tax_type.name,
-                    'filing_date': tax_return.filing_date,
-                    'amount': tax_return.due_amount,
-                    'account': account.name
-                })
+    eligible_returns = []
+    for tax_return, paid_amount, remaining, has_pending_objection in pagination.items:
+        eligible_returns.append({
+            'id': tax_return.id,
+            'reference': tax_return.reference_number,
+            'tax_type': tax_return.tax_type.name,
+            'filing_date': tax_return.filing_date,
+            'amount': tax_return.due_amount,
+            'account': tax_return.account.name
+        })
     
     return render_template('e_services/filing_objections.html', 
                            accounts=accounts, 
                            eligible_returns=eligible_returns, 
+                           pagination=pagination, 
                            permissions=permissions)
 
 @e_services_bp.route('/request-refunds')
@@ -286,6 +296,69 @@ def request_refunds():
                            refund_history=refund_history, 
                            permissions=permissions)
 
+# Records only staff may look up; taxpayers track their own filings, payments,
+# refunds, objections, requests, agreements and correspondence
+STAFF_TRACKING_TYPES = {'audit', 'collection', 'enforcement', 'case'}
+
+def _tracked_account_id(entity):
+    """The account a record found by reference belongs to"""
+    if getattr(entity, 'account_id', None) is not None:
+        return entity.account_id
+    if getattr(entity, 'tax_return', None) is not None:
+        return entity.tax_return.account_id
+    if getattr(entity, 'collection', None) is not None:
+        return entity.collection.account_id
+    return None
+
+def _can_track(entity_type, entity, permissions):
+    if 'view_all_accounts' in permissions:
+        return True
+    if entity_type in STAFF_TRACKING_TYPES:
+        return False
+    return _tracked_account_id(entity) in get_user_account_ids(current_user)
+
+def _tracking_result(entity_type, entity):
+    """Summarize a record found by reference number for the tracking page"""
+    if entity_type == 'tax_return':
+        return {'type': 'Tax Return', 'status': entity.status, 'date': entity.filing_date,
+                'details': f'{entity.tax_type.name} for period {entity.period.period_code}',
+                'amount': entity.due_amount}
+    if entity_type == 'payment':
+        return {'type': 'Payment', 'status': entity.status, 'date': entity.payment_date,
+                'details': f'Payment for {entity.tax_return.reference_number}', 'amount': entity.amount}
+    if entity_type == 'refund':
+        return {'type': 'Refund', 'status': entity.status, 'date': entity.request_date,
+                'details': f'Refund for account {entity.account.account_number}', 'amount': entity.amount}
+    if entity_type == 'objection':
+        return {'type': 'Objection', 'status': entity.status, 'date': entity.filing_date,
+                'details': f'Objection to {entity.tax_return.reference_number}', 'amount': None}
+    if entity_type == 'request':
+        return {'type': 'Request', 'status': entity.status, 'date': entity.submission_date,
+                'details': f'{entity.request_type} for account {entity.account.account_number}', 'amount': None}
+    if entity_type == 'audit':
+        return {'type': 'Audit', 'status': entity.status, 'date': entity.start_date,
+                'details': f'{entity.audit_type} audit of {entity.tax_type.name}',
+                'amount': entity.additional_assessment}
+    if entity_type == 'collection':
+        return {'type': 'Collection', 'status': entity.status, 'date': entity.start_date,
+                'details': f'{entity.collection_type} collection for account {entity.account.account_number}',
+                'amount': entity.amount_due}
+    if entity_type == 'enforcement':
+        return {'type': 'Enforcement', 'status': entity.status, 'date': entity.start_date,
+                'details': f'{entity.enforcement_type} for collection {entity.collection.reference_number}',
+                'amount': None}
+    if entity_type == 'agreement':
+        return {'type': 'Agreement', 'status': entity.status, 'date': entity.start_date,
+                'details': f'{entity.agreement_type} for account {entity.account.account_number}', 'amount': None}
+    if entity_type == 'case':
+        return {'type': 'Case', 'status': entity.status, 'date': entity.created_at,
+                'details': entity.title, 'amount': None}
+    if entity_type == 'correspondence':
+        return {'type': 'Correspondence', 'status': entity.status, 'date': entity.sent_date,
+                'details': entity.subject, 'amount': None}
+    return {'type': entity_type.replace('_', ' ').title(), 'status': getattr(entity, 'status', None),
+            'date': None, 'details': '', 'amount': None}
+
 @e_services_bp.route('/tracking')
 @login_required
 def tracking():
@@ -297,56 +370,17 @@ def tracking():
     result = None
     
     if reference:
-        # Check tax returns
-        tax_return = TaxReturn.query.filter_by(reference_number=reference).first()
-        if tax_return:
-            result = {
-                'type': 'Tax Return',
-                'reference': tax_return.reference_number,
-                'status': tax_return.status,
-                'date': tax_return.filing_date,
-                'details': f'{tax_return.tax_type.name} for period {tax_return.period.period_code}',
-                'amount': tax_return.due_amount
-            }
-        
-        # Check payments
-        if not result:
-            payment = Payment.query.filter_by(reference_number=reference).first()
-            if payment:
-                result = {
-                    'type': 'Payment',
-                    'reference': payment.reference_number,
-                    'status': payment.status,
-                    'date': payment.payment_date,
-                    'details': f'Payment for {payment.tax_return.reference_number}',
-                    'amount': payment.amount
-                }
-        
-        # Check refunds
-        if not result:
-            refund = Refund.query.filter_by(reference_number=reference).first()
-            if refund:
-                result = {
-                    'type': 'Refund',
-                    'reference': refund.reference_number,
-                    'status': refund.status,
-                    'date': refund.request_date,
-                    'details': f'Refund for account {refund.account.account_number}',
-                    'amount': refund.amount
-                }
-        
-        # Check requests
-        if not result:
-            request_obj = Request.query.filter_by(reference_number=reference).first()
-            if request_obj:
-                result = {
-                    'type': 'Request',
-                    'reference': request_obj.reference_number,
-                    'status': request_obj.status,
-                    'date': request_obj.submission_date,
-                    'details': f'{request_obj.request_type} for account {request_obj.account.account_number}',
-                    'amount': None
-                }
+        # Mistyped generated references fail their check character before any lookup
+        if not is_valid_reference(normalize_reference(reference)):
+            flash('That reference number is not valid. Please check it and try again.', 'warning')
+            entity = None
+        else:
+            # One registry lookup finds the record behind any reference number
+            entity_type, entity = resolve_reference(reference)
+        # Other taxpayers' records are reported as not found, like unknown references
+        if entity is not None and _can_track(entity_type, entity, permissions):
+            result = _tracking_result(entity_type, entity)
+            result['reference'] = entity.reference_number
     
     return render_template('e_services/tracking.html', 
                            reference=reference, 
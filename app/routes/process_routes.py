@@ -5,9 +5,11 @@ from app.models.user import User, Account
 from app.models.process import Person, Organization, Property, Request, Audit, Collection, Enforcement, Agreement
 from app.models.tax import TaxReturn
 from app.models.functionality import Notification
-from app.services.auth_service import get_user_permissions
+from app.services.db_helpers import keyset_paginate_request
+from app.services.search_service import search_page_request
+from app.services.auth_service import get_user_permissions, get_user_account_ids
+from app.services.reference_service import generate_reference
 from datetime import datetime
-import uuid
 
 process_bp = Blueprint('process', __name__, url_prefix='/process')
 
@@ -30,21 +32,16 @@ def persons():
         flash('You do not have permission to view persons', 'danger')
         return redirect(url_for('process.index'))
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     search = request.args.get('search', '')
     
     query = Person.query
     
+    # Ranked search over the person search index, otherwise list by last name
     if search:
-        query = query.filter(
-            Person.first_name.ilike(f'%{search}%') |
-            Person.last_name.ilike(f'%{search}%') |
-            Person.national_id.ilike(f'%{search}%') |
-            Person.passport_number.ilike(f'%{search}%')
-        )
-    
-    persons = query.order_by(Person.last_name).paginate(page=page, per_page=per_page)
+        persons = search_page_request(query, 'person', search, per_page=per_page)
+    else:
+        persons = keyset_paginate_request(query, [Person.last_name], per_page=per_page)
     
     return render_template('processes/persons.html', 
                            persons=persons, 
@@ -83,20 +80,16 @@ def organizations():
         flash('You do not have permission to view organizations', 'danger')
         return redirect(url_for('process.index'))
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     search = request.args.get('search', '')
     
     query = Organization.query
     
+    # Ranked search over the organization search index, otherwise list by name
     if search:
-        query = query.filter(
-            Organization.name.ilike(f'%{search}%') |
-            Organization.registration_number.ilike(f'%{search}%') |
-            Organization.tax_identifier.ilike(f'%{search}%')
-        )
-    
-    organizations = query.order_by(Organization.name).paginate(page=page, per_page=per_page)
+        organizations = search_page_request(query, 'organization', search, per_page=per_page)
+    else:
+        organizations = keyset_paginate_request(query, [Organization.name], per_page=per_page)
     
     return render_template('processes/organizations.html', 
                            organizations=organizations, 
@@ -135,24 +128,20 @@ def properties():
         flash('You do not have permission to view properties', 'danger')
         return redirect(url_for('process.index'))
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     search = request.args.get('search', '')
     property_type = request.args.get('type', '')
     
     query = Property.query
     
-    if search:
-        query = query.filter(
-            Property.property_identifier.ilike(f'%{search}%') |
-            Property.description.ilike(f'%{search}%') |
-            Property.address.ilike(f'%{search}%')
-        )
-    
     if property_type:
         query = query.filter(Property.property_type == property_type)
     
-    properties = query.order_by(Property.property_identifier).paginate(page=page, per_page=per_page)
+    # Ranked search over the property search index, otherwise list by identifier
+    if search:
+        properties = search_page_request(query, 'property', search, per_page=per_page)
+    else:
+        properties = keyset_paginate_request(query, [Property.property_identifier], per_page=per_page)
     
     # Get property types for filter
     property_types = db.session.query(Property.property_type).distinct().all()
@@ -202,8 +191,7 @@ def requests():
     
     # Filter by user's accounts if not admin/internal
     if not any(perm in permissions for perm in ['view_all_accounts', 'admin_access']):
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = query.filter(Request.account_id.in_(account_ids))
     
     if status:
@@ -237,8 +225,7 @@ def view_request(request_id):
     
     # Check if user has permission to view this request
     if not any(perm in permissions for perm in ['view_all_accounts', 'admin_access']):
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if request_obj.account_id not in account_ids:
             flash('You do not have permission to view this request', 'danger')
             return redirect(url_for('process.requests'))
@@ -402,10 +389,9 @@ def create_audit_case(audit_id):
     # Import necessary models
     from app.models.registration import AuditCase
     from datetime import date
-    import uuid
     
     # Generate a unique case number
-    case_number = f'AC-{uuid.uuid4().hex[:8].upper()}'
+    case_number = generate_reference('AC')
     
     # Create a description that includes the tax period since we don't have separate fields
     case_description = f"Tax Period: {tax_period}\n\nDescription: {description}"
@@ -447,7 +433,6 @@ def collections():
         flash('You do not have permission to view collections', 'danger')
         return redirect(url_for('process.index'))
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     status = request.args.get('status', '')
     collection_type = request.args.get('type', '')
@@ -460,7 +445,7 @@ def collections():
     if collection_type:
         query = query.filter(Collection.collection_type == collection_type)
     
-    collections = query.order_by(Collection.start_date.desc()).paginate(page=page, per_page=per_page)
+    collections = keyset_paginate_request(query, [Collection.start_date.desc()], per_page=per_page)
     
     # Get statuses and types for filters
     statuses = ['Pending', 'Partial', 'Complete', 'Written Off']
@@ -510,7 +495,6 @@ def enforcements():
         flash('You do not have permission to view enforcements', 'danger')
         return redirect(url_for('process.index'))
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     status = request.args.get('status', '')
     enforcement_type = request.args.get('type', '')
@@ -523,7 +507,7 @@ def enforcements():
     if enforcement_type:
         query = query.filter(Enforcement.enforcement_type == enforcement_type)
     
-    enforcements = query.order_by(Enforcement.start_date.desc()).paginate(page=page, per_page=per_page)
+    enforcements = keyset_paginate_request(query, [Enforcement.start_date.desc()], per_page=per_page)
     
     # Get statuses and types for filters
     statuses = ['Initiated', 'In Progress', 'Completed', 'Cancelled']
@@ -543,7 +527,6 @@ def agreements():
     # Get user permissions
     permissions = get_user_permissions(current_user)
     
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     status = request.args.get('status', '')
     agreement_type = request.args.get('type', '')
@@ -552,8 +535,7 @@ def agreements():
     
     # Filter by user's accounts if not admin/internal
     if not any(perm in permissions for perm in ['view_all_accounts', 'admin_access']):
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = query.filter(Agreement.account_id.in_(account_ids))
     
     if status:
@@ -562,7 +544,7 @@ def agreements():
     if agreement_type:
         query = query.filter(Agreement.agreement_type == agreement_type)
     
-    agreements = query.order_by(Agreement.start_date.desc()).paginate(page=page, per_page=per_page)
+    agreements = keyset_paginate_request(query, [Agreement.start_date.desc()], per_page=per_page)
     
     # Get statuses and types for filters
     statuses = ['Active', 'Completed', 'Breached', 'Cancelled']
@@ -586,8 +568,7 @@ def view_agreement(agreement_id):
     
     # Check if user has permission to view this agreement
     if not any(perm in permissions for perm in ['view_all_accounts', 'admin_access']):
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if agreement.account_id not in account_ids:
             flash('You do not have permission to view this agreement', 'danger')
             return redirect(url_for('process.agreements'))
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, abort
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User, Account, UserType
@@ -330,9 +330,13 @@ def taxpayer_ledger():
     from app.models.tax import TaxType
     tax_types = TaxType.query.all()
     
-    # Get ledger entries if account is selected
+    # Get ledger entries and the current balance if account is selected
     ledger_entries = []
+    current_balance = None
     if account_id:
+        from app.services.ledger_service import get_balance
+        current_balance = get_balance(account_id, tax_type_id)
+        
         from app.models.registration import TaxpayerLedger
         query = TaxpayerLedger.query.filter_by(account_id=account_id)
         
@@ -350,12 +354,50 @@ def taxpayer_ledger():
                            accounts=accounts, 
                            tax_types=tax_types, 
                            ledger_entries=ledger_entries, 
+                           current_balance=current_balance, 
                            selected_account_id=account_id, 
                            selected_tax_type_id=tax_type_id, 
                            start_date=start_date.strftime('%Y-%m-%d') if start_date else '', 
                            end_date=end_date.strftime('%Y-%m-%d') if end_date else '', 
                            permissions=permissions)
 
+@registration_bp.route('/taxpayer-ledger/export')
+@login_required
+def export_taxpayer_ledger():
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to view taxpayer ledger
+    if not any(perm in permissions for perm in ['view_all_accounts', 'admin_access', 'manage_tax_accounts']):
+        flash('You do not have permission to view taxpayer ledger', 'danger')
+        return redirect(url_for('registration.index'))
+    
+    from app.services.export_service import EXPORT_FORMATS, ledger_export_rows, stream_export
+    
+    account_id = request.args.get('account_id', type=int)
+    tax_type_id = request.args.get('tax_type_id', type=int)
+    export_format = request.args.get('format', 'csv')
+    if not account_id or export_format not in EXPORT_FORMATS:
+        abort(400)
+    
+    # Same date range as the ledger view, defaulting to the last 30 days
+    try:
+        start_date = datetime.strptime(request.args.get('start_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date = datetime.utcnow().date() - timedelta(days=30)
+    try:
+        end_date = datetime.strptime(request.args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end_date = datetime.utcnow().date()
+    
+    header, rows = ledger_export_rows(account_id, start_date, end_date, tax_type_id)
+    filename = f'ledger_{account_id}_{end_date:%Y%m%d}.{export_format}'
+    return Response(
+        stream_with_context(stream_export(export_format, header, rows, sheet_name='Ledger')),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @registration_bp.route('/audit-collection')
 @login_required
 def audit_collection():
@@ -1,14 +1,20 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, abort, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User, Account
-from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund
+from app.models.tax import TaxType, TaxPeriod, Refund
 from app.models.process import Collection
 from app.models.registration import TaxpayerLedger
 from app.services.auth_service import get_user_permissions
-from app.services.reporting_service import generate_report
+from app.services.reporting_service import generate_report, REPORT_TYPES
+from app.services.report_job_service import submit_report_job, report_job_result, POLICY_SIMULATION
+from app.services.simulation_service import SIMULATION_SEGMENTS, parse_brackets, format_brackets, submit_simulation_job
+from app.services.rate_service import schedule_for
+from app.services.db_helpers import keyset_paginate_request
+from app.models.reporting import ReportJob
+from app.services.dashboard_service import dashboard_metrics
+from app.services.export_service import EXPORT_FORMATS, report_export_rows, stream_export
 from datetime import datetime, timedelta
-import calendar
 import json
 
 reporting_bp = Blueprint('reporting', __name__, url_prefix='/reporting')
@@ -75,21 +81,10 @@ def reports():
                            available_reports=available_reports, 
                            permissions=permissions)
 
-@reporting_bp.route('/generate-report')
-@login_required
-def generate_report_view():
-    # Get user permissions
-    permissions = get_user_permissions(current_user)
-    
-    # Check if user has permission to view reports
-    if not any(perm in permissions for perm in ['view_reports', 'view_statistics', 'admin_access']):
-        flash('You do not have permission to generate reports', 'danger')
-        return redirect(url_for('reporting.index'))
-    
-    report_type = request.args.get('type', '')
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    tax_type_id = request.args.get('tax_type_id', type=int)
+def _report_date_range():
+    """Read start_date/end_date from the request, defaulting to the last 30 days"""
+    start_date = request.values.get('start_date')
+    end_date = request.values.get('end_date')
     
     # Convert string dates to datetime objects if provided
     if start_date:
@@ -111,12 +106,34 @@ def generate_report_view():
     if not end_date:
         end_date = datetime.utcnow().date()
     
+    return start_date, end_date
+
+@reporting_bp.route('/generate-report')
+@login_required
+def generate_report_view():
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to view reports
+    if not any(perm in permissions for perm in ['view_reports', 'view_statistics', 'admin_access']):
+        flash('You do not have permission to generate reports', 'danger')
+        return redirect(url_for('reporting.index'))
+    
+    report_type = request.args.get('type', '')
+    tax_type_id = request.args.get('tax_type_id', type=int)
+    start_date, end_date = _report_date_range()
+    
     # Get tax types for filter
     tax_types = TaxType.query.all()
     
-    # Generate report if type is specified
+    # Generate report if type is specified; wide date ranges are handed to the report worker
     report_data = None
-    if report_type:
+    report_job = None
+    if report_type in REPORT_TYPES and (end_date - start_date).days > current_app.config['REPORT_SYNC_MAX_DAYS']:
+        report_job = submit_report_job(report_type, start_date, end_date, tax_type_id, user=current_user)
+        db.session.commit()
+        report_data = report_job_result(report_job)
+    elif report_type:
         report_data = generate_report(report_type, start_date, end_date, tax_type_id)
     
     return render_template('reporting/generate_report.html', 
@@ -126,8 +143,174 @@ def generate_report_view():
                            tax_types=tax_types, 
                            selected_tax_type_id=tax_type_id, 
                            report_data=report_data, 
+                           report_job=report_job, 
                            permissions=permissions)
 
+@reporting_bp.route('/report-jobs', methods=['POST'])
+@login_required
+def submit_report():
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to view reports
+    if not any(perm in permissions for perm in ['view_reports', 'view_statistics', 'admin_access']):
+        return jsonify({'success': False, 'message': 'You do not have permission to generate reports'}), 403
+    
+    report_type = request.values.get('type', '')
+    if report_type not in REPORT_TYPES:
+        return jsonify({'success': False, 'message': 'Unknown report type'}), 400
+    
+    start_date, end_date = _report_date_range()
+    job = submit_report_job(report_type, start_date, end_date, request.values.get('tax_type_id', type=int),
+                            user=current_user)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('reporting.report_job_status', job_id=job.id)
+    }), 202
+
+@reporting_bp.route('/report-jobs/<int:job_id>')
+@login_required
+def report_job_status(job_id):
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to view reports
+    if not any(perm in permissions for perm in ['view_reports', 'view_statistics', 'admin_access']):
+        return jsonify({'success': False, 'message': 'You do not have permission to view reports'}), 403
+    
+    job = ReportJob.query.get_or_404(job_id)
+    
+    response = {
+        'success': True,
+        'job_id': job.id,
+        'report_type': job.report_type,
+        'status': job.status,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+        'error': job.last_error if job.status == 'Failed' else None
+    }
+    if job.status == 'Completed' and job.report_type == POLICY_SIMULATION:
+        response['result_url'] = url_for('reporting.policy_simulation_result', job_id=job.id)
+    elif job.status == 'Completed':
+        response['result_url'] = url_for('reporting.generate_report_view', type=job.report_type,
+                                         start_date=job.start_date.strftime('%Y-%m-%d'),
+                                         end_date=job.end_date.strftime('%Y-%m-%d'),
+                                         tax_type_id=job.tax_type_id)
+    return jsonify(response)
+
+@reporting_bp.route('/policy-simulation', methods=['GET', 'POST'])
+@login_required
+def policy_simulation():
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to run simulations
+    if not any(perm in permissions for perm in ['view_reports', 'admin_access']):
+        flash('You do not have permission to run tax policy simulations', 'danger')
+        return redirect(url_for('reporting.index'))
+    
+    tax_types = TaxType.query.order_by(TaxType.code).all()
+    current_schedules = {tax_type.id: format_brackets(schedule_for(tax_type.id)) for tax_type in tax_types}
+    today = datetime.utcnow().date()
+    form = {
+        'start_date': request.form.get('start_date') or today.replace(month=1, day=1).strftime('%Y-%m-%d'),
+        'end_date': request.form.get('end_date') or today.replace(month=12, day=31).strftime('%Y-%m-%d'),
+        'segment_by': request.form.get('segment_by', 'tax_type'),
+        'schedules': {tax_type.id: request.form.get(f'schedule_{tax_type.id}', '') for tax_type in tax_types},
+    }
+    
+    if request.method == 'POST':
+        # Tax types left blank keep their current schedule and are not simulated
+        schedules = {}
+        errors = []
+        for tax_type in tax_types:
+            text = form['schedules'][tax_type.id].strip()
+            if text:
+                try:
+                    schedules[tax_type.id] = parse_brackets(text)
+                except ValueError as e:
+                    errors.append(f'{tax_type.code}: {e}')
+        try:
+            start_date = datetime.strptime(form['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(form['end_date'], '%Y-%m-%d').date()
+        except ValueError:
+            errors.append('Enter the period range as dates')
+        if not schedules and not errors:
+            errors.append('Enter an alternative schedule for at least one tax type')
+        if form['segment_by'] not in SIMULATION_SEGMENTS:
+            errors.append('Choose how to break the results down')
+    
+        if not errors:
+            job = submit_simulation_job(schedules, start_date, end_date, form['segment_by'], user=current_user)
+            db.session.commit()
+            return redirect(url_for('reporting.policy_simulation_result', job_id=job.id))
+        for error in errors:
+            flash(error, 'danger')
+    
+    simulations = keyset_paginate_request(ReportJob.query.filter_by(report_type=POLICY_SIMULATION),
+                                          [ReportJob.id.desc()], per_page=10)
+    return render_template('reporting/policy_simulation.html',
+                           tax_types=tax_types,
+                           current_schedules=current_schedules,
+                           segments=SIMULATION_SEGMENTS,
+                           form=form,
+                           simulations=simulations,
+                           permissions=permissions)
+
+@reporting_bp.route('/policy-simulation/<int:job_id>')
+@login_required
+def policy_simulation_result(job_id):
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to run simulations
+    if not any(perm in permissions for perm in ['view_reports', 'admin_access']):
+        flash('You do not have permission to view tax policy simulations', 'danger')
+        return redirect(url_for('reporting.index'))
+    
+    job = ReportJob.query.filter_by(id=job_id, report_type=POLICY_SIMULATION).first_or_404()
+    return render_template('reporting/policy_simulation_result.html',
+                           job=job,
+                           result=report_job_result(job),
+                           segments=SIMULATION_SEGMENTS,
+                           permissions=permissions)
+
+@reporting_bp.route('/export-report')
+@login_required
+def export_report():
+    # Get user permissions
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to view reports
+    if not any(perm in permissions for perm in ['view_reports', 'view_statistics', 'admin_access']):
+        flash('You do not have permission to export reports', 'danger')
+        return redirect(url_for('reporting.index'))
+    
+    report_type = request.args.get('type', '')
+    export_format = request.args.get('format', 'csv')
+    tax_type_id = request.args.get('tax_type_id', type=int)
+    start_date, end_date = _report_date_range()
+    
+    if export_format not in EXPORT_FORMATS:
+        abort(400)
+    
+    export = report_export_rows(report_type, start_date, end_date, tax_type_id)
+    if export is None:
+        abort(404)
+    
+    # Rows are streamed from a server-side cursor as the file is written
+    header, rows = export
+    filename = f'{report_type}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{export_format}'
+    return Response(
+        stream_with_context(stream_export(export_format, header, rows, sheet_name=report_type)),
+        mimetype=EXPORT_FORMATS[export_format],
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
 @reporting_bp.route('/dashboards')
 @login_required
 def dashboards():
@@ -139,64 +322,8 @@ def dashboards():
         flash('You do not have permission to access dashboards', 'danger')
         return redirect(url_for('reporting.index'))
     
-    # Get date range for dashboard data
-    end_date = datetime.utcnow().date()
-    start_date = end_date - timedelta(days=365)  # Last year
-    
-    # Tax collection by type
-    tax_types = TaxType.query.all()
-    tax_collection_data = []
-    
-    for tax_type in tax_types:
-        total_amount = db.session.query(db.func.sum(Payment.amount)).join(TaxReturn).filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            Payment.payment_date.between(start_date, end_date)
-        ).scalar() or 0
-        
-        tax_collection_data.append({
-            'name': tax_type.name,
-            'amount': float(total_amount),
-            'is_core': tax_type.is_core
-        })
-    
-    # Monthly collection trend
-    monthly_trend = []
-    for i in range(12):
-        month_date = end_date - timedelta(days=30 * i)
-        month_start = datetime(month_date.year, month_date.month, 1).date()
-        month_end = datetime(month_date.year, month_date.month, calendar.monthrange(month_date.year, month_date.month)[1]).date()
-        
-        total_amount = db.session.query(db.func.sum(Payment.amount)).filter(
-            Payment.payment_date.between(month_start, month_end)
-        ).scalar() or 0
-        
-        monthly_trend.append({
-            'month': month_start.strftime('%b %Y'),
-            'amount': float(total_amount)
-        })
-    
-    monthly_trend.reverse()  # Show oldest to newest
-    
-    # Return filing compliance
-    compliance_data = []
-    for tax_type in tax_types:
-        total_returns = TaxReturn.query.filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            TaxReturn.due_amount > 0
-        ).count()
-        
-        filed_returns = TaxReturn.query.filter(
-            TaxReturn.tax_type_id == tax_type.id,
-            TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']),
-            TaxReturn.due_amount > 0
-        ).count()
-        
-        compliance_rate = (filed_returns / total_returns * 100) if total_returns > 0 else 0
-        
-        compliance_data.append({
-            'name': tax_type.name,
-            'compliance_rate': round(compliance_rate, 2)
-        })
+    # Revenue by tax type, monthly trend and compliance over the last year (cached)
+    metrics = dashboard_metrics.get()
     
     # Registration statistics
     from app.models.registration import Registration, IndividualRegistration, NonIndividualRegistration, SoleProprietorRegistration
@@ -212,9 +339,9 @@ def dashboards():
     ]
     
     return render_template('reporting/dashboards.html', 
-                           tax_collection_data=json.dumps(tax_collection_data), 
-                           monthly_trend=json.dumps(monthly_trend), 
-                           compliance_data=json.dumps(compliance_data), 
+                           tax_collection_data=json.dumps(metrics['tax_collection_data']), 
+                           monthly_trend=json.dumps(metrics['monthly_trend']), 
+                           compliance_data=json.dumps(metrics['compliance_data']), 
                            registration_data=json.dumps(registration_data), 
                            permissions=permissions)
 
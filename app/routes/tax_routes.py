@@ -2,18 +2,24 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app import db
 from datetime import datetime
-from app.models.user import User, Account
-from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund, Objection
+from app.models.user import Account
+from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund, Objection, BankImport, SuspensePayment
 from app.models.process import Person, Organization, Property, Request, Audit, Collection
-from app.models.registration import TaxpayerLedger
 from app.models.functionality import Notification
-from app.services.auth_service import get_user_permissions
-from app.services.tax_service import generate_reference_number
+from app.services.db_helpers import keyset_paginate_request
+from app.services.auth_service import get_user_permissions, get_user_account_ids
+from app.services.tax_service import get_returns_under_audit
+from app.services.reference_service import generate_reference
+from app.services.bulk_filing_service import bulk_file_returns, parse_filing_file, parse_filing_json
+from app.services.bank_import_service import import_bank_file, BANK_FILE_FORMATS
+from app.services.payment_service import post_payment, complete_payment, decline_payment
+from app.services.ledger_service import post_ledger_entry
+from app.services.notification_service import broadcast_notification
 from datetime import datetime, timedelta
-import uuid
 from app.models.functionality import Notification
 from decimal import Decimal
 from sqlalchemy import or_
+import secrets
 
 tax_bp = Blueprint('tax', __name__, url_prefix='/tax')
 
@@ -90,7 +96,6 @@ def tax_returns():
     account_id = request.args.get('account_id', type=int)
     tax_type_id = request.args.get('tax_type_id', type=int)
     status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     # Build query based on filters and permissions
@@ -100,10 +105,12 @@ def tax_returns():
         query = query.filter_by(account_id=account_id)
     elif not 'view_all_accounts' in permissions:
         # If not admin/internal, only show returns for user's accounts
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         # Include returns under audit assigned to the current user
-        audited_return_ids = [a.tax_return_id for a in Audit.query.filter_by(auditor_id=current_user.id).all()]
+        audited_return_ids = db.select(Audit.tax_return_id).where(
+            Audit.auditor_id == current_user.id,
+            Audit.tax_return_id.isnot(None)
+        )
         query = query.filter(or_(TaxReturn.account_id.in_(account_ids),
                                  TaxReturn.id.in_(audited_return_ids)))
     
@@ -114,7 +121,7 @@ def tax_returns():
         query = query.filter_by(status=status)
     
     # Get paginated results
-    tax_returns = query.order_by(TaxReturn.created_at.desc()).paginate(page=page, per_page=per_page)
+    tax_returns = keyset_paginate_request(query, [TaxReturn.created_at.desc()], per_page=per_page)
     
     # Display the due amount from tax return directly
     # The due amount has already been updated during payments
@@ -122,50 +129,10 @@ def tax_returns():
         # Just use the existing due_amount field directly
         tr.remaining_amount = tr.due_amount
     
-    # Simpler approach to mark tax returns under audit
-        # Get active audits
-    active_audits = Audit.query.filter(Audit.status != 'Completed').all()
-    
-    # Create a dictionary to store tax returns that are actually under audit
-    # Map from account_id -> set of tax_return_ids under audit
-    # We'll query for tax returns that have the same reference number as the ones
-    # mentioned in audit notifications
-    account_tax_returns_under_audit = {}
-    
-    # Get notifications about tax returns under audit to identify specific returns
-    from app.models.functionality import Notification
-    audit_notifications = Notification.query.filter(
-        Notification.title == "Tax Return Under Audit"
-    ).all()
-    
-    # Extract tax return reference numbers from the notifications
-    tax_return_refs_under_audit = set()
-    for notification in audit_notifications:
-        # Parse the notification message to extract the tax return reference
-        # Example message: "Your tax return REF-12345 for Personal Income Tax type..."
-        message = notification.message
-        if "Your tax return " in message and " for " in message:
-            ref = message.split("Your tax return ")[1].split(" for ")[0].strip()
-            tax_return_refs_under_audit.add(ref)
-    
-    # Get all tax returns that match these references
-    if tax_return_refs_under_audit:
-        specific_returns_under_audit = TaxReturn.query.filter(
-            TaxReturn.reference_number.in_(list(tax_return_refs_under_audit))
-        ).all()
-        
-        # Group by account_id
-        for tr in specific_returns_under_audit:
-            if tr.account_id not in account_tax_returns_under_audit:
-                account_tax_returns_under_audit[tr.account_id] = set()
-            account_tax_returns_under_audit[tr.account_id].add(tr.id)
-    
-    # Mark tax returns as under audit if they are specifically targeted
+    # Mark tax returns on this page that have an open audit
+    returns_under_audit = get_returns_under_audit([tr.id for tr in tax_returns.items])
     for tr in tax_returns.items:
-        if tr.account_id in account_tax_returns_under_audit and tr.id in account_tax_returns_under_audit[tr.account_id]:
-            tr.is_under_audit = True
-        else:
-            tr.is_under_audit = False
+        tr.is_under_audit = tr.id in returns_under_audit
     
     # Get filter options
     if 'view_all_accounts' in permissions:
@@ -203,8 +170,7 @@ def view_tax_return(return_id):
     
     # Check if user has permission to view this return
     if not 'view_all_accounts' in permissions:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if tax_return.account_id not in account_ids:
             flash('You do not have permission to view this tax return', 'danger')
             return redirect(url_for('tax.tax_returns'))
@@ -276,7 +242,7 @@ def file_tax_return():
         due_amount = amount
         
         # Generate reference number
-        reference_number = generate_reference_number()
+        reference_number = generate_reference('TX')
         
         # Create tax return
         tax_return = TaxReturn(
@@ -298,20 +264,15 @@ def file_tax_return():
         db.session.commit()
         
         # Create ledger entry
-        ledger_entry = TaxpayerLedger(
+        post_ledger_entry(
             account_id=account_id,
             tax_type_id=tax_type_id,
             tax_period_id=tax_period_id,
-            transaction_date=datetime.utcnow().date(),
             transaction_type='Assessment',
             description=f'Self-assessment for {tax_return.tax_type.name}',
             debit_amount=due_amount,
-            credit_amount=0,
-            balance=due_amount,
             reference_number=reference_number
         )
-        
-        db.session.add(ledger_entry)
         db.session.commit()
         
         # Get account and tax type details for the notification
@@ -328,16 +289,12 @@ def file_tax_return():
         )
         db.session.add(user_notification)
         
-        # Create notifications for all admin users
-        admin_users = User.query.filter_by(is_admin=True).all()
-        for admin in admin_users:
-            admin_notification = Notification(
-                user_id=admin.id,
-                title="New Tax Return Filed",
-                message=f"A new {tax_type.name} tax return ({reference_number}) has been filed by {current_user.username} for account {account.account_number}. Amount: ${due_amount}.",
-                notification_type='Alert'
-            )
-            db.session.add(admin_notification)
+        # Broadcast one notification to all admin users
+        broadcast_notification(
+            'admins',
+            title="New Tax Return Filed",
+            message=f"A new {tax_type.name} tax return ({reference_number}) has been filed by {current_user.username} for account {account.account_number}. Amount: ${due_amount}."
+        )
         
         db.session.commit()
         
@@ -350,13 +307,53 @@ def file_tax_return():
                            periods=periods,
                            permissions=permissions)
 
+@tax_bp.route('/returns/bulk-file', methods=['GET', 'POST'])
+@login_required
+def bulk_file_tax_returns():
+    permissions = get_user_permissions(current_user)
+    wants_json = request.is_json or request.accept_mimetypes.best == 'application/json'
+    
+    # Check if user has permission to file returns
+    if not any(perm in permissions for perm in ['file_individual_returns', 'file_business_returns']):
+        if wants_json:
+            return jsonify({'success': False, 'message': 'You do not have permission to file tax returns'}), 403
+        flash('You do not have permission to file tax returns', 'danger')
+        return redirect(url_for('tax.tax_returns'))
+    
+    if request.method == 'GET':
+        return render_template('tax/bulk_file_returns.html', report=None, permissions=permissions)
+    
+    # Accept a JSON body or an uploaded CSV/JSON file
+    upload = request.files.get('file')
+    try:
+        if request.is_json:
+            rows = parse_filing_json(request.get_json())
+        elif upload and upload.filename:
+            rows = parse_filing_file(upload.stream, upload.filename)
+        else:
+            raise ValueError('Upload a CSV or JSON file of returns')
+        
+        # Agents may file for every account they can see, taxpayers only for their own
+        allowed_account_ids = None if 'view_all_accounts' in permissions else set(get_user_account_ids(current_user))
+        report = bulk_file_returns(rows, current_user, allowed_account_ids)
+    except (ValueError, UnicodeDecodeError) as e:
+        if wants_json:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        flash(f'Could not read the batch: {e}', 'danger')
+        return render_template('tax/bulk_file_returns.html', report=None, permissions=permissions)
+    
+    if wants_json:
+        return jsonify(dict(report, success=True))
+    
+    flash(f"{report['filed']} of {report['total']} returns filed", 'success' if report['filed'] else 'warning')
+    return render_template('tax/bulk_file_returns.html', report=report, permissions=permissions)
+
 @tax_bp.route('/payments')
 @login_required
 def payments():
     permissions = get_user_permissions(current_user)
     account_id = request.args.get('account_id', type=int)
     status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     # Build query based on filters and permissions
@@ -366,15 +363,14 @@ def payments():
         query = query.join(TaxReturn).filter(TaxReturn.account_id == account_id)
     elif not 'view_all_accounts' in permissions:
         # If not admin/internal, only show payments for user's accounts
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = query.join(TaxReturn).filter(TaxReturn.account_id.in_(account_ids))
     
     if status:
         query = query.filter_by(status=status)
     
     # Get paginated results
-    payments = query.order_by(Payment.payment_date.desc()).paginate(page=page, per_page=per_page)
+    payments = keyset_paginate_request(query, [Payment.payment_date.desc()], per_page=per_page)
     
     # Get filter options
     if 'view_all_accounts' in permissions:
@@ -403,8 +399,7 @@ def make_payment():
         
         # Check if user has permission to pay for this return
         if not 'view_all_accounts' in permissions:
-            user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-            account_ids = [account.id for account in user_accounts]
+            account_ids = get_user_account_ids(current_user)
             if tax_return.account_id not in account_ids:
                 flash('You do not have permission to make payments for this tax return', 'danger')
                 return redirect(url_for('tax.tax_returns'))
@@ -418,8 +413,7 @@ def make_payment():
         else:
             tax_returns = [tax_return]
     else:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if not tax_return:
             tax_returns = TaxReturn.query.filter(TaxReturn.account_id.in_(account_ids), TaxReturn.status != 'Finalized').all()
         elif tax_return.account_id in account_ids:
@@ -439,108 +433,83 @@ def make_payment():
             return render_template('tax/make_payment.html', 
                                    tax_returns=tax_returns, 
                                    selected_tax_return=tax_return, 
+                                   idempotency_key=secrets.token_hex(16),
                                    permissions=permissions)
         
         tax_return = TaxReturn.query.get_or_404(tax_return_id)
         
-        # Generate reference number
-        reference_number = f"PMT-{uuid.uuid4().hex[:8].upper()}"
-        
-        # Create payment
-        payment = Payment(
-            tax_return_id=tax_return_id,
-            amount=amount,
-            payment_date=datetime.utcnow(),
-            payment_method=payment_method,
-            reference_number=reference_number,
-            status='Completed'
-        )
-        
-        db.session.add(payment)
-        
-        # Create ledger entry
-        ledger_entry = TaxpayerLedger(
-            account_id=tax_return.account_id,
-            tax_type_id=tax_return.tax_type_id,
-            tax_period_id=tax_return.tax_period_id,
-            transaction_date=datetime.utcnow().date(),
-            transaction_type='Payment',
-            description=f'Payment for {tax_return.reference_number}',
-            debit_amount=0,
-            credit_amount=amount,
-            # Ensure both sides are Decimal to avoid type errors
-            balance=tax_return.due_amount - Decimal(str(amount)),  # This is simplified, should consider previous payments
-            reference_number=reference_number
-        )
-        
-        db.session.add(ledger_entry)
-        
-        # Get total amount already paid for this tax return
-        already_paid = db.session.query(db.func.sum(Payment.amount)).filter_by(tax_return_id=tax_return_id).scalar() or 0
-        
-        # Convert payment amount to Decimal to ensure precise calculation
-        payment_amount = Decimal(str(amount))
-        
-        # Check if this payment results in an overpayment
-        if payment_amount > tax_return.due_amount:
-            # Calculate the overpayment amount
-            overpayment_amount = payment_amount - tax_return.due_amount
-            
-            # Create a credit note for the account
-            credit_reference = f"CR-{uuid.uuid4().hex[:8].upper()}"
-            credit_note = TaxpayerLedger(
-                account_id=tax_return.account_id,
-                tax_type_id=tax_return.tax_type_id,
-                tax_period_id=tax_return.tax_period_id,
-                transaction_date=datetime.utcnow().date(),
-                transaction_type='Credit',
-                description=f'Credit from overpayment on {tax_return.reference_number}',
-                debit_amount=0,
-                credit_amount=overpayment_amount,
-                balance=Decimal('0'),
-                reference_number=credit_reference
-            )
-            db.session.add(credit_note)
-            
-            # Create notification about the overpayment
-            notification = Notification(
-                user_id=current_user.id,
-                title='Overpayment Detected',
-                message=f'You have overpaid tax return {tax_return.reference_number} by ${overpayment_amount:.2f}. This amount has been credited to your account.',
-                notification_type='Alert'
-            )
-            db.session.add(notification)
-            
-            # Set the tax return to finalized with zero due amount
-            tax_return.due_amount = Decimal('0')
-            tax_return.status = 'Finalized'
-            
-            # Add an extra message to the flash notification
-            flash(f'Overpayment of ${overpayment_amount:.2f} detected and credited to your account', 'info')
-        else:
-            # Normal payment processing (no overpayment)
-            # Calculate new due amount after this payment
-            new_due_amount = max(Decimal('0'), tax_return.due_amount - payment_amount)
-            
-            # Update the tax return's due amount
-            tax_return.due_amount = new_due_amount
-            
-            # Only change status to 'Finalized' if due amount is exactly zero
-            if new_due_amount == Decimal('0'):
-                tax_return.status = 'Finalized'
-            else:
-                # Ensure status remains 'Filed' if not zero
-                if tax_return.status not in ['Filed', 'Assessed']:
-                    tax_return.status = 'Filed'
-        
+        # The form carries a key generated when it was rendered, so a resubmitted form replays instead of paying twice
+        idempotency_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key') or None
+        try:
+            posted = post_payment(tax_return_id, amount, payment_method, idempotency_key=idempotency_key,
+                                  notify_user_id=current_user.id)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('tax.make_payment', tax_return_id=tax_return_id))
         db.session.commit()
         
+        if posted.replayed:
+            flash('This payment was already processed', 'info')
+            return redirect(url_for('tax.view_tax_return', return_id=tax_return_id))
+        if posted.overpayment > 0:
+            flash(f'Overpayment of ${posted.overpayment:.2f} detected and credited to your account', 'info')
+        
         flash('Payment processed successfully', 'success')
         return redirect(url_for('tax.view_tax_return', return_id=tax_return_id))
     
     return render_template('tax/make_payment.html', 
                            tax_returns=tax_returns, 
                            selected_tax_return=tax_return, 
+                           idempotency_key=secrets.token_hex(16),
+                           permissions=permissions)
+
+@tax_bp.route('/payments/import', methods=['GET', 'POST'])
+@login_required
+def bank_imports():
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to post bank payments
+    if not any(perm in permissions for perm in ['manage_tax_accounts', 'admin_access']):
+        flash('You do not have permission to import bank payments', 'danger')
+        return redirect(url_for('tax.payments'))
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        file_format = request.form.get('file_format', 'csv')
+        if not upload or not upload.filename or file_format not in BANK_FILE_FORMATS:
+            flash('Choose a bank file and its format', 'danger')
+            return redirect(url_for('tax.bank_imports'))
+    
+        try:
+            bank_import = import_bank_file(upload.stream, upload.filename, file_format, user=current_user)
+        except ValueError as e:
+            flash(str(e), 'warning')
+            return redirect(url_for('tax.bank_imports'))
+    
+        if bank_import.status == 'Completed':
+            flash(f'{bank_import.matched_lines} payments posted, {bank_import.suspense_lines} lines sent to suspense', 'success')
+        else:
+            flash(f'Import stopped after {bank_import.total_lines} lines: {bank_import.last_error}. '
+                  f'Upload the file again to resume.', 'danger')
+        return redirect(url_for('tax.bank_import_detail', import_id=bank_import.id))
+    
+    imports = keyset_paginate_request(BankImport.query, [BankImport.id.desc()], per_page=20)
+    return render_template('tax/bank_imports.html', imports=imports, file_formats=BANK_FILE_FORMATS,
+                           permissions=permissions)
+
+@tax_bp.route('/payments/import/<int:import_id>')
+@login_required
+def bank_import_detail(import_id):
+    permissions = get_user_permissions(current_user)
+    
+    # Check if user has permission to post bank payments
+    if not any(perm in permissions for perm in ['manage_tax_accounts', 'admin_access']):
+        flash('You do not have permission to view bank imports', 'danger')
+        return redirect(url_for('tax.payments'))
+    
+    bank_import = BankImport.query.get_or_404(import_id)
+    suspense = keyset_paginate_request(bank_import.suspense_payments, [SuspensePayment.line_number], per_page=50)
+    return render_template('tax/bank_import_detail.html', bank_import=bank_import, suspense=suspense,
                            permissions=permissions)
 
 @tax_bp.route('/payments/<int:payment_id>', methods=['GET', 'POST'])
@@ -556,67 +525,21 @@ def payment_detail(payment_id):
     if request.method == 'POST':
         action = request.form.get('action')
         if action == 'approve':
-            payment.status = 'Completed'
-            # update due amount
-            tr = payment.tax_return
-            
-            # Check if this payment results in an overpayment
-            if payment.amount > tr.due_amount:
-                # Calculate the overpayment amount
-                overpayment_amount = payment.amount - tr.due_amount
-                
-                # Create a credit note for the account
-                credit_reference = f"CR-{uuid.uuid4().hex[:8].upper()}"
-                credit_note = TaxpayerLedger(
-                    account_id=tr.account_id,
-                    tax_type_id=tr.tax_type_id,
-                    tax_period_id=tr.tax_period_id,
-                    transaction_date=datetime.utcnow().date(),
-                    transaction_type='Credit',
-                    description=f'Credit from overpayment on {tr.reference_number}',
-                    debit_amount=0,
-                    credit_amount=overpayment_amount,
-                    balance=Decimal('0'),
-                    reference_number=credit_reference
-                )
-                db.session.add(credit_note)
-                
-                # Create notification for the account owner
-                user_id = tr.account.user_id
-                notification = Notification(
-                    user_id=user_id,
-                    title='Overpayment Detected',
-                    message=f'You have overpaid tax return {tr.reference_number} by ${overpayment_amount:.2f}. This amount has been credited to your account.',
-                    notification_type='Alert'
-                )
-                db.session.add(notification)
-                
-                # Set the tax return to finalized with zero due amount
-                tr.due_amount = Decimal('0')
-                tr.status = 'Finalized'
-                
-                # Add an extra message
-                flash(f'Overpayment of ${overpayment_amount:.2f} detected and credited to account', 'info')
-            else:
-                # Normal payment processing (no overpayment)
-                # Calculate new due amount
-                new_due_amount = max(Decimal('0'), tr.due_amount - payment.amount)
-                tr.due_amount = new_due_amount
-                
-                # Only change status to 'Finalized' if due amount is exactly zero
-                if new_due_amount == Decimal('0'):
-                    tr.status = 'Finalized'
-                else:
-                    # Ensure status remains 'Filed' if not zero
-                    if tr.status not in ['Filed', 'Assessed']:
-                        tr.status = 'Filed'
-                    
+            posted = complete_payment(payment.id)
             db.session.commit()
-            flash('Payment approved successfully', 'success')
+            if posted.replayed:
+                flash('Payment was already approved', 'info')
+            else:
+                if posted.overpayment > 0:
+                    flash(f'Overpayment of ${posted.overpayment:.2f} detected and credited to account', 'info')
+                flash('Payment approved successfully', 'success')
         elif action == 'decline':
-            payment.status = 'Failed'
+            declined = decline_payment(payment.id)
             db.session.commit()
-            flash('Payment declined', 'warning')
+            if declined:
+                flash('Payment declined', 'warning')
+            else:
+                flash('Only pending payments can be declined', 'info')
         return redirect(url_for('tax.payments'))
     return render_template('tax/payment_detail.html', payment=payment, permissions=permissions)
 
@@ -626,7 +549,6 @@ def refunds():
     permissions = get_user_permissions(current_user)
     account_id = request.args.get('account_id', type=int)
     status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     
     # Build query based on filters and permissions
@@ -636,15 +558,14 @@ def refunds():
         query = query.filter_by(account_id=account_id)
     elif not 'view_all_accounts' in permissions:
         # If not admin/internal, only show refunds for user's accounts
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = query.filter(Refund.account_id.in_(account_ids))
     
     if status:
         query = query.filter_by(status=status)
     
     # Get paginated results
-    refunds = query.order_by(Refund.request_date.desc()).paginate(page=page, per_page=per_page)
+    refunds = keyset_paginate_request(query, [Refund.request_date.desc()], per_page=per_page)
     
     # Get filter options
     if 'view_all_accounts' in permissions:
@@ -714,7 +635,7 @@ def request_refund():
                                    permissions=permissions)
         
         # Generate reference number
-        reference_number = f"REF-{uuid.uuid4().hex[:8].upper()}"
+        reference_number = generate_reference('REF')
         
         # Create refund request
         refund = Refund(
@@ -739,16 +660,12 @@ def request_refund():
         )
         db.session.add(user_notification)
         
-        # Create notifications for all admin users
-        admin_users = User.query.filter_by(is_admin=True).all()
-        for admin in admin_users:
-            admin_notification = Notification(
-                user_id=admin.id,
-                title="New Refund Request",
-                message=f"A new refund request ({reference_number}) for ${amount} has been submitted by {current_user.username} for account {account.account_number}.",
-                notification_type='Alert'
-            )
-            db.session.add(admin_notification)
+        # Broadcast one notification to all admin users
+        broadcast_notification(
+            'admins',
+            title="New Refund Request",
+            message=f"A new refund request ({reference_number}) for ${amount} has been submitted by {current_user.username} for account {account.account_number}."
+        )
         
         db.session.commit()
         
@@ -796,20 +713,15 @@ def process_refund(refund_id, action):
         # Get a tax type for this ledger entry (using the first tax type as default)
         default_tax_type = TaxType.query.first()
         
-        ledger_entry = TaxpayerLedger(
+        db.session.add(notification)
+        post_ledger_entry(
             account_id=refund.account_id,
             tax_type_id=default_tax_type.id,  # Required field
-            transaction_date=datetime.now().date(),
             transaction_type='Refund',
             description=f"Approved refund request {refund.reference_number}",
             credit_amount=refund.amount,
-            debit_amount=0,
-            balance=refund.amount,  # Credit increases the balance
             reference_number=refund.reference_number
         )
-        
-        db.session.add(notification)
-        db.session.add(ledger_entry)
         db.session.commit()
         
         flash('Refund request has been approved and credit added to taxpayer account', 'success')
@@ -844,7 +756,6 @@ def objections():
     permissions = get_user_permissions(current_user)
     account_id = request.args.get('account_id', type=int)
     status = request.args.get('status')
-    page = request.args.get('page', 1, type=int)
     per_page = 10
     
     # Build query based on filters and permissions
@@ -854,15 +765,14 @@ def objections():
         query = query.join(TaxReturn).filter(TaxReturn.account_id == account_id)
     elif not 'view_all_accounts' in permissions:
         # If not admin/internal, only show objections for user's accounts
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = query.join(TaxReturn).filter(TaxReturn.account_id.in_(account_ids))
     
     if status:
         query = query.filter_by(status=status)
     
     # Get paginated results
-    objections = query.order_by(Objection.filing_date.desc()).paginate(page=page, per_page=per_page)
+    objections = keyset_paginate_request(query, [Objection.filing_date.desc()], per_page=per_page)
     
     # Get filter options
     if 'view_all_accounts' in permissions:
@@ -979,8 +889,7 @@ def file_objection():
         
         # Check if user has permission to object to this return
         if not 'view_all_accounts' in permissions:
-            user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-            account_ids = [account.id for account in user_accounts]
+            account_ids = get_user_account_ids(current_user)
             if tax_return.account_id not in account_ids:
                 flash('You do not have permission to file objections for this tax return', 'danger')
                 return redirect(url_for('tax.tax_returns'))
@@ -994,8 +903,7 @@ def file_objection():
         else:
             tax_returns = [tax_return]
     else:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [account.id for account in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         if not tax_return:
             tax_returns = TaxReturn.query.filter(TaxReturn.account_id.in_(account_ids), TaxReturn.status.in_(['Filed', 'Assessed'])).all()
         elif tax_return.account_id in account_ids:
@@ -1016,7 +924,7 @@ def file_objection():
                                    permissions=permissions)
         
         # Generate reference number
-        reference_number = f"OBJ-{uuid.uuid4().hex[:8].upper()}"
+        reference_number = generate_reference('OBJ')
         
         # Create objection
         objection = Objection(
@@ -1041,16 +949,12 @@ def file_objection():
         )
         db.session.add(user_notification)
         
-        # Create notifications for all admin users
-        admin_users = User.query.filter_by(is_admin=True).all()
-        for admin in admin_users:
-            admin_notification = Notification(
-                user_id=admin.id,
-                title="New Objection Filed",
-                message=f"A new objection ({reference_number}) has been filed by {current_user.username} for tax return {tax_return.reference_number if tax_return else ''}{' for account ' + account.account_number if account else ''}.",
-                notification_type='Alert'
-            )
-            db.session.add(admin_notification)
+        # Broadcast one notification to all admin users
+        broadcast_notification(
+            'admins',
+            title="New Objection Filed",
+            message=f"A new objection ({reference_number}) has been filed by {current_user.username} for tax return {tax_return.reference_number if tax_return else ''}{' for account ' + account.account_number if account else ''}."
+        )
         
         db.session.commit()
         
@@ -1071,10 +975,8 @@ def audits():
     if any(perm in permissions for perm in ['view_all_accounts', 'admin_access']):
         query = Audit.query
     else:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [acc.id for acc in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         query = Audit.query.filter(Audit.account_id.in_(account_ids))
-    page = request.args.get('page', 1, type=int)
     per_page = 20
     status = request.args.get('status', '')
     audit_type = request.args.get('type', '')
@@ -1082,7 +984,7 @@ def audits():
         query = query.filter(Audit.status == status)
     if audit_type:
         query = query.filter(Audit.audit_type == audit_type)
-    audits = query.order_by(Audit.start_date.desc()).paginate(page=page, per_page=per_page)
+    audits = keyset_paginate_request(query, [Audit.start_date.desc()], per_page=per_page)
     # Get filter options
     statuses = ['Planned', 'In Progress', 'Completed', 'Cancelled']
     audit_types = ['Desk', 'Field', 'Comprehensive']
@@ -1105,8 +1007,7 @@ def new_audit():
     if 'view_all_accounts' in permissions:
         tax_returns_list = TaxReturn.query.filter(TaxReturn.status.in_(['Filed', 'Assessed'])).all()
     else:
-        user_accounts = Account.query.filter_by(user_id=current_user.id).all()
-        account_ids = [acc.id for acc in user_accounts]
+        account_ids = get_user_account_ids(current_user)
         tax_returns_list = TaxReturn.query.filter(TaxReturn.account_id.in_(account_ids), TaxReturn.status.in_(['Filed', 'Assessed'])).all()
     audit_types = ['Desk', 'Field', 'Comprehensive']
     if request.method == 'POST':
@@ -1117,14 +1018,21 @@ def new_audit():
         if not (tax_return_id and audit_type and start_date):
             flash('All required fields must be filled', 'danger')
             return render_template('tax/new_audit.html', tax_returns=tax_returns_list, audit_types=audit_types, permissions=permissions)
-        reference_number = f"AUD-{uuid.uuid4().hex[:8].upper()}"
+        try:
+            start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+            end_date = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None
+        except ValueError:
+            flash('Invalid date format', 'danger')
+            return render_template('tax/new_audit.html', tax_returns=tax_returns_list, audit_types=audit_types, permissions=permissions)
+        reference_number = generate_reference('AUD')
         tr = TaxReturn.query.get_or_404(tax_return_id)
         audit = Audit(
             account_id=tr.account_id,
             tax_type_id=tr.tax_type_id,
+            tax_return_id=tr.id,
             audit_type=audit_type,
             start_date=start_date,
-            end_date=end_date or None,
+            end_date=end_date,
             status='Planned',
             auditor_id=current_user.id,
             reference_number=reference_number
@@ -1136,10 +1044,11 @@ def new_audit():
         from app.models.registration import AuditCase
         from datetime import date
         
-        case_number = f"CASE-{uuid.uuid4().hex[:8].upper()}"
+        case_number = generate_reference('CASE')
         audit_case = AuditCase(
             account_id=tr.account_id,
             audit_id=audit.id,
+            tax_return_id=tr.id,
             case_number=case_number,
             open_date=date.today(),
             status='Open'
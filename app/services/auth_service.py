@@ -1,10 +1,20 @@
 from itsdangerous import URLSafeTimedSerializer
 from app import bcrypt
 from app.config import Config
-from app.models.user import User, UserType, AuditTrail
-from flask import current_app
+from app.models.user import User, UserType, AuditTrail, Account
+from flask import current_app, g, has_request_context
+from sqlalchemy import event, inspect
+from collections import namedtuple
 from datetime import datetime
 import os
+import time
+
+# Permissions and owned account ids for one user, computed once per request
+AuthorizationContext = namedtuple('AuthorizationContext', ['permissions', 'account_ids'])
+
+# Optional cross-request cache: user_id -> (expires_at, AuthorizationContext).
+# Enabled by AUTH_CONTEXT_CACHE_TTL (seconds) and invalidated when accounts or users change.
+_authorization_cache = {}
 
 def generate_confirmation_token(email):
     """Generate a secure token for email confirmation or password reset"""
@@ -82,7 +92,7 @@ def disable_two_factor(user):
     user.two_factor_enabled = False
     return user
 
-def get_user_permissions(user):
+def _build_permissions(user):
     """Get permissions for a user based on their type and admin status"""
     permissions = []
     
@@ -99,26 +109,82 @@ def get_user_permissions(user):
         permissions.append('view_all_accounts')
     
     # User type specific permissions
-    if user.user_type.name == 'Individual':
+    user_type_name = user.user_type.name
+    if user_type_name == 'Individual':
         permissions.append('file_individual_returns')
         permissions.append('view_individual_accounts')
-    elif user.user_type.name == 'Non-Individual':
+    elif user_type_name == 'Non-Individual':
         permissions.append('file_business_returns')
         permissions.append('view_business_accounts')
-    elif user.user_type.name == 'Agent':
+    elif user_type_name == 'Agent':
         permissions.append('file_individual_returns')
         permissions.append('file_business_returns')
         permissions.append('view_individual_accounts')
         permissions.append('view_business_accounts')
         permissions.append('manage_client_accounts')
-    elif user.user_type.name == 'Internal':
+    elif user_type_name == 'Internal':
         permissions.append('process_returns')
         permissions.append('view_all_accounts')
         permissions.append('manage_tax_accounts')
         permissions.append('process_refunds')
         permissions.append('handle_objections')
-    elif user.user_type.name == 'Government':
+    elif user_type_name == 'Government':
         permissions.append('view_reports')
         permissions.append('view_statistics')
     
-    return permissions
\ No newline at end of file
+    return permissions
+
+def get_authorization_context(user):
+    """
+    Get the permissions and owned account ids for a user, computed at most once
+    per request and cached on flask.g. When AUTH_CONTEXT_CACHE_TTL is configured
+    the context is also reused across requests until it expires or is invalidated.
+    """
+    contexts = g.setdefault('authorization_contexts', {}) if has_request_context() else {}
+    context = contexts.get(user.id)
+    if context is not None:
+        return context
+    
+    ttl = current_app.config.get('AUTH_CONTEXT_CACHE_TTL', 0)
+    cached = _authorization_cache.get(user.id) if ttl else None
+    if cached and cached[0] > time.monotonic():
+        context = cached[1]
+    else:
+        account_ids = Account.query.with_entities(Account.id).filter_by(user_id=user.id).order_by(Account.id).all()
+        context = AuthorizationContext(
+            permissions=tuple(_build_permissions(user)),
+            account_ids=tuple(row.id for row in account_ids)
+        )
+        if ttl:
+            _authorization_cache[user.id] = (time.monotonic() + ttl, context)
+    
+    contexts[user.id] = context
+    return context
+
+def get_user_permissions(user):
+    """Get permissions for a user based on their type and admin status"""
+    return list(get_authorization_context(user).permissions)
+
+def get_user_account_ids(user):
+    """Get the ids of the accounts owned by a user"""
+    return list(get_authorization_context(user).account_ids)
+
+def invalidate_authorization_context(user_id):
+    """Drop cached permissions and account ids for a user"""
+    _authorization_cache.pop(user_id, None)
+    if has_request_context():
+        g.get('authorization_contexts', {}).pop(user_id, None)
+
+@event.listens_for(Account, 'after_insert')
+@event.listens_for(Account, 'after_update')
+@event.listens_for(Account, 'after_delete')
+def _invalidate_account_owner(mapper, connection, account):
+    # Invalidate both the current owner and, on transfer, the previous owner
+    invalidate_authorization_context(account.user_id)
+    for previous_user_id in inspect(account).attrs.user_id.history.deleted:
+        invalidate_authorization_context(previous_user_id)
+
+@event.listens_for(User, 'after_update')
+def _invalidate_user(mapper, connection, user):
+    invalidate_authorization_context(user.id)
+
@@ -0,0 +1,296 @@
+from app import db
+from app.models.tax import TaxReturn, Payment, BankImport, SuspensePayment
+from app.services.ledger_service import post_ledger_entries
+from app.services.payment_service import settle_returns_statement
+from app.services.reference_service import generate_reference, register_references, normalize_reference, is_valid_reference
+from app.services.reporting_service import apply_payment_totals_to_rollup
+from app.services.dashboard_service import mark_dashboard_metrics_stale
+from app.services.db_helpers import dialect_insert
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+import csv
+import hashlib
+import io
+
+# Lines posted and committed together
+BANK_IMPORT_CHUNK_SIZE = 2000
+
+BANK_FILE_FORMATS = ('csv', 'fixed')
+
+# CSV header names accepted for each field
+CSV_COLUMNS = {
+    'bank_reference': ('bank_reference', 'transaction_id', 'bank_ref'),
+    'payment_reference': ('payment_reference', 'reference', 'return_reference', 'narrative'),
+    'amount': ('amount', 'credit', 'credit_amount'),
+    'value_date': ('value_date', 'date', 'transaction_date'),
+    'payer_name': ('payer_name', 'payer', 'name'),
+}
+
+# Fixed-width settlement layout: (start, end) character slices of a detail record.
+# Only records of type D are read; H and T header/trailer records are skipped.
+# Amounts are in cents, zero padded, and dates are YYYYMMDD.
+FIXED_WIDTH_LAYOUT = {
+    'record_type': (0, 1),
+    'bank_reference': (1, 17),
+    'value_date': (17, 25),
+    'amount': (25, 40),
+    'payment_reference': (40, 60),
+    'payer_name': (60, 100),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y%m%d', '%d/%m/%Y')
+
+def file_checksum(stream):
+    """SHA-256 of a seekable binary stream, rewound afterwards"""
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(1 << 20), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def _parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'Unreadable date {value!r}')
+
+def _bank_line(line_number, raw, fields, amount_in_cents=False):
+    """Normalize the text fields of one bank line, recording the first problem found"""
+    line = {
+        'line': line_number,
+        'raw': raw,
+        'bank_reference': (fields.get('bank_reference') or '').strip()[:50] or None,
+        'payment_reference': (fields.get('payment_reference') or '').strip()[:50] or None,
+        'payer_name': (fields.get('payer_name') or '').strip()[:120] or None,
+        'amount': None,
+        'value_date': None,
+        'error': None,
+    }
+    try:
+        amount = Decimal((fields.get('amount') or '').strip().replace(',', ''))
+        # NaN quantizes quietly and would only fail later, when compared
+        if not amount.is_finite():
+            raise InvalidOperation
+        line['amount'] = (amount / 100 if amount_in_cents else amount).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        line['error'] = 'Unreadable amount'
+        return line
+    try:
+        line['value_date'] = _parse_date((fields.get('value_date') or '').strip())
+    except ValueError as e:
+        line['error'] = str(e)
+    return line
+
+def parse_bank_file(stream, file_format):
+    """
+    Yield one dict per payment line of a CSV or fixed-width bank file, reading
+    the binary stream line by line. Lines that cannot be read carry an error
+    and go to suspense.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if file_format == 'fixed':
+        for line_number, raw in enumerate(text, 1):
+            raw = raw.rstrip('\r\n')
+            if not raw.strip() or raw[:1] != 'D':
+                continue
+            fields = {name: raw[start:end] for name, (start, end) in FIXED_WIDTH_LAYOUT.items()}
+            yield _bank_line(line_number, raw, fields, amount_in_cents=True)
+        return
+    
+    reader = csv.reader(text)
+    header = [name.strip().lower() for name in next(reader, [])]
+    columns = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+    missing = {'payment_reference', 'amount', 'value_date'} - set(columns)
+    if missing:
+        raise ValueError(f'Bank file is missing the columns: {", ".join(sorted(missing))}')
+    
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        fields = {field: row[index] if index < len(row) else '' for field, index in columns.items()}
+        yield _bank_line(reader.line_num, ','.join(row), fields)
+
+def _suspense_row(bank_import, line, reason):
+    return {
+        'bank_import_id': bank_import.id,
+        'line_number': line['line'],
+        'bank_reference': line['bank_reference'],
+        'payment_reference': line['payment_reference'],
+        'amount': line['amount'],
+        'value_date': line['value_date'],
+        'payer_name': line['payer_name'],
+        'reason': reason,
+        'raw_line': line['raw'],
+        'status': 'Unresolved',
+        'created_at': datetime.utcnow(),
+    }
+
+def _post_chunk(bank_import, lines):
+    """
+    Match a chunk of bank lines to tax returns and post them in the current
+    transaction with bulk INSERTs and one set-based UPDATE. Returns
+    (matched_lines, matched_amount, suspense_lines); the caller commits.
+    """
+    # Dict index of the returns quoted in this chunk, loaded with one query
+    references = {}
+    for line in lines:
+        if line['error'] is None and line['payment_reference']:
+            line['payment_reference'] = normalize_reference(line['payment_reference'])
+            references[line['payment_reference']] = None
+    returns = {}
+    if references:
+        returns = {row.reference_number: row for row in db.session.query(
+            TaxReturn.id, TaxReturn.reference_number, TaxReturn.account_id, TaxReturn.tax_type_id,
+            TaxReturn.tax_period_id
+        ).filter(TaxReturn.reference_number.in_(list(references)))}
+    
+    suspense = []
+    matched = []
+    for line in lines:
+        reference = line['payment_reference']
+        if line['error']:
+            suspense.append(_suspense_row(bank_import, line, line['error']))
+        elif not reference:
+            suspense.append(_suspense_row(bank_import, line, 'No payment reference'))
+        elif not is_valid_reference(reference):
+            suspense.append(_suspense_row(bank_import, line, 'Reference fails its check character'))
+        elif reference not in returns:
+            suspense.append(_suspense_row(bank_import, line, 'No tax return with this reference'))
+        elif line['amount'] <= 0:
+            suspense.append(_suspense_row(bank_import, line, 'Amount is not positive'))
+        else:
+            matched.append((line, returns[reference]))
+    
+    if suspense:
+        db.session.execute(SuspensePayment.__table__.insert(), suspense)
+    if not matched:
+        return 0, Decimal('0'), len(suspense)
+    
+    now = datetime.utcnow()
+    payments = [{
+        'tax_return_id': tax_return.id,
+        'amount': line['amount'],
+        'payment_date': datetime.combine(line['value_date'], time()),
+        'payment_method': 'Bank',
+        'reference_number': generate_reference('PMT'),
+        'status': 'Completed',
+        'created_at': now,
+    } for line, tax_return in matched]
+    payment_ids = db.session.execute(
+        db.insert(Payment).returning(Payment.id, sort_by_parameter_order=True), payments
+    ).scalars().all()
+    register_references('payment', [(payment_id, payment['reference_number'])
+                                    for payment_id, payment in zip(payment_ids, payments)])
+    
+    post_ledger_entries([{
+        'account_id': tax_return.account_id,
+        'tax_type_id': tax_return.tax_type_id,
+        'tax_period_id': tax_return.tax_period_id,
+        'transaction_date': line['value_date'],
+        'transaction_type': 'Payment',
+        'description': f'Bank payment for {tax_return.reference_number}',
+        'credit_amount': line['amount'],
+        'reference_number': payment['reference_number'],
+    } for (line, tax_return), payment in zip(matched, payments)])
+    
+    paid = {}
+    rollup = {}
+    for line, tax_return in matched:
+        paid[tax_return.id] = paid.get(tax_return.id, Decimal('0')) + line['amount']
+        bucket = (line['value_date'], tax_return.tax_type_id, 'Bank')
+        amount, count = rollup.get(bucket, (Decimal('0'), 0))
+        rollup[bucket] = (amount + line['amount'], count + 1)
+    db.session.execute(settle_returns_statement(),
+                       [{'return_id': return_id, 'paid': amount} for return_id, amount in paid.items()])
+    apply_payment_totals_to_rollup(rollup)
+    mark_dashboard_metrics_stale()
+    
+    return len(matched), sum(paid.values(), Decimal('0')), len(suspense)
+
+def _claim_bank_import(checksum, filename, file_format, user, resume):
+    """
+    Create the BankImport of a file, or take over its failed import, and mark it
+    Running. Both steps are single statements, so of two uploads of the same
+    file only one claims it; the other gets a ValueError.
+    """
+    values = {'filename': filename, 'file_format': file_format, 'checksum': checksum, 'status': 'Running',
+              'imported_by': user.id if user else None}
+    insert = dialect_insert(BankImport.__table__)
+    if insert is not None:
+        inserted = db.session.execute(insert.values(**values).on_conflict_do_nothing(index_elements=['checksum'])).rowcount
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(BankImport.__table__.insert().values(**values))
+            inserted = 1
+        except IntegrityError:
+            inserted = 0
+    
+    claimable = BankImport.status != 'Completed' if resume else BankImport.status == 'Failed'
+    claimed = inserted or db.session.execute(db.update(BankImport).where(
+        BankImport.checksum == checksum, claimable
+    ).values(status='Running', last_error=None)).rowcount
+    bank_import = BankImport.query.filter_by(checksum=checksum).populate_existing().one()
+    db.session.commit()
+    
+    if not claimed:
+        if bank_import.status == 'Completed':
+            raise ValueError(f'This file was already imported on {bank_import.completed_at:%Y-%m-%d %H:%M}')
+        raise ValueError('This file is already being imported')
+    return bank_import
+
+def import_bank_file(stream, filename, file_format, user=None, chunk_size=BANK_IMPORT_CHUNK_SIZE, resume=False):
+    """
+    Post a bank settlement file, committing every chunk_size lines. stream is a
+    seekable binary file. A file is identified by its checksum and imports once:
+    a completed file is refused, and a failed import resumes after the last
+    committed line. resume=True also takes over an import left Running by a
+    crashed process. Returns the BankImport record.
+    """
+    if file_format not in BANK_FILE_FORMATS:
+        raise ValueError(f'Unknown bank file format: {file_format}')
+    
+    checksum = file_checksum(stream)
+    bank_import = _claim_bank_import(checksum, filename, file_format, user, resume)
+    
+    # Lines up to total_lines were committed by an earlier, interrupted run
+    skip = bank_import.total_lines
+    chunk = []
+    
+    def post(chunk):
+        matched, amount, suspense = _post_chunk(bank_import, chunk)
+        bank_import.total_lines += len(chunk)
+        bank_import.matched_lines += matched
+        bank_import.matched_amount = (bank_import.matched_amount or 0) + amount
+        bank_import.suspense_lines += suspense
+        db.session.commit()
+    
+    try:
+        for position, line in enumerate(parse_bank_file(stream, file_format)):
+            if position < skip:
+                continue
+            chunk.append(line)
+            if len(chunk) >= chunk_size:
+                post(chunk)
+                chunk = []
+        if chunk:
+            post(chunk)
+    except Exception as e:
+        db.session.rollback()
+        bank_import.status = 'Failed'
+        bank_import.last_error = str(e)[:2000]
+        db.session.commit()
+        return bank_import
+    
+    bank_import.status = 'Completed'
+    bank_import.completed_at = datetime.utcnow()
+    db.session.commit()
+    return bank_import
@@ -0,0 +1,250 @@
+from app import db
+from app.models.user import Account
+from app.models.tax import TaxType, TaxPeriod, TaxReturn
+from app.models.functionality import Notification
+from app.services.tax_service import return_flag_reasons
+from app.services.flagging_service import latest_refund_amounts
+from app.services.ledger_service import post_ledger_entries
+from app.services.reference_service import generate_reference, register_references
+from app.services.dashboard_service import mark_dashboard_metrics_stale
+from app.services.notification_service import broadcast_notification
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+import csv
+import io
+import json
+
+# Returns validated, inserted and committed together
+BULK_FILING_CHUNK_SIZE = 500
+
+# Statuses of a return that has been filed for its period
+FILED_RETURN_STATUSES = ('Filed', 'Assessed', 'Finalized')
+
+def parse_filing_file(stream, filename=''):
+    """
+    Yield filing rows as dicts from an uploaded CSV or JSON file. CSV files need a
+    header row; JSON files hold a list of objects or {"returns": [...]}.
+    Recognised fields: account_id or account_number, tax_type_id or tax_type
+    (code), period_id or period_code, and amount.
+    """
+    if filename.lower().endswith('.json'):
+        yield from parse_filing_json(json.load(stream))
+        return
+    
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    for row in csv.DictReader(text):
+        yield {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+
+def parse_filing_json(data):
+    """Return the filing rows of a decoded JSON batch"""
+    if isinstance(data, dict):
+        data = data.get('returns')
+    if not isinstance(data, list):
+        raise ValueError('Expected a list of returns')
+    return [row if isinstance(row, dict) else {} for row in data]
+
+class FilingLookups:
+    """
+    Tax types and periods loaded once per batch, and accounts fetched per chunk
+    with one query and kept for the rest of the batch
+    """
+    
+    def __init__(self, user, allowed_account_ids=None):
+        self.user = user
+        self.allowed_account_ids = allowed_account_ids  # None when the user may file for any account
+        self.tax_types = {}
+        for tax_type in TaxType.query.all():
+            self.tax_types[str(tax_type.id)] = tax_type
+            self.tax_types[tax_type.code.upper()] = tax_type
+        self.periods = {}
+        for period in TaxPeriod.query.all():
+            self.periods[(period.tax_type_id, str(period.id))] = period
+            self.periods[(period.tax_type_id, period.period_code.upper())] = period
+        self.accounts = {}
+    
+    def load_accounts(self, rows):
+        ids = {str(row.get('account_id')) for row in rows if row.get('account_id')} - set(self.accounts)
+        numbers = {str(row.get('account_number')) for row in rows if row.get('account_number')} - set(self.accounts)
+        int_ids = [int(value) for value in ids if value.isdigit()]
+        if not int_ids and not numbers:
+            return
+        for account in Account.query.filter(db.or_(Account.id.in_(int_ids), Account.account_number.in_(numbers))):
+            self.accounts[str(account.id)] = account
+            self.accounts[account.account_number] = account
+    
+    def account(self, row):
+        key = row.get('account_id') or row.get('account_number')
+        return self.accounts.get(str(key)) if key else None
+    
+    def tax_type(self, row):
+        key = row.get('tax_type_id') or row.get('tax_type') or row.get('tax_type_code')
+        return self.tax_types.get(str(key).upper()) if key else None
+    
+    def period(self, row, tax_type):
+        key = row.get('period_id') or row.get('period_code') or row.get('period')
+        return self.periods.get((tax_type.id, str(key).upper())) if key else None
+
+def validate_filing_row(row, lookups):
+    """Return (values, errors) for one filing row"""
+    errors = []
+    account = lookups.account(row)
+    if account is None:
+        errors.append('Unknown account')
+    elif lookups.allowed_account_ids is not None and account.id not in lookups.allowed_account_ids:
+        errors.append('You may not file returns for this account')
+    
+    tax_type = lookups.tax_type(row)
+    period = None
+    if tax_type is None:
+        errors.append('Unknown tax type')
+    else:
+        period = lookups.period(row, tax_type)
+        if period is None:
+            errors.append('Unknown tax period for this tax type')
+    
+    amount = None
+    try:
+        amount = Decimal(str(row.get('amount')).replace(',', '')).quantize(Decimal('0.01'))
+        if amount < 0 or not amount.is_finite():
+            errors.append('Amount must not be negative')
+    except (InvalidOperation, ValueError):
+        errors.append('Amount is not a number')
+    
+    if errors:
+        return None, errors
+    return {'account': account, 'tax_type': tax_type, 'period': period, 'amount': amount}, []
+
+def _already_filed(keys):
+    """The (account_id, tax_type_id, tax_period_id) keys that already have a filed return"""
+    if not keys:
+        return set()
+    return set(db.session.query(TaxReturn.account_id, TaxReturn.tax_type_id, TaxReturn.tax_period_id).filter(
+        db.tuple_(TaxReturn.account_id, TaxReturn.tax_type_id, TaxReturn.tax_period_id).in_(list(keys)),
+        TaxReturn.status.in_(FILED_RETURN_STATUSES)
+    ).all())
+
+def _file_chunk(numbered_rows, lookups, seen_keys):
+    """
+    Validate and file one chunk of (row_number, row) pairs in the current
+    transaction. Returns the per-row results; the caller commits.
+    """
+    lookups.load_accounts([row for number, row in numbered_rows])
+    
+    results = []
+    valid = []
+    for number, row in numbered_rows:
+        values, errors = validate_filing_row(row, lookups)
+        if values:
+            key = (values['account'].id, values['tax_type'].id, values['period'].id)
+            if key in seen_keys:
+                errors = ['Duplicate of an earlier row in this batch']
+            else:
+                seen_keys.add(key)
+                valid.append((number, key, values))
+        results.append({'row': number, 'status': 'Rejected' if errors else 'Filed', 'errors': errors})
+    
+    # Returns already on file are rejected so a re-uploaded batch files nothing twice
+    filed = _already_filed({key for number, key, values in valid})
+    refunds = latest_refund_amounts({key[0] for number, key, values in valid})
+    by_row = {result['row']: result for result in results}
+    
+    now = datetime.utcnow()
+    returns = []
+    for number, key, values in valid:
+        if key in filed:
+            by_row[number].update(status='Rejected', errors=['A return has already been filed for this period'])
+            continue
+        reasons = return_flag_reasons(values['amount'], now, values['period'].due_date, refunds.get(key[0]), key[0])
+        returns.append((number, values, {
+            'account_id': key[0],
+            'tax_type_id': key[1],
+            'tax_period_id': key[2],
+            'filing_date': now,
+            'due_amount': values['amount'],
+            'status': 'Filed',
+            'assessment_type': 'Self',
+            'reference_number': generate_reference('TX'),
+            'is_flagged': bool(reasons),
+            'flag_reason': '; '.join(reasons) or None,
+            'created_at': now,
+        }))
+    if not returns:
+        return results
+    
+    return_ids = db.session.execute(
+        db.insert(TaxReturn).returning(TaxReturn.id, sort_by_parameter_order=True),
+        [row for number, values, row in returns]
+    ).scalars().all()
+    register_references('tax_return', [(return_id, row['reference_number'])
+                                       for return_id, (number, values, row) in zip(return_ids, returns)])
+    post_ledger_entries([{
+        'account_id': row['account_id'],
+        'tax_type_id': row['tax_type_id'],
+        'tax_period_id': row['tax_period_id'],
+        'transaction_type': 'Assessment',
+        'description': f'Self-assessment for {values["tax_type"].name}',
+        'debit_amount': row['due_amount'],
+        'reference_number': row['reference_number'],
+    } for number, values, row in returns])
+    mark_dashboard_metrics_stale()
+    
+    for return_id, (number, values, row) in zip(return_ids, returns):
+        by_row[number].update(tax_return_id=return_id, reference_number=row['reference_number'],
+                              amount=str(row['due_amount']), flagged=row['is_flagged'])
+    return results
+
+def _file_chunk_committed(chunk, lookups, seen_keys):
+    """_file_chunk in its own transaction; database errors fail the chunk's rows"""
+    try:
+        results = _file_chunk(chunk, lookups, seen_keys)
+        db.session.commit()
+        return results
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        error = f'Could not be saved: {e.__class__.__name__}'
+        return [{'row': number, 'status': 'Failed', 'errors': [error]} for number, row in chunk]
+
+def bulk_file_returns(rows, user, allowed_account_ids=None, chunk_size=BULK_FILING_CHUNK_SIZE):
+    """
+    File a batch of tax returns for user, committing every chunk_size rows in one
+    transaction. rows is any iterable of dicts (see parse_filing_file). A chunk
+    that fails in the database is rolled back and its valid rows reported as
+    Failed; other chunks are unaffected. Returns a report with per-row results.
+    """
+    lookups = FilingLookups(user, allowed_account_ids)
+    seen_keys = set()
+    results = []
+    
+    chunk = []
+    for number, row in enumerate(rows, 1):
+        chunk.append((number, row))
+        if len(chunk) >= chunk_size:
+            results.extend(_file_chunk_committed(chunk, lookups, seen_keys))
+            chunk = []
+    if chunk:
+        results.extend(_file_chunk_committed(chunk, lookups, seen_keys))
+    
+    filed = [result for result in results if result['status'] == 'Filed']
+    if filed:
+        total = sum(Decimal(result['amount']) for result in filed)
+        db.session.add(Notification(
+            user_id=user.id,
+            title="Tax Returns Filed",
+            message=f"{len(filed)} tax returns were filed in a bulk submission. Total amount due: ${total}.",
+            notification_type='Tax'
+        ))
+        broadcast_notification(
+            'admins',
+            title="Bulk Tax Returns Filed",
+            message=f"{user.username} filed {len(filed)} tax returns in a bulk submission. Total amount: ${total}."
+        )
+        db.session.commit()
+    
+    return {
+        'total': len(results),
+        'filed': len(filed),
+        'rejected': sum(1 for result in results if result['status'] == 'Rejected'),
+        'failed': sum(1 for result in results if result['status'] == 'Failed'),
+        'results': results,
+    }
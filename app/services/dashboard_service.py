@@ -0,0 +1,148 @@
+from app import db
+from app.models.tax import TaxType, TaxReturn, Payment
+from app.services.reporting_service import (get_revenue_by_tax_type, get_monthly_revenue, rolling_months_start,
+                                            compliance_by_tax_type, compliance_rate)
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+import threading
+import time
+
+class InMemoryCacheBackend:
+    """
+    Process-local cache backend. Any object with the same get(key),
+    set(key, value, ttl) and delete(key) methods can be configured instead
+    through DASHBOARD_METRICS_CACHE_BACKEND, e.g. a wrapper around a shared cache.
+    """
+    
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+    
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class DashboardMetrics:
+    """
+    The revenue, monthly trend and compliance bundle shown on the staff analytics
+    and reporting dashboards over a rolling year. The bundle is computed once and
+    cached for DASHBOARD_METRICS_CACHE_TTL seconds (0 disables caching); committed
+    changes to payments or tax returns invalidate it.
+    """
+    
+    KEY_PREFIX = 'dashboard_metrics'
+    
+    def __init__(self, backend=None):
+        self._default_backend = backend or InMemoryCacheBackend()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def backend(self):
+        if has_app_context():
+            return current_app.config.get('DASHBOARD_METRICS_CACHE_BACKEND') or self._default_backend
+        return self._default_backend
+    
+    def _key(self, end_date):
+        # The rolling window moves daily, so each day gets its own entry
+        return f'{self.KEY_PREFIX}:{end_date.isoformat()}'
+    
+    def get(self):
+        """Return the cached metrics bundle, computing and caching it on a miss"""
+        end_date = datetime.utcnow().date()
+        ttl = current_app.config.get('DASHBOARD_METRICS_CACHE_TTL', 0)
+    
+        bundle = self.backend.get(self._key(end_date)) if ttl else None
+        with self._lock:
+            if bundle is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if bundle is not None:
+            return bundle
+    
+        bundle = self.compute(end_date)
+        if ttl:
+            self.backend.set(self._key(end_date), bundle, ttl)
+        return bundle
+    
+    def invalidate(self):
+        """Drop the cached bundle so the next request recomputes it"""
+        self.backend.delete(self._key(datetime.utcnow().date()))
+    
+    def stats(self):
+        """Return the cache hit and miss counters for this process"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+    
+    @staticmethod
+    def compute(end_date):
+        """Compute the metrics bundle for the year ending on end_date"""
+        start_date = end_date - timedelta(days=365)
+        tax_types = TaxType.query.all()
+    
+        # Tax collection by type, read from the daily revenue rollup
+        revenue_by_type = {r.tax_type_id: r.total_amount for r in get_revenue_by_tax_type(start_date, end_date)}
+        tax_collection_data = [{
+            'name': tax_type.name,
+            'amount': float(revenue_by_type.get(tax_type.id) or 0),
+            'is_core': tax_type.is_core
+        } for tax_type in tax_types]
+    
+        # Return filing compliance, all tax types from one grouped query
+        compliance_counts = compliance_by_tax_type(positive_due_only=True)
+        compliance_data = []
+        for tax_type in tax_types:
+            counts = compliance_counts.get(tax_type.id, {})
+            compliance_data.append({
+                'name': tax_type.name,
+                'compliance_rate': compliance_rate(counts.get('filed_returns', 0), counts.get('total_returns', 0))
+            })
+    
+        return {
+            'tax_collection_data': tax_collection_data,
+            # Monthly collection trend over the last 12 calendar months, oldest to newest
+            'monthly_trend': get_monthly_revenue(rolling_months_start(end_date), end_date),
+            'compliance_data': compliance_data
+        }
+
+dashboard_metrics = DashboardMetrics()
+
+# Invalidate once the transaction that changed payments or returns commits, so a
+# concurrent request cannot re-cache the bundle from the uncommitted state
+@event.listens_for(Session, 'after_flush')
+def _mark_dashboard_metrics_stale(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instance, (Payment, TaxReturn)):
+            session.info['dashboard_metrics_stale'] = True
+            return
+
+def mark_dashboard_metrics_stale(session=None):
+    """Invalidate the dashboard metrics when session commits, for bulk writes that bypass the ORM"""
+    (session or db.session).info['dashboard_metrics_stale'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_dashboard_metrics(session):
+    if session.info.pop('dashboard_metrics_stale', False):
+        dashboard_metrics.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_metrics_mark(session):
+    session.info.pop('dashboard_metrics_stale', None)
@@ -0,0 +1,176 @@
+from app import db
+from flask import current_app, request
+from sqlalchemy.sql import operators
+from datetime import datetime, date
+from decimal import Decimal
+import base64
+import json
+
+def dialect_insert(table):
+    """
+    Return an INSERT construct that supports ON CONFLICT for the bound database,
+    or None when the dialect has no upsert support.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+def _encode_cursor_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'n': str(value)}
+    return value
+
+def _decode_cursor_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        if 'n' in value:
+            return Decimal(value['n'])
+    return value
+
+def encode_cursor(values):
+    """Encode the sort key of a row as an opaque, URL-safe cursor"""
+    payload = json.dumps([_encode_cursor_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor made by encode_cursor, or return None if it is malformed"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(payload)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    return [_decode_cursor_value(value) for value in values]
+
+def _seek_condition(columns, values):
+    """
+    WHERE clause selecting rows strictly after values in the given (column, descending)
+    order. Uniform directions use a row-value comparison that can seek an index.
+    """
+    if len({descending for column, descending in columns}) == 1:
+        row = db.tuple_(*[column for column, descending in columns])
+        key = db.tuple_(*[db.literal(value) for value in values])
+        return row < key if columns[0][1] else row > key
+    
+    clauses = []
+    for i, (column, descending) in enumerate(columns):
+        equal_prefix = [prefix == value for (prefix, d), value in zip(columns[:i], values[:i])]
+        clauses.append(db.and_(*equal_prefix, column < values[i] if descending else column > values[i]))
+    return db.or_(*clauses)
+
+def approximate_count(query):
+    """
+    Estimate the number of rows a query returns. On PostgreSQL this reads the
+    planner estimate from EXPLAIN instead of running COUNT(*); other databases
+    get an exact count.
+    """
+    query = query.order_by(None)
+    if db.engine.dialect.name != 'postgresql':
+        return query.count()
+    
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        f'EXPLAIN (FORMAT JSON) {compiled.string}', compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+class KeysetPage:
+    """One page of a keyset-paginated listing"""
+    
+    def __init__(self, items, per_page, has_next, has_prev, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total  # Approximate, only when requested
+    
+    def __iter__(self):
+        return iter(self.items)
+
+def keyset_paginate(query, order_by, per_page=20, after=None, before=None, with_count=False):
+    """
+    Paginate a model query by seeking past the sort key of the previous page
+    instead of using OFFSET, so every page costs the same however deep it is.
+    
+    order_by is a list of columns or column.desc() expressions; the entity's
+    primary key is appended as a tie-breaker in the direction of the last column.
+    The sort columns should be non-nullable. after/before are cursors taken from
+    a previous page's next_cursor/prev_cursor. with_count adds an approximate total.
+    """
+    columns = []
+    for clause in order_by:
+        modifier = getattr(clause, 'modifier', None)
+        if modifier in (operators.asc_op, operators.desc_op):
+            columns.append((clause.element, modifier is operators.desc_op))
+        else:
+            columns.append((clause, False))
+    
+    entity = query.column_descriptions[0]['entity']
+    primary_key = db.inspect(entity).primary_key[0]
+    if not any(column.key == primary_key.key for column, descending in columns):
+        columns.append((getattr(entity, primary_key.key), columns[-1][1] if columns else False))
+    
+    total = approximate_count(query) if with_count else None
+    
+    backwards = before is not None and after is None
+    values = decode_cursor(before if backwards else after) if (after or before) else None
+    if values is not None and len(values) != len(columns):
+        values = None
+    
+    # Walking backwards reverses every direction, then restores display order
+    seek_columns = [(column, descending != backwards) for column, descending in columns]
+    if values is not None:
+        query = query.filter(_seek_condition(seek_columns, values))
+    query = query.order_by(None).order_by(*[column.desc() if descending else column.asc()
+                                            for column, descending in seek_columns])
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    
+    def cursor_for(item):
+        return encode_cursor([getattr(item, column.key) for column, descending in columns])
+    
+    if backwards and values is not None:
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, values is not None
+    return KeysetPage(
+        items=rows,
+        per_page=per_page,
+        has_next=has_next and bool(rows),
+        has_prev=has_prev and bool(rows),
+        next_cursor=cursor_for(rows[-1]) if rows else None,
+        prev_cursor=cursor_for(rows[0]) if rows else None,
+        total=total
+    )
+
+def keyset_paginate_request(query, order_by, per_page=20):
+    """
+    keyset_paginate with the after/before cursors of the current request. The
+    approximate total is included when LISTING_APPROXIMATE_COUNT is enabled.
+    """
+    return keyset_paginate(
+        query, order_by, per_page=per_page,
+        after=request.args.get('after') or None,
+        before=request.args.get('before') or None,
+        with_count=current_app.config.get('LISTING_APPROXIMATE_COUNT', False)
+    )
@@ -0,0 +1,244 @@
+from app import db
+from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund
+from app.models.process import Audit
+from app.models.registration import Registration, TaxpayerLedger
+from xml.sax.saxutils import escape
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import csv
+import io
+import zipfile
+
+# Rows fetched per round trip; queries run with a server-side cursor where the driver supports it
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+def _day_range(query, column, start_date, end_date):
+    """Filter a datetime column to the calendar days start_date..end_date inclusive"""
+    return query.filter(column >= start_date, column < end_date + timedelta(days=1))
+
+def _refund_tax_type_filter(query, tax_type_id):
+    # Refunds are not tied to a tax type; match them through the account's returns as the refund report does
+    account_ids = db.select(TaxReturn.account_id).where(TaxReturn.tax_type_id == tax_type_id)
+    return query.filter(Refund.account_id.in_(account_ids))
+
+def _payments_export(start_date, end_date, tax_type_id=None):
+    query = db.session.query(
+        Payment.reference_number, Payment.payment_date, Payment.payment_method, Payment.amount,
+        TaxType.code, TaxReturn.reference_number, TaxReturn.account_id
+    ).join(TaxReturn, Payment.tax_return_id == TaxReturn.id
+    ).join(TaxType, TaxReturn.tax_type_id == TaxType.id
+    ).filter(Payment.status == 'Completed')
+    query = _day_range(query, Payment.payment_date, start_date, end_date)
+    if tax_type_id:
+        query = query.filter(TaxReturn.tax_type_id == tax_type_id)
+    header = ['Payment Reference', 'Payment Date', 'Method', 'Amount', 'Tax Type', 'Return Reference', 'Account ID']
+    return header, query.order_by(Payment.payment_date, Payment.id)
+
+def _compliance_export(start_date, end_date, tax_type_id=None):
+    paid = db.session.query(
+        Payment.tax_return_id.label('tax_return_id'),
+        db.func.sum(Payment.amount).label('paid_amount')
+    ).filter(Payment.status == 'Completed').group_by(Payment.tax_return_id).subquery()
+    
+    query = db.session.query(
+        TaxReturn.reference_number, TaxType.code, TaxPeriod.period_code, TaxPeriod.due_date,
+        TaxReturn.filing_date, TaxReturn.status, TaxReturn.due_amount,
+        db.func.coalesce(paid.c.paid_amount, 0), TaxReturn.account_id
+    ).join(TaxPeriod, TaxReturn.tax_period_id == TaxPeriod.id
+    ).join(TaxType, TaxReturn.tax_type_id == TaxType.id
+    ).outerjoin(paid, paid.c.tax_return_id == TaxReturn.id
+    ).filter(TaxPeriod.due_date.between(start_date, end_date))
+    if tax_type_id:
+        query = query.filter(TaxReturn.tax_type_id == tax_type_id)
+    header = ['Return Reference', 'Tax Type', 'Period', 'Due Date', 'Filing Date', 'Status', 'Due Amount',
+              'Paid Amount', 'Account ID']
+    return header, query.order_by(TaxPeriod.due_date, TaxReturn.id)
+
+def _registration_export(start_date, end_date, tax_type_id=None):
+    query = db.session.query(
+        Registration.registration_number, Registration.registration_type, Registration.status,
+        Registration.registered_date, Registration.expiry_date, Registration.account_id
+    ).filter(Registration.registered_date.between(start_date, end_date))
+    header = ['Registration Number', 'Type', 'Status', 'Registered Date', 'Expiry Date', 'Account ID']
+    return header, query.order_by(Registration.registered_date, Registration.id)
+
+def _audit_export(start_date, end_date, tax_type_id=None):
+    query = db.session.query(
+        Audit.reference_number, TaxType.code, Audit.audit_type, Audit.status, Audit.start_date,
+        Audit.end_date, Audit.outcome, Audit.additional_assessment, Audit.account_id
+    ).join(TaxType, Audit.tax_type_id == TaxType.id
+    ).filter(Audit.start_date.between(start_date, end_date))
+    if tax_type_id:
+        query = query.filter(Audit.tax_type_id == tax_type_id)
+    header = ['Audit Reference', 'Tax Type', 'Audit Type', 'Status', 'Start Date', 'End Date', 'Outcome',
+              'Additional Assessment', 'Account ID']
+    return header, query.order_by(Audit.start_date, Audit.id)
+
+def _refund_export(start_date, end_date, tax_type_id=None):
+    query = db.session.query(
+        Refund.reference_number, Refund.request_date, Refund.status, Refund.amount,
+        Refund.approval_date, Refund.payment_date, Refund.account_id
+    )
+    query = _day_range(query, Refund.request_date, start_date, end_date)
+    if tax_type_id:
+        query = _refund_tax_type_filter(query, tax_type_id)
+    header = ['Refund Reference', 'Request Date', 'Status', 'Amount', 'Approval Date', 'Payment Date', 'Account ID']
+    return header, query.order_by(Refund.request_date, Refund.id)
+
+def _revenue_export(start_date, end_date, tax_type_id=None):
+    # The revenue report covers all tax types, so the export ignores tax_type_id as well
+    return _payments_export(start_date, end_date)
+
+REPORT_EXPORTS = {
+    'tax_collection': _payments_export,
+    'compliance': _compliance_export,
+    'registration': _registration_export,
+    'audit': _audit_export,
+    'refund': _refund_export,
+    'revenue': _revenue_export,
+}
+
+def report_export_rows(report_type, start_date, end_date, tax_type_id=None):
+    """
+    Return (header, rows) with the underlying records of a generated report, or
+    None for an unknown report type. rows is a lazy iterator fetched in batches.
+    """
+    export = REPORT_EXPORTS.get(report_type)
+    if export is None:
+        return None
+    header, query = export(start_date, end_date, tax_type_id)
+    return header, query.yield_per(EXPORT_BATCH_SIZE)
+
+def ledger_export_rows(account_id, start_date, end_date, tax_type_id=None):
+    """Return (header, rows) for an account's taxpayer ledger, oldest entry first"""
+    query = db.session.query(
+        TaxpayerLedger.transaction_date, TaxType.code, TaxpayerLedger.transaction_type,
+        TaxpayerLedger.description, TaxpayerLedger.reference_number, TaxpayerLedger.debit_amount,
+        TaxpayerLedger.credit_amount, TaxpayerLedger.balance
+    ).join(TaxType, TaxpayerLedger.tax_type_id == TaxType.id
+    ).filter(
+        TaxpayerLedger.account_id == account_id,
+        TaxpayerLedger.transaction_date >= start_date,
+        TaxpayerLedger.transaction_date <= end_date
+    )
+    if tax_type_id:
+        query = query.filter(TaxpayerLedger.tax_type_id == tax_type_id)
+    header = ['Date', 'Tax Type', 'Transaction', 'Description', 'Reference', 'Debit', 'Credit', 'Balance']
+    query = query.order_by(TaxpayerLedger.transaction_date, TaxpayerLedger.id)
+    return header, query.yield_per(EXPORT_BATCH_SIZE)
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def stream_csv(header, rows, batch_size=EXPORT_BATCH_SIZE):
+    """Yield UTF-8 CSV chunks of about batch_size rows each"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_cell_text(value) for value in row])
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+class _ChunkSink(io.RawIOBase):
+    """Unseekable file object collecting what zipfile writes, drained between rows"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    ),
+}
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_cell_text(value))}</t></is></c>'
+
+def stream_xlsx(header, rows, sheet_name='Export', batch_size=EXPORT_BATCH_SIZE):
+    """
+    Yield an XLSX workbook with a single sheet as it is built. Cells are written
+    as inline strings and numbers straight into the zip stream, so memory use
+    does not grow with the number of rows.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        workbook.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield sink.drain()
+    
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                '<row>' + ''.join(_xlsx_cell(str(title)) for title in header) + '</row>'
+            ).encode('utf-8'))
+            for count, row in enumerate(rows, 1):
+                sheet.write(('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode('utf-8'))
+                if count % batch_size == 0:
+                    yield sink.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.drain()
+
+def stream_export(export_format, header, rows, sheet_name='Export'):
+    """Return the chunk generator for an export format ('csv' or 'xlsx')"""
+    if export_format == 'xlsx':
+        return stream_xlsx(header, rows, sheet_name=sheet_name)
+    return stream_csv(header, rows)
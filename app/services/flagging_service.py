@@ -0,0 +1,198 @@
+from app import db
+from app.models.tax import TaxPeriod, TaxReturn, Payment, Refund
+from app.models.registration import TaxpayerLedger
+from decimal import Decimal
+
+# Rule name -> evaluate(chunk); chunk maps column names to equal-length lists and
+# evaluate returns one reason (or None) per row. Rules run in registration order.
+FLAG_RULES = {}
+
+# Rule name -> the fixed start of every reason it gives, so the reasons stored in
+# flag_reason can be traced back to their rule when only some rules are re-run
+FLAG_RULE_PREFIXES = {}
+
+# Columns every chunk carries, one list per column. assessed_amount is the liability
+# the return was assessed for, not its remaining due amount, which payments reduce.
+CHUNK_COLUMNS = ('id', 'account_id', 'assessed_amount', 'filing_date', 'period_due_date', 'recent_refund_amount')
+
+# Only filed returns are flagged; drafts are evaluated when they are filed
+FLAGGED_RETURN_STATUSES = ('Filed', 'Assessed', 'Finalized')
+
+def flag_rule(name, reason_prefix):
+    """Decorator registering a rule function under name; its reasons start with reason_prefix"""
+    def register(evaluate):
+        FLAG_RULES[name] = evaluate
+        FLAG_RULE_PREFIXES[name] = reason_prefix
+        return evaluate
+    return register
+
+def _to_decimal(value):
+    return None if value is None else Decimal(str(value))
+
+def build_chunk(rows):
+    """Turn row tuples in CHUNK_COLUMNS order into a columnar chunk"""
+    columns = list(zip(*rows)) if rows else [()] * len(CHUNK_COLUMNS)
+    chunk = dict(zip(CHUNK_COLUMNS, (list(column) for column in columns)))
+    chunk['assessed_amount'] = [_to_decimal(value) for value in chunk['assessed_amount']]
+    chunk['recent_refund_amount'] = [_to_decimal(value) for value in chunk['recent_refund_amount']]
+    return chunk
+
+@flag_rule('non_positive_due', 'Due amount is zero or negative')
+def _non_positive_due(chunk):
+    return ["Due amount is zero or negative." if due is None or due <= 0 else None
+            for due in chunk['assessed_amount']]
+
+@flag_rule('excessive_refund', 'Recent refund (')
+def _excessive_refund(chunk):
+    # Refunds above 80% of the amount due
+    return [f"Recent refund ({refund}) exceeds 80% of due amount ({due})."
+            if refund and due and refund > due * Decimal('0.8') else None
+            for due, refund in zip(chunk['assessed_amount'], chunk['recent_refund_amount'])]
+
+@flag_rule('late_filing', 'Return filed after due date')
+def _late_filing(chunk):
+    return ["Return filed after due date." if filed and due_date and filed.date() > due_date else None
+            for filed, due_date in zip(chunk['filing_date'], chunk['period_due_date'])]
+
+def evaluate_flag_rules(chunk, rules=None, counts=None):
+    """
+    Run the rules (all registered rules by default) over a chunk, one rule at a
+    time across all rows. Returns the list of reasons for each row; when counts
+    is given, it is incremented by how many rows each rule fired on.
+    """
+    reasons = [[] for _ in chunk['id']]
+    for name in rules or FLAG_RULES:
+        fired = 0
+        for row_reasons, reason in zip(reasons, FLAG_RULES[name](chunk)):
+            if reason:
+                row_reasons.append(reason)
+                fired += 1
+        if counts is not None:
+            counts[name] = counts.get(name, 0) + fired
+    return reasons
+
+def _reason_rule(reason):
+    return next((name for name, prefix in FLAG_RULE_PREFIXES.items() if reason.startswith(prefix)), None)
+
+def merge_flag_reasons(flag_reason, reasons, rules):
+    """
+    Combine the stored flag_reason of a return with the reasons a subset of the
+    rules just gave: reasons of the rules that were run are replaced, those of
+    the other rules (and any unrecognised text) are kept. Returns the reasons
+    in rule registration order.
+    """
+    by_rule = {name: [] for name in FLAG_RULES}
+    unrecognised = []
+    for reason in flag_reason.split('; ') if flag_reason else []:
+        name = _reason_rule(reason)
+        if name in rules:
+            continue
+        (by_rule[name] if name else unrecognised).append(reason)
+    for reason in reasons:
+        by_rule[_reason_rule(reason)].append(reason)
+    return [reason for name in FLAG_RULES for reason in by_rule[name]] + unrecognised
+
+def latest_refund_amounts(account_ids=None):
+    """Amount of the latest refund of each account (all accounts when account_ids is None)"""
+    latest = db.session.query(
+        Refund.account_id,
+        Refund.amount,
+        db.func.row_number().over(partition_by=Refund.account_id, order_by=Refund.request_date.desc()).label('rn')
+    )
+    if account_ids is not None:
+        if not account_ids:
+            return {}
+        latest = latest.filter(Refund.account_id.in_(account_ids))
+    latest = latest.subquery()
+    return dict(db.session.query(latest.c.account_id, latest.c.amount).filter(latest.c.rn == 1).all())
+
+def assessed_amounts(rows):
+    """
+    Assessed liability of returns given as (id, reference_number, due_amount)
+    rows: their Assessment ledger debits, or for returns assessed without a
+    ledger entry, the due amount plus the Completed payments that reduced it.
+    """
+    references = [row.reference_number for row in rows if row.reference_number]
+    assessed = dict(db.session.query(
+        TaxpayerLedger.reference_number, db.func.sum(TaxpayerLedger.debit_amount)
+    ).filter(
+        TaxpayerLedger.reference_number.in_(references),
+        TaxpayerLedger.transaction_type == 'Assessment'
+    ).group_by(TaxpayerLedger.reference_number).all()) if references else {}
+    
+    unassessed = [row.id for row in rows if row.reference_number not in assessed]
+    paid = dict(db.session.query(Payment.tax_return_id, db.func.sum(Payment.amount)).filter(
+        Payment.tax_return_id.in_(unassessed),
+        Payment.status == 'Completed'
+    ).group_by(Payment.tax_return_id).all()) if unassessed else {}
+    
+    amounts = {}
+    for row in rows:
+        if row.reference_number in assessed:
+            amounts[row.id] = _to_decimal(assessed[row.reference_number])
+        elif row.due_amount is not None or row.id in paid:
+            amounts[row.id] = (_to_decimal(row.due_amount) or Decimal('0')) + (_to_decimal(paid.get(row.id)) or Decimal('0'))
+        else:
+            amounts[row.id] = None
+    return amounts
+
+def _return_chunks(chunk_size, tax_type_id=None):
+    """
+    Yield lists of filed returns in id order, keyset paginated: id, account_id,
+    due_amount, filing_date and the period due date, then the current flag and
+    the reference number.
+    """
+    query = db.session.query(
+        TaxReturn.id, TaxReturn.account_id, TaxReturn.due_amount, TaxReturn.filing_date, TaxPeriod.due_date,
+        TaxReturn.is_flagged, TaxReturn.flag_reason, TaxReturn.reference_number
+    ).outerjoin(TaxPeriod, TaxPeriod.id == TaxReturn.tax_period_id).filter(
+        TaxReturn.status.in_(FLAGGED_RETURN_STATUSES)
+    ).order_by(TaxReturn.id)
+    if tax_type_id:
+        query = query.filter(TaxReturn.tax_type_id == tax_type_id)
+    
+    last_id = 0
+    while True:
+        rows = query.filter(TaxReturn.id > last_id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+def reflag_returns(chunk_size=5000, rules=None, tax_type_id=None, dry_run=False):
+    """
+    Re-evaluate the flag rules over every filed return, chunk by chunk, and
+    write back is_flagged/flag_reason only where they changed, with one bulk
+    UPDATE per chunk. Rules see each return's assessed liability, so payments
+    that since reduced its due amount do not change its flags. The latest
+    refund of every account is loaded once up front. With rules, only their
+    reasons are re-evaluated and the reasons of other rules are left in place.
+    Each chunk is committed so a full run holds no long locks; with dry_run
+    nothing is written.
+    Returns counts of scanned, changed, flagged and unflagged returns and how
+    many returns each rule fired on.
+    """
+    refunds = latest_refund_amounts()
+    stats = {'scanned': 0, 'changed': 0, 'flagged': 0, 'unflagged': 0,
+             'by_rule': {name: 0 for name in rules or FLAG_RULES}}
+    
+    for rows in _return_chunks(chunk_size, tax_type_id):
+        assessed = assessed_amounts(rows)
+        chunk = build_chunk([(row.id, row.account_id, assessed[row.id], row.filing_date, row.due_date,
+                              refunds.get(row.account_id)) for row in rows])
+        changes = []
+        for row, reasons in zip(rows, evaluate_flag_rules(chunk, rules, stats['by_rule'])):
+            if rules:
+                reasons = merge_flag_reasons(row.flag_reason, reasons, rules)
+            flag_reason = '; '.join(reasons) or None
+            if row.is_flagged != bool(reasons) or row.flag_reason != flag_reason:
+                changes.append({'id': row.id, 'is_flagged': bool(reasons), 'flag_reason': flag_reason})
+                stats['flagged' if reasons else 'unflagged'] += 1
+    
+        stats['scanned'] += len(rows)
+        stats['changed'] += len(changes)
+        if changes and not dry_run:
+            db.session.execute(db.update(TaxReturn), changes)
+            db.session.commit()
+    
+    return stats
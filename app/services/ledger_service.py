@@ -0,0 +1,199 @@
+from app import db
+from app.models.registration import TaxpayerLedger, AccountBalance
+from app.services.db_helpers import dialect_insert
+from datetime import datetime
+from decimal import Decimal
+
+
+def _lock_account_balance(account_id, tax_type_id):
+    """
+    Return the balance snapshot for an account and tax type, locked FOR UPDATE.
+    The snapshot row is created on first use without racing a concurrent poster.
+    """
+    query = AccountBalance.query.filter_by(account_id=account_id, tax_type_id=tax_type_id).with_for_update()
+    snapshot = query.first()
+    if snapshot:
+        return snapshot
+    
+    values = {'account_id': account_id, 'tax_type_id': tax_type_id, 'balance': 0, 'updated_at': datetime.utcnow()}
+    stmt = dialect_insert(AccountBalance.__table__)
+    if stmt is not None:
+        db.session.execute(stmt.values(**values).on_conflict_do_nothing(index_elements=['account_id', 'tax_type_id']))
+    else:
+        db.session.add(AccountBalance(**values))
+        db.session.flush()
+    return query.populate_existing().first()
+
+def post_ledger_entry(account_id, tax_type_id, transaction_type, debit_amount=0, credit_amount=0,
+                      tax_period_id=None, description=None, reference_number=None, transaction_date=None):
+    """
+    Add a TaxpayerLedger row carrying the running balance for its account and tax type,
+    and move the account_balances snapshot in the same transaction. The caller commits.
+    """
+    debit_amount = Decimal(str(debit_amount or 0))
+    credit_amount = Decimal(str(credit_amount or 0))
+    
+    # The snapshot row lock serialises postings for one account and tax type
+    snapshot = _lock_account_balance(account_id, tax_type_id)
+    new_balance = Decimal(str(snapshot.balance or 0)) + debit_amount - credit_amount
+    
+    entry = TaxpayerLedger(
+        account_id=account_id,
+        tax_type_id=tax_type_id,
+        tax_period_id=tax_period_id,
+        transaction_date=transaction_date or datetime.utcnow().date(),
+        transaction_type=transaction_type,
+        description=description,
+        debit_amount=debit_amount,
+        credit_amount=credit_amount,
+        balance=new_balance,
+        reference_number=reference_number
+    )
+    db.session.add(entry)
+    db.session.flush()
+    
+    snapshot.balance = new_balance
+    snapshot.last_ledger_id = entry.id
+    snapshot.updated_at = datetime.utcnow()
+    
+    return entry
+
+def _lock_account_balances(keys):
+    """
+    Return {(account_id, tax_type_id): snapshot} for many keys, creating missing
+    snapshot rows and locking all of them FOR UPDATE in key order so that
+    concurrent batches cannot deadlock.
+    """
+    keys = sorted(set(keys))
+    query = AccountBalance.query.filter(
+        db.tuple_(AccountBalance.account_id, AccountBalance.tax_type_id).in_(keys)
+    ).order_by(AccountBalance.account_id, AccountBalance.tax_type_id).with_for_update()
+    snapshots = {(s.account_id, s.tax_type_id): s for s in query.all()}
+    missing = [key for key in keys if key not in snapshots]
+    if not missing:
+        return snapshots
+    
+    now = datetime.utcnow()
+    rows = [{'account_id': account_id, 'tax_type_id': tax_type_id, 'balance': 0, 'updated_at': now}
+            for account_id, tax_type_id in missing]
+    stmt = dialect_insert(AccountBalance.__table__)
+    if stmt is not None:
+        db.session.execute(stmt.values(rows).on_conflict_do_nothing(index_elements=['account_id', 'tax_type_id']))
+    else:
+        db.session.add_all([AccountBalance(**row) for row in rows])
+        db.session.flush()
+    return {(s.account_id, s.tax_type_id): s for s in query.populate_existing().all()}
+
+def post_ledger_entries(entries):
+    """
+    Bulk form of post_ledger_entry. entries is a list of dicts with the keyword
+    arguments of post_ledger_entry; they are posted in order, each carrying its
+    running balance, with one multi-row INSERT and one lock query for all the
+    balance snapshots involved. Returns the new ledger ids; the caller commits.
+    """
+    if not entries:
+        return []
+    
+    snapshots = _lock_account_balances((entry['account_id'], entry['tax_type_id']) for entry in entries)
+    balances = {key: Decimal(str(snapshot.balance or 0)) for key, snapshot in snapshots.items()}
+    today = datetime.utcnow().date()
+    now = datetime.utcnow()
+    
+    rows = []
+    for entry in entries:
+        key = (entry['account_id'], entry['tax_type_id'])
+        debit_amount = Decimal(str(entry.get('debit_amount') or 0))
+        credit_amount = Decimal(str(entry.get('credit_amount') or 0))
+        balances[key] += debit_amount - credit_amount
+        rows.append({
+            'account_id': entry['account_id'],
+            'tax_type_id': entry['tax_type_id'],
+            'tax_period_id': entry.get('tax_period_id'),
+            'transaction_date': entry.get('transaction_date') or today,
+            'transaction_type': entry['transaction_type'],
+            'description': entry.get('description'),
+            'debit_amount': debit_amount,
+            'credit_amount': credit_amount,
+            'balance': balances[key],
+            'reference_number': entry.get('reference_number'),
+            'created_at': now,
+        })
+    
+    ledger_ids = db.session.execute(
+        db.insert(TaxpayerLedger).returning(TaxpayerLedger.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    
+    last_ids = {}
+    for row, ledger_id in zip(rows, ledger_ids):
+        last_ids[(row['account_id'], row['tax_type_id'])] = ledger_id
+    for key, snapshot in snapshots.items():
+        if key in last_ids:
+            snapshot.balance = balances[key]
+            snapshot.last_ledger_id = last_ids[key]
+            snapshot.updated_at = now
+    
+    return ledger_ids
+
+def get_balance(account_id, tax_type_id=None):
+    """
+    Read the current balance (debits minus credits) from the snapshot table,
+    for one tax type or summed over all of the account's tax types
+    """
+    if tax_type_id:
+        balance = db.session.query(AccountBalance.balance).filter_by(
+            account_id=account_id,
+            tax_type_id=tax_type_id
+        ).scalar()
+    else:
+        balance = db.session.query(db.func.sum(AccountBalance.balance)).filter_by(account_id=account_id).scalar()
+    return balance or Decimal('0')
+
+def verify_balances(fix=False):
+    """
+    Recompute running balances from ledger debits and credits and report drift.
+    Returns (row_drift, snapshot_drift): ledger rows whose stored balance differs
+    from the recomputed running balance, and (account_id, tax_type_id, stored,
+    expected) tuples for snapshots. With fix=True both are rewritten; the caller commits.
+    """
+    running = db.func.sum(
+        db.func.coalesce(TaxpayerLedger.debit_amount, 0) - db.func.coalesce(TaxpayerLedger.credit_amount, 0)
+    ).over(
+        partition_by=(TaxpayerLedger.account_id, TaxpayerLedger.tax_type_id),
+        order_by=TaxpayerLedger.id
+    )
+    ledger_rows = db.session.query(
+        TaxpayerLedger.id,
+        TaxpayerLedger.account_id,
+        TaxpayerLedger.tax_type_id,
+        TaxpayerLedger.balance,
+        running.label('expected')
+    ).order_by(TaxpayerLedger.account_id, TaxpayerLedger.tax_type_id, TaxpayerLedger.id)
+    
+    row_drift = []
+    expected_totals = {}
+    for row in ledger_rows.yield_per(5000):
+        expected = Decimal(str(row.expected or 0))
+        expected_totals[(row.account_id, row.tax_type_id)] = (expected, row.id)
+        if Decimal(str(row.balance or 0)) != expected:
+            row_drift.append({'id': row.id, 'balance': expected})
+    
+    snapshots = {(s.account_id, s.tax_type_id): s for s in AccountBalance.query.all()}
+    snapshot_drift = []
+    for key in set(expected_totals) | set(snapshots):
+        expected, last_id = expected_totals.get(key, (Decimal('0'), None))
+        snapshot = snapshots.get(key)
+        stored = Decimal(str(snapshot.balance)) if snapshot else None
+        if stored != expected:
+            snapshot_drift.append((key[0], key[1], stored, expected))
+            if fix:
+                if snapshot is None:
+                    snapshot = AccountBalance(account_id=key[0], tax_type_id=key[1])
+                    db.session.add(snapshot)
+                snapshot.balance = expected
+                snapshot.last_ledger_id = last_id
+                snapshot.updated_at = datetime.utcnow()
+    
+    if fix and row_drift:
+        db.session.execute(db.update(TaxpayerLedger), row_drift)
+    
+    return row_drift, snapshot_drift
@@ -0,0 +1,353 @@
+from app import db
+from app.models.user import User
+from app.models.functionality import (Notification, NotificationJob, BroadcastNotification, NotificationReceipt,
+                                      NotificationCounter)
+from app.services.db_helpers import dialect_insert
+from sqlalchemy import event, inspect
+from datetime import datetime
+
+# Failed deliveries are retried until a job has been attempted this many times
+MAX_ATTEMPTS = 3
+
+def audience_user_ids(audience):
+    """
+    Return a select of the user ids in a notification audience
+    """
+    if audience == 'all':
+        return db.select(User.id)
+    if audience == 'admins':
+        return db.select(User.id).where(User.is_admin == True)
+    raise ValueError(f'Unknown notification audience: {audience}')
+
+def user_audiences(user):
+    """
+    Return the broadcast audiences a user belongs to
+    """
+    audiences = ['all']
+    if user.is_admin:
+        audiences.append('admins')
+    return audiences
+
+def audience_condition(audience_column):
+    """
+    SQL condition matching the User row in scope to a broadcast audience column
+    """
+    return db.or_(
+        audience_column == 'all',
+        db.and_(audience_column == 'admins', User.is_admin == True)
+    )
+
+def broadcast_notification(audience, title, message, notification_type='Alert', priority='Normal'):
+    """
+    Store one notification for a whole audience. Recipients see it through
+    notification_feed_query; reading it records a per-user receipt. The caller commits.
+    """
+    audience_user_ids(audience)  # Validate the audience name
+    broadcast = BroadcastNotification(
+        audience=audience,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        priority=priority,
+        created_at=datetime.utcnow()
+    )
+    db.session.add(broadcast)
+    
+    # Every existing member of the audience gains one unread message
+    recipients = audience_user_ids(audience).where(
+        db.or_(User.created_at.is_(None), User.created_at <= broadcast.created_at)
+    )
+    db.session.execute(_counter_update(NotificationCounter.user_id.in_(recipients), 1))
+    return broadcast
+
+def _visible_broadcasts(user):
+    """Filter conditions for the broadcasts a user can see"""
+    conditions = [BroadcastNotification.audience.in_(user_audiences(user))]
+    # Users do not inherit broadcasts sent before their account existed
+    if user.created_at:
+        conditions.append(BroadcastNotification.created_at >= user.created_at)
+    return conditions
+
+def notification_feed_query(user, unread_only=False):
+    """
+    Build a query merging the user's direct notifications with the broadcasts
+    addressed to them, unread first and newest first. Rows expose kind
+    ('direct' or 'broadcast'), id, title, message, notification_type, priority,
+    is_read, created_at and read_at, and the query can be paginated directly.
+    """
+    direct = db.select(
+        db.literal('direct').label('kind'),
+        Notification.id.label('id'),
+        Notification.title.label('title'),
+        Notification.message.label('message'),
+        Notification.notification_type.label('notification_type'),
+        Notification.priority.label('priority'),
+        db.func.coalesce(Notification.is_read, False).label('is_read'),
+        Notification.created_at.label('created_at'),
+        Notification.read_at.label('read_at')
+    ).where(Notification.user_id == user.id)
+    
+    is_read = db.case((NotificationReceipt.id.isnot(None), True), else_=False)
+    broadcasts = db.select(
+        db.literal('broadcast').label('kind'),
+        BroadcastNotification.id.label('id'),
+        BroadcastNotification.title.label('title'),
+        BroadcastNotification.message.label('message'),
+        BroadcastNotification.notification_type.label('notification_type'),
+        BroadcastNotification.priority.label('priority'),
+        is_read.label('is_read'),
+        BroadcastNotification.created_at.label('created_at'),
+        NotificationReceipt.read_at.label('read_at')
+    ).outerjoin(NotificationReceipt, db.and_(
+        NotificationReceipt.broadcast_id == BroadcastNotification.id,
+        NotificationReceipt.user_id == user.id
+    )).where(*_visible_broadcasts(user))
+    
+    if unread_only:
+        direct = direct.where(db.or_(Notification.is_read == False, Notification.is_read.is_(None)))
+        broadcasts = broadcasts.where(NotificationReceipt.id.is_(None))
+    
+    feed = db.union_all(direct, broadcasts).subquery()
+    return db.session.query(feed).order_by(feed.c.is_read.asc(), feed.c.created_at.desc())
+
+def unread_notification_count(user):
+    """
+    Count unread direct notifications and unread broadcasts in one round trip
+    """
+    direct = db.select(db.func.count(Notification.id)).where(
+        Notification.user_id == user.id,
+        db.or_(Notification.is_read == False, Notification.is_read.is_(None))
+    ).scalar_subquery()
+    
+    broadcasts = db.select(db.func.count(BroadcastNotification.id)).where(
+        *_visible_broadcasts(user),
+        ~db.exists().where(
+            NotificationReceipt.broadcast_id == BroadcastNotification.id,
+            NotificationReceipt.user_id == user.id
+        )
+    ).scalar_subquery()
+    
+    return db.session.query(direct + broadcasts).scalar() or 0
+
+def mark_broadcast_read(user, broadcast_id):
+    """
+    Record a read receipt for a broadcast the user can see. Returns False if
+    the broadcast is not addressed to the user. The caller commits.
+    """
+    visible = db.session.query(BroadcastNotification.query.filter(
+        BroadcastNotification.id == broadcast_id,
+        *_visible_broadcasts(user)
+    ).exists()).scalar()
+    if not visible:
+        return False
+    
+    values = {'broadcast_id': broadcast_id, 'user_id': user.id, 'read_at': datetime.utcnow()}
+    insert = dialect_insert(NotificationReceipt.__table__)
+    if insert is not None:
+        inserted = db.session.execute(insert.values(**values).on_conflict_do_nothing(
+            index_elements=['user_id', 'broadcast_id']
+        )).rowcount
+    elif not NotificationReceipt.query.filter_by(broadcast_id=broadcast_id, user_id=user.id).first():
+        db.session.add(NotificationReceipt(**values))
+        inserted = 1
+    else:
+        inserted = 0
+    
+    if inserted:
+        db.session.execute(_counter_update(NotificationCounter.user_id == user.id, -1))
+    return True
+
+def mark_all_read(user):
+    """
+    Mark every direct notification read and write receipts for every unread
+    broadcast with a single INSERT ... SELECT. Returns the number of
+    notifications marked. The caller commits.
+    """
+    now = datetime.utcnow()
+    direct = Notification.query.filter(
+        Notification.user_id == user.id,
+        db.or_(Notification.is_read == False, Notification.is_read.is_(None))
+    ).update({'is_read': True, 'read_at': now}, synchronize_session=False)
+    
+    unread = db.select(
+        BroadcastNotification.id,
+        db.literal(user.id),
+        db.literal(now)
+    ).where(
+        *_visible_broadcasts(user),
+        ~db.exists().where(
+            NotificationReceipt.broadcast_id == BroadcastNotification.id,
+            NotificationReceipt.user_id == user.id
+        )
+    )
+    result = db.session.execute(db.insert(NotificationReceipt).from_select(
+        ['broadcast_id', 'user_id', 'read_at'], unread
+    ))
+    
+    db.session.execute(db.update(NotificationCounter).where(
+        NotificationCounter.user_id == user.id
+    ).values(unread_count=0, updated_at=now))
+    return direct + result.rowcount
+
+def enqueue_notification_job(audience, title, message, notification_type='Alert', priority='Normal'):
+    """
+    Queue a notification to be copied to every user in an audience, for messages
+    that need per-user rows. The job is added to the caller's transaction, so it
+    is only delivered if the triggering change commits.
+    """
+    job = NotificationJob(
+        audience=audience,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        priority=priority,
+        status='Pending',
+        created_at=datetime.utcnow()
+    )
+    db.session.add(job)
+    return job
+
+def deliver_notification_job(job):
+    """
+    Write one notification per recipient with a single INSERT ... SELECT and mark
+    the job completed. The caller commits.
+    """
+    recipients = audience_user_ids(job.audience).subquery()
+    rows = db.select(
+        recipients.c.id,
+        db.literal(job.title),
+        db.literal(job.message),
+        db.literal(job.notification_type),
+        db.literal(job.priority),
+        db.literal(False),
+        db.literal(job.created_at)
+    )
+    result = db.session.execute(db.insert(Notification).from_select(
+        ['user_id', 'title', 'message', 'notification_type', 'priority', 'is_read', 'created_at'],
+        rows
+    ))
+    
+    db.session.execute(_counter_update(NotificationCounter.user_id.in_(audience_user_ids(job.audience)), 1))
+    
+    job.recipient_count = result.rowcount
+    job.status = 'Completed'
+    job.completed_at = datetime.utcnow()
+
+def process_notification_jobs(limit=100):
+    """
+    Deliver up to limit pending jobs, one transaction per job. Jobs are claimed
+    with FOR UPDATE SKIP LOCKED so several workers can run side by side, and a
+    crash mid-delivery rolls the job back to pending. Returns the number delivered.
+    """
+    delivered = 0
+    for _ in range(limit):
+        job = NotificationJob.query.filter_by(status='Pending').order_by(
+            NotificationJob.id
+        ).with_for_update(skip_locked=True).first()
+        if job is None:
+            break
+    
+        job_id = job.id
+        try:
+            deliver_notification_job(job)
+            db.session.commit()
+            delivered += 1
+        except Exception as e:
+            db.session.rollback()
+            job = NotificationJob.query.get(job_id)
+            job.attempts += 1
+            job.last_error = str(e)
+            if job.attempts >= MAX_ATTEMPTS:
+                job.status = 'Failed'
+            db.session.commit()
+    
+    return delivered
+
+def _counter_update(user_filter, delta):
+    """UPDATE adding delta to the unread counters of the users matched by user_filter"""
+    return db.update(NotificationCounter).where(user_filter).values(
+        unread_count=NotificationCounter.unread_count + delta,
+        updated_at=datetime.utcnow()
+    )
+
+def get_unread_count(user):
+    """
+    Read the user's unread notification count from their counter row. Users
+    without a counter yet (created since the last reconcile) get an exact count.
+    """
+    counter = db.session.get(NotificationCounter, user.id, populate_existing=True)
+    if counter is None:
+        return unread_notification_count(user)
+    return max(counter.unread_count, 0)
+
+def reconcile_notification_counters():
+    """
+    Recompute every user's unread count with grouped queries and rewrite the
+    counters that drifted or are missing. Returns the number of counters written;
+    the caller commits.
+    """
+    expected = {user_id: 0 for (user_id,) in db.session.query(User.id)}
+    
+    direct = db.session.query(Notification.user_id, db.func.count(Notification.id)).filter(
+        db.or_(Notification.is_read == False, Notification.is_read.is_(None))
+    ).group_by(Notification.user_id)
+    for user_id, count in direct:
+        expected[user_id] = expected.get(user_id, 0) + count
+    
+    broadcasts = db.session.query(User.id, db.func.count(BroadcastNotification.id)).join(
+        BroadcastNotification, db.and_(
+            audience_condition(BroadcastNotification.audience),
+            db.or_(User.created_at.is_(None), BroadcastNotification.created_at >= User.created_at)
+        )
+    ).outerjoin(NotificationReceipt, db.and_(
+        NotificationReceipt.broadcast_id == BroadcastNotification.id,
+        NotificationReceipt.user_id == User.id
+    )).filter(NotificationReceipt.id.is_(None)).group_by(User.id)
+    for user_id, count in broadcasts:
+        expected[user_id] += count
+    
+    current = dict(db.session.query(NotificationCounter.user_id, NotificationCounter.unread_count))
+    now = datetime.utcnow()
+    drifted = [{'user_id': user_id, 'unread_count': count, 'updated_at': now}
+               for user_id, count in expected.items() if current.get(user_id) != count]
+    if not drifted:
+        return 0
+    
+    insert = dialect_insert(NotificationCounter.__table__)
+    if insert is not None:
+        db.session.execute(insert.values(drifted).on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={'unread_count': insert.excluded.unread_count, 'updated_at': insert.excluded.updated_at}
+        ))
+    else:
+        existing = [row for row in drifted if row['user_id'] in current]
+        missing = [row for row in drifted if row['user_id'] not in current]
+        if existing:
+            db.session.execute(db.update(NotificationCounter), existing)
+        if missing:
+            db.session.execute(NotificationCounter.__table__.insert(), missing)
+    return len(drifted)
+
+@event.listens_for(User, 'after_insert')
+def _create_counter(mapper, connection, user):
+    # A new user has no unread messages: broadcasts sent before their account are not shown to them
+    connection.execute(NotificationCounter.__table__.insert().values(
+        user_id=user.id, unread_count=0, updated_at=datetime.utcnow()
+    ))
+
+@event.listens_for(Notification, 'after_insert')
+def _count_new_notification(mapper, connection, notification):
+    if not notification.is_read:
+        connection.execute(_counter_update(NotificationCounter.user_id == notification.user_id, 1))
+
+@event.listens_for(Notification, 'after_update')
+def _count_read_change(mapper, connection, notification):
+    history = inspect(notification).attrs.is_read.history
+    if not history.has_changes():
+        return
+    was_read = bool(history.deleted[0]) if history.deleted else False
+    if was_read != bool(notification.is_read):
+        connection.execute(_counter_update(
+            NotificationCounter.user_id == notification.user_id,
+            -1 if notification.is_read else 1
+        ))
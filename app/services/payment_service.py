@@ -0,0 +1,148 @@
+from app import db
+from app.models.tax import TaxReturn, Payment
+from app.models.functionality import Notification
+from app.services.ledger_service import post_ledger_entry
+from app.services.reporting_service import apply_payment_to_rollup
+from app.services.reference_service import generate_reference
+from sqlalchemy.exc import IntegrityError
+from collections import namedtuple
+from datetime import datetime
+from decimal import Decimal
+
+# replayed is True when an idempotency key matched a payment posted earlier
+PostedPayment = namedtuple('PostedPayment', ['payment', 'overpayment', 'replayed'])
+
+def settle_returns_statement():
+    """
+    UPDATE reducing a return's due amount by :paid inside the database, so
+    concurrent payments never overwrite each other. A return paid in full is
+    Finalized; otherwise Filed and Assessed returns keep their status. Execute
+    with return_id/paid parameters, one set per return.
+    """
+    table = TaxReturn.__table__
+    remaining = db.func.coalesce(table.c.due_amount, 0) - db.bindparam('paid')
+    return table.update().where(table.c.id == db.bindparam('return_id')).values(
+        due_amount=db.case((remaining > 0, remaining), else_=0),
+        status=db.case(
+            (remaining <= 0, 'Finalized'),
+            (db.or_(table.c.status == 'Filed', table.c.status == 'Assessed'), table.c.status),
+            else_='Filed'
+        )
+    )
+
+def _settle_return(tax_return_id, amount):
+    """
+    Apply amount to a return's due amount and return the overpayment. The return
+    row is locked FOR UPDATE first, so the overpayment is computed from the
+    balance this transaction is about to change.
+    """
+    due_amount = db.session.query(TaxReturn.due_amount).filter(TaxReturn.id == tax_return_id).with_for_update().scalar()
+    db.session.execute(settle_returns_statement(), [{'return_id': tax_return_id, 'paid': amount}])
+    return max(Decimal('0'), amount - Decimal(str(due_amount or 0)))
+
+def _notify_overpayment(tax_return, overpayment, user_id):
+    db.session.add(Notification(
+        user_id=user_id,
+        title='Overpayment Detected',
+        message=f'You have overpaid tax return {tax_return.reference_number} by ${overpayment:.2f}. This amount has been credited to your account.',
+        notification_type='Alert'
+    ))
+
+def _complete(payment, tax_return, notify_user_id=None):
+    """Post a Completed payment to the ledger and its return"""
+    # Lock order matches the bulk paths: account balance snapshot, then the return, then the rollup
+    post_ledger_entry(
+        account_id=tax_return.account_id,
+        tax_type_id=tax_return.tax_type_id,
+        tax_period_id=tax_return.tax_period_id,
+        transaction_type='Payment',
+        description=f'Payment for {tax_return.reference_number}',
+        credit_amount=payment.amount,
+        reference_number=payment.reference_number
+    )
+    overpayment = _settle_return(tax_return.id, Decimal(str(payment.amount)))
+    if overpayment > 0:
+        _notify_overpayment(tax_return, overpayment, notify_user_id or tax_return.account.user_id)
+    return overpayment
+
+def post_payment(tax_return_id, amount, payment_method, idempotency_key=None, reference_number=None,
+                 notify_user_id=None):
+    """
+    Record a Completed payment against a tax return and post it to the ledger,
+    the revenue rollup and the return's due amount. Safe under concurrency: the
+    due amount is reduced in SQL under a row lock, and an idempotency_key makes
+    retries return the original payment instead of posting it twice.
+    Returns a PostedPayment; raises ValueError for bad input. The caller commits.
+    """
+    amount = Decimal(str(amount)).quantize(Decimal('0.01'))
+    if amount <= 0:
+        raise ValueError('Payment amount must be positive')
+    
+    if idempotency_key:
+        existing = Payment.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing is not None:
+            return _replay(existing, tax_return_id, amount)
+    
+    tax_return = db.session.get(TaxReturn, tax_return_id)
+    if tax_return is None:
+        raise ValueError('Tax return not found')
+    
+    payment = Payment(
+        tax_return_id=tax_return_id,
+        amount=amount,
+        payment_date=datetime.utcnow(),
+        payment_method=payment_method,
+        reference_number=reference_number or generate_reference('PMT'),
+        idempotency_key=idempotency_key,
+        status='Completed'
+    )
+    
+    # A concurrent request with the same key wins the unique index; replay its payment
+    try:
+        with db.session.begin_nested():
+            db.session.add(payment)
+            db.session.flush()
+    except IntegrityError:
+        existing = Payment.query.filter_by(idempotency_key=idempotency_key).first() if idempotency_key else None
+        if existing is None:
+            raise
+        return _replay(existing, tax_return_id, amount)
+    
+    overpayment = _complete(payment, tax_return, notify_user_id)
+    apply_payment_to_rollup(payment)
+    return PostedPayment(payment, overpayment, False)
+
+def _replay(payment, tax_return_id, amount):
+    if payment.tax_return_id != tax_return_id or Decimal(str(payment.amount)) != amount:
+        raise ValueError('This idempotency key was already used for a different payment')
+    return PostedPayment(payment, Decimal('0'), True)
+
+def complete_payment(payment_id, notify_user_id=None):
+    """
+    Approve a pending payment and post it. The payment row is locked so a
+    double-submitted approval posts once; approving a Completed payment is a
+    no-op. Returns a PostedPayment; the caller commits.
+    """
+    payment = Payment.query.filter_by(id=payment_id).with_for_update().populate_existing().one()
+    if payment.status == 'Completed':
+        return PostedPayment(payment, Decimal('0'), True)
+    
+    previous_status = payment.status
+    payment.status = 'Completed'
+    overpayment = _complete(payment, payment.tax_return, notify_user_id)
+    apply_payment_to_rollup(payment, previous_status)
+    return PostedPayment(payment, overpayment, False)
+
+def decline_payment(payment_id):
+    """
+    Mark a pending payment Failed. The payment row is locked so a decline
+    racing an approval sees its outcome; declining a payment that is no longer
+    Pending is a no-op. Returns True if the payment was declined; the caller commits.
+    """
+    payment = Payment.query.filter_by(id=payment_id).with_for_update().populate_existing().one()
+    if payment.status != 'Pending':
+        return False
+    
+    # Pending payments are not in the rollup, ledger or due amount, so there is nothing to reverse
+    payment.status = 'Failed'
+    return True
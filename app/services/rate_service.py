@@ -0,0 +1,170 @@
+from app import db
+from app.models.tax import TaxRateSchedule, TaxRateBracket
+from flask import current_app
+from sqlalchemy import event
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+import time
+
+CENT = Decimal('0.01')
+
+# Rate for tax types with no schedule in force
+DEFAULT_RATE = Decimal('0.15')
+
+# Marginal brackets ready for evaluation: ascending lower bounds, their rates and the
+# tax accumulated below each bound, so pricing an income is one bisect and one multiply
+CompiledSchedule = namedtuple('CompiledSchedule', ['lower_bounds', 'rates', 'base_tax'])
+
+# Per-process cache: {'expires_at': ..., 'schedules': {tax_type_id: ([effective_from], [CompiledSchedule])}}.
+# Kept for RATE_SCHEDULE_CACHE_TTL seconds and invalidated when schedules change.
+_rate_cache = {}
+
+def _to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+def compile_schedule(brackets):
+    """
+    Compile (lower_bound, rate) pairs into a CompiledSchedule. Income below the
+    lowest bound is untaxed. Raises ValueError for negative bounds, duplicate
+    bounds or rates outside 0..1.
+    """
+    pairs = sorted((_to_decimal(lower), _to_decimal(rate)) for lower, rate in brackets)
+    if not pairs:
+        raise ValueError('A rate schedule needs at least one bracket')
+    lower_bounds = [lower for lower, rate in pairs]
+    if lower_bounds[0] < 0 or len(set(lower_bounds)) != len(lower_bounds):
+        raise ValueError('Bracket lower bounds must be distinct and not negative')
+    if any(rate < 0 or rate > 1 for lower, rate in pairs):
+        raise ValueError('Bracket rates must be between 0 and 1')
+    
+    if lower_bounds[0] > 0:
+        pairs.insert(0, (Decimal('0'), Decimal('0')))
+    base_tax = [Decimal('0')]
+    for (lower, rate), (next_lower, next_rate) in zip(pairs, pairs[1:]):
+        base_tax.append(base_tax[-1] + (next_lower - lower) * rate)
+    return CompiledSchedule(tuple(lower for lower, rate in pairs), tuple(rate for lower, rate in pairs), tuple(base_tax))
+
+DEFAULT_SCHEDULE = compile_schedule([(0, DEFAULT_RATE)])
+
+def _load_schedules():
+    """Read every schedule and its brackets in one query"""
+    rows = db.session.query(
+        TaxRateSchedule.tax_type_id, TaxRateSchedule.effective_from, TaxRateBracket.lower_bound, TaxRateBracket.rate
+    ).join(TaxRateBracket, TaxRateBracket.schedule_id == TaxRateSchedule.id).order_by(
+        TaxRateSchedule.tax_type_id, TaxRateSchedule.effective_from, TaxRateBracket.lower_bound
+    )
+    brackets = {}
+    for row in rows:
+        brackets.setdefault((row.tax_type_id, row.effective_from), []).append((row.lower_bound, row.rate))
+    
+    schedules = {}
+    for (tax_type_id, effective_from), pairs in brackets.items():
+        dates, compiled = schedules.setdefault(tax_type_id, ([], []))
+        dates.append(effective_from)
+        compiled.append(compile_schedule(pairs))
+    return schedules
+
+def rate_schedules():
+    """
+    All stored schedules as {tax_type_id: ([effective_from], [CompiledSchedule])},
+    from the per-process cache when RATE_SCHEDULE_CACHE_TTL is set
+    """
+    ttl = current_app.config.get('RATE_SCHEDULE_CACHE_TTL', 0)
+    if ttl and _rate_cache.get('expires_at', 0) > time.monotonic():
+        return _rate_cache['schedules']
+    schedules = _load_schedules()
+    if ttl:
+        _rate_cache.update(expires_at=time.monotonic() + ttl, schedules=schedules)
+    return schedules
+
+def schedule_in_force(schedules, tax_type_id, on_date=None):
+    """The CompiledSchedule of a tax type in force on a date, from a rate_schedules() mapping"""
+    if isinstance(on_date, datetime):
+        on_date = on_date.date()
+    dates, compiled = schedules.get(tax_type_id, ((), ()))
+    index = bisect_right(dates, on_date or date.today()) - 1
+    return compiled[index] if index >= 0 else DEFAULT_SCHEDULE
+
+def invalidate_rate_cache():
+    """Drop the cached rate schedules so the next calculation reloads them"""
+    _rate_cache.clear()
+
+def schedule_for(tax_type_id, on_date=None):
+    """The CompiledSchedule of a tax type in force on a date (today by default)"""
+    return schedule_in_force(rate_schedules(), tax_type_id, on_date)
+
+def calculate_tax_batch(tax_type_id, incomes, deductions=None, on_date=None, schedule=None):
+    """
+    Tax due on each income less its deduction, in one pass over the inputs.
+    tax_type_id may be a single id or a sequence parallel to incomes; schedule
+    overrides the stored schedules (for what-if runs). Amounts are Decimals,
+    rounded half up to the cent once per row.
+    """
+    if deductions is None:
+        deductions = [Decimal('0')] * len(incomes)
+    if isinstance(tax_type_id, int) or schedule is not None:
+        schedules = [schedule or schedule_for(tax_type_id, on_date)] * len(incomes)
+    else:
+        by_type = {type_id: schedule_for(type_id, on_date) for type_id in set(tax_type_id)}
+        schedules = [by_type[type_id] for type_id in tax_type_id]
+    
+    zero = Decimal('0')
+    results = []
+    for compiled, income, deduction in zip(schedules, incomes, deductions):
+        taxable = _to_decimal(income) - _to_decimal(deduction)
+        if taxable <= zero:
+            results.append(zero.quantize(CENT))
+            continue
+        index = bisect_right(compiled.lower_bounds, taxable) - 1
+        tax = compiled.base_tax[index] + (taxable - compiled.lower_bounds[index]) * compiled.rates[index]
+        results.append(tax.quantize(CENT, rounding=ROUND_HALF_UP))
+    return results
+
+def taxable_income_for_tax(schedule, tax):
+    """
+    Invert a schedule: the taxable income on which it charges tax. Incomes
+    inside a 0% bracket all owe the same tax; the bracket's lower bound is
+    returned for them.
+    """
+    tax = _to_decimal(tax)
+    if tax <= 0:
+        return Decimal('0')
+    index = bisect_right(schedule.base_tax, tax) - 1
+    rate = schedule.rates[index]
+    if rate == 0:
+        return schedule.lower_bounds[index]
+    return schedule.lower_bounds[index] + (tax - schedule.base_tax[index]) / rate
+
+def calculate_tax(tax_type_id, income, deductions=0, on_date=None):
+    """Tax due on one income, from the schedule in force on on_date"""
+    return calculate_tax_batch(tax_type_id, [income], [deductions], on_date)[0]
+
+def set_rate_schedule(tax_type_id, effective_from, brackets, description=None):
+    """
+    Create or replace the schedule of a tax type taking effect on a date, with
+    (lower_bound, rate) brackets. Returns the TaxRateSchedule; the caller commits.
+    """
+    compile_schedule(brackets)
+    schedule = TaxRateSchedule.query.filter_by(tax_type_id=tax_type_id, effective_from=effective_from).first()
+    if schedule is None:
+        schedule = TaxRateSchedule(tax_type_id=tax_type_id, effective_from=effective_from)
+        db.session.add(schedule)
+    schedule.description = description
+    # Delete the old brackets before inserting their replacements, which may reuse their bounds
+    schedule.brackets = []
+    db.session.flush()
+    schedule.brackets = [TaxRateBracket(lower_bound=_to_decimal(lower), rate=_to_decimal(rate))
+                         for lower, rate in brackets]
+    db.session.flush()
+    return schedule
+
+@event.listens_for(TaxRateSchedule, 'after_insert')
+@event.listens_for(TaxRateSchedule, 'after_update')
+@event.listens_for(TaxRateSchedule, 'after_delete')
+@event.listens_for(TaxRateBracket, 'after_insert')
+@event.listens_for(TaxRateBracket, 'after_update')
+@event.listens_for(TaxRateBracket, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_rate_cache()
@@ -0,0 +1,226 @@
+from app import db
+from app.models.tax import TaxReturn, Payment, Refund, Objection
+from app.models.process import Request, Audit, Collection, Enforcement, Agreement
+from app.models.functionality import Case, Correspondence, ReferenceRegistry
+from app.services.db_helpers import dialect_insert
+from sqlalchemy import event, inspect
+from datetime import datetime
+import os
+import re
+import secrets
+import threading
+import time
+
+# Entity type -> model of every record that carries a trackable reference number
+REFERENCE_ENTITIES = {
+    'tax_return': TaxReturn,
+    'payment': Payment,
+    'refund': Refund,
+    'objection': Objection,
+    'request': Request,
+    'audit': Audit,
+    'collection': Collection,
+    'enforcement': Enforcement,
+    'agreement': Agreement,
+    'case': Case,
+    'correspondence': Correspondence,
+}
+
+def reference_prefix(reference):
+    """The prefix of a reference number, e.g. 'PMT' for 'PMT-1A2B3C4D'"""
+    return reference.split('-', 1)[0][:10].upper()
+
+# Crockford base32: no I, L, O or U, and its characters sort in the same order as their values
+REFERENCE_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_ALPHABET_VALUES = {char: value for value, char in enumerate(REFERENCE_ALPHABET)}
+_MISREAD_CHARACTERS = str.maketrans({'I': '1', 'L': '1', 'O': '0'})
+
+# PREFIX-TTTTTTTTTSSSSSC: 9 characters of millisecond timestamp, 5 of sequence and a check
+# character. The longest prefix (4) still fits the 20 characters of TaxReturn.reference_number.
+TIMESTAMP_LENGTH = 9
+SEQUENCE_LENGTH = 5
+REFERENCE_PATTERN = re.compile(r'^([A-Z]{1,4})-([0-9A-Z]{%d})$' % (TIMESTAMP_LENGTH + SEQUENCE_LENGTH + 1))
+
+_sequence_lock = threading.Lock()
+_last_sequence = {}  # prefix -> (millisecond, sequence) last issued by this process
+
+# A forked worker must not continue its parent's sequences
+os.register_at_fork(after_in_child=_last_sequence.clear)
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(REFERENCE_ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+def _check_character(body):
+    """Luhn mod 32 check character, catching any single substitution and most adjacent swaps"""
+    total = 0
+    for position, char in enumerate(reversed(body)):
+        value = _ALPHABET_VALUES[char]
+        if position % 2 == 0:
+            value *= 2
+            value = value // 32 + value % 32
+        total += value
+    return REFERENCE_ALPHABET[-total % 32]
+
+def _next_sequence(prefix):
+    """
+    Return (millisecond, sequence) for a new reference. Within a millisecond the
+    sequence counts up from a random start, so a process never repeats itself and
+    concurrent processes only meet if they draw the same 24-bit start in the same
+    millisecond.
+    """
+    with _sequence_lock:
+        now = time.time_ns() // 1_000_000
+        last_millisecond, last_sequence = _last_sequence.get(prefix, (0, 0))
+        if now > last_millisecond:
+            millisecond, sequence = now, secrets.randbits(24)
+        elif last_sequence + 1 < 32 ** SEQUENCE_LENGTH:
+            millisecond, sequence = last_millisecond, last_sequence + 1
+        else:
+            millisecond, sequence = last_millisecond + 1, secrets.randbits(24)
+        _last_sequence[prefix] = (millisecond, sequence)
+    return millisecond, sequence
+
+def generate_reference(prefix):
+    """
+    Generate a reference number such as 'PMT-01JA3X5K8Q2RT4N'. References with
+    the same prefix sort in creation order, so index inserts stay at the end of
+    the B-tree, and the last character is a check character validated by
+    is_valid_reference.
+    """
+    millisecond, sequence = _next_sequence(prefix)
+    body = _encode(millisecond, TIMESTAMP_LENGTH) + _encode(sequence, SEQUENCE_LENGTH)
+    return f'{prefix}-{body}{_check_character(body)}'
+
+def normalize_reference(reference):
+    """
+    Clean up a reference typed by a user: surrounding spaces, lowercase and, for
+    generated references, the letters I, L and O read in place of 1 and 0.
+    Other references are returned stripped but otherwise unchanged.
+    """
+    reference = (reference or '').strip()
+    prefix, dash, body = reference.upper().partition('-')
+    candidate = f'{prefix}-{body.translate(_MISREAD_CHARACTERS)}'
+    return candidate if REFERENCE_PATTERN.match(candidate) else reference
+
+def is_valid_reference(reference):
+    """
+    False when a normalized reference has the shape of a generated one but its
+    check character does not match, i.e. it was mistyped. Legacy and external
+    references carry no check character and are always accepted.
+    """
+    match = REFERENCE_PATTERN.match(reference)
+    if match is None:
+        return True
+    body = match.group(2)
+    if any(char not in _ALPHABET_VALUES for char in body):
+        return False
+    return _check_character(body[:-1]) == body[-1]
+
+def _registry_rows(entity_type, pairs):
+    now = datetime.utcnow()
+    return [{
+        'reference_number': reference,
+        'prefix': reference_prefix(reference),
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'created_at': now,
+    } for entity_id, reference in pairs]
+
+def _register(connection, entity_type, pairs):
+    """Insert registry rows for (entity_id, reference) pairs, leaving existing references alone"""
+    rows = _registry_rows(entity_type, pairs)
+    if not rows:
+        return 0
+    
+    insert = dialect_insert(ReferenceRegistry.__table__)
+    if insert is not None:
+        return connection.execute(insert.values(rows).on_conflict_do_nothing(
+            index_elements=['reference_number']
+        )).rowcount
+    
+    existing = set(connection.execute(db.select(ReferenceRegistry.reference_number).where(
+        ReferenceRegistry.reference_number.in_([row['reference_number'] for row in rows])
+    )).scalars())
+    rows = [row for row in rows if row['reference_number'] not in existing]
+    if rows:
+        connection.execute(ReferenceRegistry.__table__.insert(), rows)
+    return len(rows)
+
+def _unregister(connection, entity_type, entity_id):
+    connection.execute(db.delete(ReferenceRegistry).where(
+        ReferenceRegistry.entity_type == entity_type, ReferenceRegistry.entity_id == entity_id
+    ))
+
+def register_references(entity_type, pairs):
+    """
+    Register (entity_id, reference) pairs for records written with bulk inserts,
+    which bypass the mapper events. The caller commits.
+    """
+    return _register(db.session.connection(), entity_type, pairs)
+
+def backfill_reference_registry(entity_types=None, batch_size=1000):
+    """
+    Register the reference numbers of existing records that are not yet in the
+    registry. Safe to re-run. Returns a dict of references added per entity
+    type; the caller commits.
+    """
+    connection = db.session.connection()
+    counts = {}
+    for entity_type in entity_types or REFERENCE_ENTITIES:
+        model = REFERENCE_ENTITIES[entity_type]
+        query = db.session.query(model.id, model.reference_number).filter(
+            model.reference_number.isnot(None),
+            ~db.exists().where(ReferenceRegistry.reference_number == model.reference_number)
+        ).order_by(model.id)
+    
+        counts[entity_type] = 0
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append((row.id, row.reference_number))
+            if len(batch) >= batch_size:
+                counts[entity_type] += _register(connection, entity_type, batch)
+                batch = []
+        counts[entity_type] += _register(connection, entity_type, batch)
+    return counts
+
+def resolve_reference(reference):
+    """
+    Look up a reference number in the registry and return (entity_type, entity),
+    or (None, None) when it is unknown. Mistyped generated references are
+    rejected by their check character without a query.
+    """
+    reference = normalize_reference(reference)
+    if not reference or not is_valid_reference(reference):
+        return None, None
+    
+    entry = ReferenceRegistry.query.filter_by(reference_number=reference).first()
+    if entry is None:
+        return None, None
+    
+    model = REFERENCE_ENTITIES.get(entry.entity_type)
+    entity = db.session.get(model, entry.entity_id) if model else None
+    return (entry.entity_type, entity) if entity else (None, None)
+
+def _register_reference_listeners(entity_type, model):
+    @event.listens_for(model, 'after_insert')
+    def register_inserted(mapper, connection, entity):
+        if entity.reference_number:
+            _register(connection, entity_type, [(entity.id, entity.reference_number)])
+    
+    @event.listens_for(model, 'after_update')
+    def register_updated(mapper, connection, entity):
+        if inspect(entity).attrs.reference_number.history.has_changes():
+            _unregister(connection, entity_type, entity.id)
+            if entity.reference_number:
+                _register(connection, entity_type, [(entity.id, entity.reference_number)])
+    
+    @event.listens_for(model, 'after_delete')
+    def unregister_deleted(mapper, connection, entity):
+        _unregister(connection, entity_type, entity.id)
+
+for _entity_type, _model in REFERENCE_ENTITIES.items():
+    _register_reference_listeners(_entity_type, _model)
@@ -0,0 +1,139 @@
+from app import db
+from app.models.reporting import ReportJob
+from app.services.reporting_service import generate_report, REPORT_TYPES
+from app.services.db_helpers import dialect_insert
+from flask import current_app
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+import hashlib
+import json
+
+MAX_ATTEMPTS = 3
+
+# Job type run by simulation_service rather than generate_report
+POLICY_SIMULATION = 'policy_simulation'
+
+def report_request_key(report_type, start_date, end_date, tax_type_id=None, parameters=None):
+    """Key shared by identical report requests"""
+    key = f'{report_type}:{start_date.isoformat()}:{end_date.isoformat()}:{tax_type_id or "all"}'
+    if parameters:
+        key += ':' + hashlib.sha1(parameters.encode('utf-8')).hexdigest()[:20]
+    return key
+
+def _result_is_fresh(job):
+    ttl = current_app.config.get('REPORT_JOB_RESULT_TTL', 3600)
+    return job.completed_at is not None and job.completed_at >= datetime.utcnow() - timedelta(seconds=ttl)
+
+def submit_report_job(report_type, start_date, end_date, tax_type_id=None, user=None, parameters=None):
+    """
+    Queue a report for the report worker and return its job. Identical requests
+    share one job: a pending, running or recently completed job is returned as is,
+    while a failed or expired one is queued again. parameters is a JSON string
+    of extra inputs, part of what makes requests identical. The caller commits.
+    """
+    if report_type not in REPORT_TYPES and report_type != POLICY_SIMULATION:
+        raise ValueError(f'Unknown report type: {report_type}')
+    
+    key = report_request_key(report_type, start_date, end_date, tax_type_id, parameters)
+    values = {
+        'request_key': key,
+        'report_type': report_type,
+        'start_date': start_date,
+        'end_date': end_date,
+        'tax_type_id': tax_type_id,
+        'parameters': parameters,
+        'status': 'Pending',
+        'attempts': 0,
+        'requested_by': user.id if user else None,
+        'created_at': datetime.utcnow(),
+    }
+    
+    # Concurrent submissions of the same request race on the unique request_key
+    insert = dialect_insert(ReportJob.__table__)
+    if insert is not None:
+        db.session.execute(insert.values(**values).on_conflict_do_nothing(index_elements=['request_key']))
+    elif not ReportJob.query.filter_by(request_key=key).first():
+        db.session.add(ReportJob(**values))
+        db.session.flush()
+    
+    job = ReportJob.query.filter_by(request_key=key).populate_existing().one()
+    if job.status == 'Failed' or (job.status == 'Completed' and not _result_is_fresh(job)):
+        job.status = 'Pending'
+        job.attempts = 0
+        job.result = None
+        job.last_error = None
+        job.started_at = None
+        job.completed_at = None
+        job.requested_by = values['requested_by']
+    return job
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__} in a report result')
+
+def run_report_job(job):
+    """Compute the report for a claimed job and store the result. The caller commits."""
+    if job.report_type == POLICY_SIMULATION:
+        from app.services.simulation_service import run_simulation_job
+        report_data = run_simulation_job(job)
+    else:
+        report_data = generate_report(job.report_type, job.start_date, job.end_date, job.tax_type_id)
+    job.result = json.dumps(report_data, default=_json_default)
+    job.status = 'Completed'
+    job.completed_at = datetime.utcnow()
+    job.last_error = None
+
+def report_job_result(job):
+    """Return the stored report data of a completed job, or None"""
+    if job.status != 'Completed' or job.result is None:
+        return None
+    return json.loads(job.result)
+
+def claim_report_job():
+    """
+    Claim the oldest pending job, or a running job whose worker has exceeded
+    REPORT_JOB_TIMEOUT and is presumed dead, and commit it as Running so the UI
+    can see progress. Claims use FOR UPDATE SKIP LOCKED so workers never share a job.
+    """
+    stale_before = datetime.utcnow() - timedelta(seconds=current_app.config.get('REPORT_JOB_TIMEOUT', 1800))
+    job = ReportJob.query.filter(db.or_(
+        ReportJob.status == 'Pending',
+        db.and_(ReportJob.status == 'Running', ReportJob.started_at < stale_before)
+    )).order_by(ReportJob.id).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.session.rollback()
+        return None
+    
+    job.status = 'Running'
+    job.started_at = datetime.utcnow()
+    job.attempts += 1
+    db.session.commit()
+    return job
+
+def process_report_jobs(limit=10):
+    """
+    Run up to limit queued report jobs, committing each result separately.
+    Failed jobs are retried up to MAX_ATTEMPTS times. Returns the number completed.
+    """
+    completed = 0
+    for _ in range(limit):
+        job = claim_report_job()
+        if job is None:
+            break
+    
+        job_id = job.id
+        try:
+            run_report_job(job)
+            db.session.commit()
+            completed += 1
+        except Exception as e:
+            db.session.rollback()
+            job = ReportJob.query.get(job_id)
+            job.last_error = str(e)
+            job.status = 'Failed' if job.attempts >= MAX_ATTEMPTS else 'Pending'
+            db.session.commit()
+    
+    return completed
@@ -3,8 +3,205 @@ from app.models.user import User, Account
 from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund
 from app.models.process import Audit, Collection
 from app.models.registration import Registration, IndividualRegistration, NonIndividualRegistration, SoleProprietorRegistration
-from datetime import datetime, timedelta
-import calendar
+from app.models.reporting import RevenueDailyRollup
+from app.services.db_helpers import dialect_insert
+from datetime import datetime, date, timedelta
+from decimal import Decimal
+
+def iter_months(start_date, end_date):
+    """Yield the first day of every calendar month touched by the date range"""
+    current = date(start_date.year, start_date.month, 1)
+    while current <= end_date:
+        yield current
+        if current.month == 12:
+            current = date(current.year + 1, 1, 1)
+        else:
+            current = date(current.year, current.month + 1, 1)
+
+def month_window(start_date, end_date):
+    """Return the half-open [first day of start month, first day after end month) window"""
+    window_start = date(start_date.year, start_date.month, 1)
+    if end_date.month == 12:
+        window_end = date(end_date.year + 1, 1, 1)
+    else:
+        window_end = date(end_date.year, end_date.month + 1, 1)
+    return window_start, window_end
+
+def rolling_months_start(end_date, months=12):
+    """Return the first day of the earliest month in a window of `months` calendar months ending at end_date"""
+    index = end_date.year * 12 + end_date.month - months
+    return date(index // 12, index % 12 + 1, 1)
+
+def aggregate_by_month(value, date_column, start_date, end_date, joins=None, filters=None, tax_type_column=None):
+    """
+    Bucket an aggregate expression by calendar month in a single grouped query.
+    Returns a dict keyed by (year, month), or by (year, month, tax_type_id) when
+    tax_type_column is given. Months without rows are simply absent.
+    """
+    year = db.extract('year', date_column).label('year')
+    month = db.extract('month', date_column).label('month')
+    group_columns = [year, month]
+    if tax_type_column is not None:
+        group_columns.append(tax_type_column.label('tax_type_id'))
+    
+    query = db.session.query(*group_columns, value.label('value'))
+    for target, onclause in joins or []:
+        query = query.join(target, onclause)
+    
+    window_start, window_end = month_window(start_date, end_date)
+    query = query.filter(date_column >= window_start, date_column < window_end)
+    for criterion in filters or []:
+        query = query.filter(criterion)
+    
+    buckets = {}
+    for row in query.group_by(*group_columns).all():
+        key = (int(row.year), int(row.month))
+        if tax_type_column is not None:
+            key += (row.tax_type_id,)
+        buckets[key] = row.value or 0
+    return buckets
+
+def fill_months(buckets, start_date, end_date, tax_type_id=None):
+    """Expand month buckets into an ordered (month_start, value) list, filling empty months with 0"""
+    series = []
+    for month_start in iter_months(start_date, end_date):
+        key = (month_start.year, month_start.month)
+        if tax_type_id is not None:
+            key += (tax_type_id,)
+        series.append((month_start, buckets.get(key, 0)))
+    return series
+
+def _upsert_revenue_rollup(rollup_date, tax_type_id, payment_method, amount, count):
+    """Add amount/count to one rollup bucket, creating the bucket if needed"""
+    table = RevenueDailyRollup.__table__
+    values = {
+        'rollup_date': rollup_date,
+        'tax_type_id': tax_type_id,
+        'payment_method': payment_method,
+        'total_amount': amount,
+        'payment_count': count,
+        'updated_at': datetime.utcnow()
+    }
+    
+    stmt = dialect_insert(table)
+    if stmt is not None:
+        stmt = stmt.values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['rollup_date', 'tax_type_id', 'payment_method'],
+            set_={
+                'total_amount': table.c.total_amount + stmt.excluded.total_amount,
+                'payment_count': table.c.payment_count + stmt.excluded.payment_count,
+                'updated_at': stmt.excluded.updated_at
+            }
+        )
+        db.session.execute(stmt)
+        return
+    
+    # Generic fallback: update the bucket in place, insert it if it does not exist yet
+    result = db.session.execute(
+        table.update().where(
+            table.c.rollup_date == rollup_date,
+            table.c.tax_type_id == tax_type_id,
+            table.c.payment_method == payment_method
+        ).values(
+            total_amount=table.c.total_amount + amount,
+            payment_count=table.c.payment_count + count,
+            updated_at=values['updated_at']
+        )
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(**values))
+
+def apply_payment_to_rollup(payment, previous_status=None):
+    """
+    Keep the daily revenue rollup in step with a payment's status.
+    Only Completed payments count as revenue. Call this before committing the
+    payment so the rollup is updated in the same transaction.
+    """
+    was_counted = previous_status == 'Completed'
+    is_counted = payment.status == 'Completed'
+    if was_counted == is_counted:
+        return
+    
+    tax_return = TaxReturn.query.get(payment.tax_return_id)
+    sign = 1 if is_counted else -1
+    _upsert_revenue_rollup(
+        payment.payment_date.date(),
+        tax_return.tax_type_id,
+        payment.payment_method,
+        Decimal(str(payment.amount)) * sign,
+        sign
+    )
+
+def apply_payment_totals_to_rollup(totals):
+    """
+    Add Completed payments written in bulk to the daily revenue rollup. totals
+    maps (payment_date, tax_type_id, payment_method) to (amount, count). Call this
+    before committing the payments.
+    """
+    for (rollup_date, tax_type_id, payment_method), (amount, count) in sorted(totals.items()):
+        _upsert_revenue_rollup(rollup_date, tax_type_id, payment_method, amount, count)
+
+def rebuild_revenue_rollup():
+    """Rebuild the daily revenue rollup from the payments table. Caller commits."""
+    RevenueDailyRollup.query.delete()
+    
+    payment_day = db.func.date(Payment.payment_date)
+    source = db.select(
+        payment_day,
+        TaxReturn.tax_type_id,
+        Payment.payment_method,
+        db.func.sum(Payment.amount),
+        db.func.count(Payment.id),
+        db.literal(datetime.utcnow(), db.DateTime)
+    ).join(TaxReturn, Payment.tax_return_id == TaxReturn.id)\
+     .filter(Payment.status == 'Completed')\
+     .group_by(payment_day, TaxReturn.tax_type_id, Payment.payment_method)
+    
+    db.session.execute(RevenueDailyRollup.__table__.insert().from_select(
+        ['rollup_date', 'tax_type_id', 'payment_method', 'total_amount', 'payment_count', 'updated_at'],
+        source
+    ))
+    return RevenueDailyRollup.query.count()
+
+def get_total_revenue(start_date=None, end_date=None):
+    """Total completed payment revenue, read from the daily rollup"""
+    query = db.session.query(db.func.sum(RevenueDailyRollup.total_amount))
+    if start_date:
+        query = query.filter(RevenueDailyRollup.rollup_date >= start_date)
+    if end_date:
+        query = query.filter(RevenueDailyRollup.rollup_date <= end_date)
+    return query.scalar() or 0
+
+def get_revenue_by_tax_type(start_date, end_date, tax_type_id=None):
+    """Completed payment revenue and payment counts per tax type, read from the daily rollup"""
+    query = db.session.query(
+        TaxType.id.label('tax_type_id'),
+        TaxType.name.label('tax_type'),
+        db.func.sum(RevenueDailyRollup.total_amount).label('total_amount'),
+        db.func.sum(RevenueDailyRollup.payment_count).label('payment_count')
+    ).join(TaxType, RevenueDailyRollup.tax_type_id == TaxType.id)\
+     .filter(RevenueDailyRollup.rollup_date.between(start_date, end_date))\
+     .group_by(TaxType.id, TaxType.name)
+    
+    if tax_type_id:
+        query = query.filter(RevenueDailyRollup.tax_type_id == tax_type_id)
+    
+    return query.all()
+
+def get_monthly_revenue(start_date, end_date, tax_type_id=None):
+    """Monthly completed payment revenue as [{'month', 'amount'}], read from the daily rollup"""
+    filters = []
+    if tax_type_id:
+        filters.append(RevenueDailyRollup.tax_type_id == tax_type_id)
+    
+    buckets = aggregate_by_month(db.func.sum(RevenueDailyRollup.total_amount), RevenueDailyRollup.rollup_date,
+                                 start_date, end_date, filters=filters)
+    
+    return [{'month': month_start.strftime('%b %Y'), 'amount': float(amount)}
+            for month_start, amount in fill_months(buckets, start_date, end_date)]
+
+REPORT_TYPES = ['tax_collection', 'compliance', 'registration', 'audit', 'refund', 'revenue']
 
 def generate_report(report_type, start_date, end_date, tax_type_id=None):
     """Generate report based on type and parameters"""
@@ -25,19 +222,7 @@ def generate_report(report_type, start_date, end_date, tax_type_id=None):
 
 def generate_tax_collection_report(start_date, end_date, tax_type_id=None):
     """Generate report on tax collection by type and period"""
-    query = db.session.query(
-        TaxType.name.label('tax_type'),
-        db.func.sum(Payment.amount).label('total_amount'),
-        db.func.count(Payment.id).label('payment_count')
-    ).join(TaxReturn, Payment.tax_return_id == TaxReturn.id)\
-     .join(TaxType, TaxReturn.tax_type_id == TaxType.id)\
-     .filter(Payment.payment_date.between(start_date, end_date))\
-     .group_by(TaxType.name)
-    
-    if tax_type_id:
-        query = query.filter(TaxReturn.tax_type_id == tax_type_id)
-    
-    results = query.all()
+    results = get_revenue_by_tax_type(start_date, end_date, tax_type_id)
     
     # Convert to dictionary format for easier template rendering
     report_data = {
@@ -58,101 +243,81 @@ def generate_tax_collection_report(start_date, end_date, tax_type_id=None):
         })
     
     # Add monthly breakdown
-    monthly_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        month_start = datetime(current_date.year, current_date.month, 1).date()
-        month_end = datetime(current_date.year, current_date.month, 
-                             calendar.monthrange(current_date.year, current_date.month)[1]).date()
-        
-        query = db.session.query(db.func.sum(Payment.amount))\
-               .join(TaxReturn, Payment.tax_return_id == TaxReturn.id)\
-               .filter(Payment.payment_date.between(month_start, month_end))
-        
-        if tax_type_id:
-            query = query.filter(TaxReturn.tax_type_id == tax_type_id)
-        
-        total = query.scalar() or 0
-        
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'total': float(total)
-        })
-        
-        # Move to next month
-        if current_date.month == 12:
-            current_date = datetime(current_date.year + 1, 1, 1).date()
-        else:
-            current_date = datetime(current_date.year, current_date.month + 1, 1).date()
-    
-    report_data['monthly_breakdown'] = monthly_data
+    report_data['monthly_breakdown'] = [
+        {'month': m['month'], 'total': m['amount']}
+        for m in get_monthly_revenue(start_date, end_date, tax_type_id)
+    ]
     
     return report_data
 
-def generate_compliance_report(start_date, end_date, tax_type_id=None):
-    """Generate report on taxpayer compliance rates and trends"""
-    # Join TaxPeriod to filter by due_date
-    base_query = TaxReturn.query.join(TaxPeriod).filter(TaxPeriod.due_date.between(start_date, end_date))
-    if tax_type_id:
-        base_query = base_query.filter(TaxReturn.tax_type_id == tax_type_id)
-    
-    # Get total returns
-    total_returns = base_query.count()
-    
-    # Get filed returns (on time)
-    filed_on_time_query = base_query.filter(
-        TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']),
-        TaxReturn.filing_date <= TaxPeriod.due_date
-    )
-    filed_on_time = filed_on_time_query.count()
-    
-    # Get filed returns (late)
-    filed_late_query = base_query.filter(
-        TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']),
-        TaxReturn.filing_date > TaxPeriod.due_date
-    )
-    filed_late = filed_late_query.count()
+FILED_STATUSES = ['Filed', 'Assessed', 'Finalized']
+
+def _count_where(condition):
+    """Conditional count for use in a grouped query: SUM(CASE WHEN condition THEN 1 ELSE 0 END)"""
+    return db.func.coalesce(db.func.sum(db.case((condition, 1), else_=0)), 0)
+
+def compliance_by_tax_type(start_date=None, end_date=None, tax_type_id=None, positive_due_only=False):
+    """
+    Compute filing and payment compliance counts for every tax type in a single
+    grouped query over tax returns. Returns a dict of tax_type_id -> counts with
+    total_returns, filed_returns, filed_on_time, filed_late, not_filed and
+    paid_in_full. Tax types without returns in range are absent.
+    """
+    # Payments reduce due_amount as they are posted, so a filed return is paid
+    # in full once nothing is left due (nil returns included)
+    filed = TaxReturn.status.in_(FILED_STATUSES)
+    query = db.session.query(
+        TaxReturn.tax_type_id,
+        db.func.count(TaxReturn.id).label('total_returns'),
+        _count_where(filed).label('filed_returns'),
+        _count_where(db.and_(filed, TaxReturn.filing_date <= TaxPeriod.due_date)).label('filed_on_time'),
+        _count_where(db.and_(filed, TaxReturn.filing_date > TaxPeriod.due_date)).label('filed_late'),
+        _count_where(TaxReturn.status == 'Not Filed').label('not_filed'),
+        _count_where(db.and_(filed, TaxReturn.due_amount <= 0)).label('paid_in_full')
+    ).join(TaxPeriod, TaxReturn.tax_period_id == TaxPeriod.id)
+    
+    if start_date and end_date:
+        query = query.filter(TaxPeriod.due_date.between(start_date, end_date))
     
-    # Get not filed returns
-    not_filed = base_query.filter(TaxReturn.status == 'Not Filed').count()
+    if tax_type_id:
+        query = query.filter(TaxReturn.tax_type_id == tax_type_id)
     
-    # Calculate compliance rates
-    filing_compliance_rate = (filed_on_time / total_returns * 100) if total_returns > 0 else 0
-    overall_filing_rate = ((filed_on_time + filed_late) / total_returns * 100) if total_returns > 0 else 0
+    if positive_due_only:
+        query = query.filter(TaxReturn.due_amount > 0)
     
-    # Payment compliance
-    payment_query = base_query.filter(TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']))
-    total_assessed = payment_query.count()
+    metrics = {}
+    for row in query.group_by(TaxReturn.tax_type_id):
+        counts = row._asdict()
+        type_id = counts.pop('tax_type_id')
+        metrics[type_id] = {key: int(value) for key, value in counts.items()}
+    return metrics
+
+def compliance_rate(part, total):
+    """Percentage of part over total, rounded to two places; 0 when total is 0"""
+    return round(part / total * 100, 2) if total > 0 else 0
+
+def generate_compliance_report(start_date, end_date, tax_type_id=None):
+    """Generate report on taxpayer compliance rates and trends"""
+    metrics = compliance_by_tax_type(start_date, end_date, tax_type_id=tax_type_id)
     
-    # Count returns with completed payments
-    paid_in_full = payment_query.join(Payment).filter(Payment.status == 'Completed').count()
-    payment_compliance_rate = (paid_in_full / total_assessed * 100) if total_assessed > 0 else 0
+    # Summary totals are the sum of the per-type counts
+    totals = {key: 0 for key in ['total_returns', 'filed_returns', 'filed_on_time', 'filed_late', 'not_filed', 'paid_in_full']}
+    for counts in metrics.values():
+        for key in totals:
+            totals[key] += counts[key]
     
     # Compliance by tax type
     tax_type_compliance = []
     if not tax_type_id:  # Only show breakdown by tax type if not already filtered
-        tax_types = TaxType.query.all()
-        for tax_type in tax_types:
-            # Join TaxPeriod to filter by due_date
-            type_total = TaxReturn.query.join(TaxPeriod).filter(
-                TaxReturn.tax_type_id == tax_type.id,
-                TaxPeriod.due_date.between(start_date, end_date)
-            ).count()
-            
-            # Join TaxPeriod to filter by due_date and status
-            type_filed = TaxReturn.query.join(TaxPeriod).filter(
-                TaxReturn.tax_type_id == tax_type.id,
-                TaxReturn.status.in_(['Filed', 'Assessed', 'Finalized']),
-                TaxPeriod.due_date.between(start_date, end_date)
-            ).count()
-            
-            type_compliance = (type_filed / type_total * 100) if type_total > 0 else 0
-            
+        for tax_type in TaxType.query.all():
+            counts = metrics.get(tax_type.id, {})
+            type_total = counts.get('total_returns', 0)
+            type_filed = counts.get('filed_returns', 0)
             tax_type_compliance.append({
                 'tax_type': tax_type.name,
                 'total_returns': type_total,
                 'filed_returns': type_filed,
-                'compliance_rate': round(type_compliance, 2)
+                'compliance_rate': compliance_rate(type_filed, type_total)
             })
     
     # Prepare report data
@@ -160,13 +325,13 @@ def generate_compliance_report(start_date, end_date, tax_type_id=None):
         'title': 'Compliance Report',
         'period': f'{start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}',
         'summary': {
-            'total_returns': total_returns,
-            'filed_on_time': filed_on_time,
-            'filed_late': filed_late,
-            'not_filed': not_filed,
-            'filing_compliance_rate': round(filing_compliance_rate, 2),
-            'overall_filing_rate': round(overall_filing_rate, 2),
-            'payment_compliance_rate': round(payment_compliance_rate, 2)
+            'total_returns': totals['total_returns'],
+            'filed_on_time': totals['filed_on_time'],
+            'filed_late': totals['filed_late'],
+            'not_filed': totals['not_filed'],
+            'filing_compliance_rate': compliance_rate(totals['filed_on_time'], totals['total_returns']),
+            'overall_filing_rate': compliance_rate(totals['filed_on_time'] + totals['filed_late'], totals['total_returns']),
+            'payment_compliance_rate': compliance_rate(totals['paid_in_full'], totals['filed_returns'])
         },
         'tax_type_compliance': tax_type_compliance
     }
@@ -205,27 +370,14 @@ def generate_registration_report(start_date, end_date):
     ).count()
     
     # Monthly registration trend
+    buckets = aggregate_by_month(db.func.count(Registration.id), Registration.registered_date, start_date, end_date)
+    
     monthly_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        month_start = datetime(current_date.year, current_date.month, 1).date()
-        month_end = datetime(current_date.year, current_date.month, 
-                             calendar.monthrange(current_date.year, current_date.month)[1]).date()
-        
-        month_count = Registration.query.filter(
-            Registration.registered_date.between(month_start, month_end)
-        ).count()
-        
+    for month_start, month_count in fill_months(buckets, start_date, end_date):
         monthly_data.append({
             'month': month_start.strftime('%b %Y'),
             'count': month_count
         })
-        
-        # Move to next month
-        if current_date.month == 12:
-            current_date = datetime(current_date.year + 1, 1, 1).date()
-        else:
-            current_date = datetime(current_date.year, current_date.month + 1, 1).date()
     
     # Prepare report data
     report_data = {
@@ -373,48 +525,18 @@ def generate_refund_report(start_date, end_date, tax_type_id=None):
 def generate_revenue_report(start_date, end_date):
     """Generate report on overall revenue collection and trends"""
     # Calculate total revenue
-    total_revenue_query = db.session.query(db.func.sum(Payment.amount))\
-                          .filter(Payment.payment_date.between(start_date, end_date))
-    total_revenue = total_revenue_query.scalar() or 0
+    total_revenue = get_total_revenue(start_date, end_date)
     
     # Revenue by tax type
-    tax_type_revenue = db.session.query(
-        TaxType.name.label('tax_type'),
-        db.func.sum(Payment.amount).label('amount')
-    ).join(TaxReturn, Payment.tax_return_id == TaxReturn.id)\
-     .join(TaxType, TaxReturn.tax_type_id == TaxType.id)\
-     .filter(Payment.payment_date.between(start_date, end_date))\
-     .group_by(TaxType.name).all()
-    
     tax_type_data = []
-    for tax_type, amount in tax_type_revenue:
+    for r in get_revenue_by_tax_type(start_date, end_date):
         tax_type_data.append({
-            'tax_type': tax_type,
-            'amount': float(amount or 0)
+            'tax_type': r.tax_type,
+            'amount': float(r.total_amount or 0)
         })
     
     # Monthly revenue trend
-    monthly_data = []
-    current_date = start_date
-    while current_date <= end_date:
-        month_start = datetime(current_date.year, current_date.month, 1).date()
-        month_end = datetime(current_date.year, current_date.month, 
-                             calendar.monthrange(current_date.year, current_date.month)[1]).date()
-        
-        month_revenue = db.session.query(db.func.sum(Payment.amount))\
-                       .filter(Payment.payment_date.between(month_start, month_end))\
-                       .scalar() or 0
-        
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'amount': float(month_revenue)
-        })
-        
-        # Move to next month
-        if current_date.month == 12:
-            current_date = datetime(current_date.year + 1, 1, 1).date()
-        else:
-            current_date = datetime(current_date.year, current_date.month + 1, 1).date()
+    monthly_data = get_monthly_revenue(start_date, end_date)
     
     # Revenue vs target (simplified example)
     # In a real implementation, this would be based on actual targets
@@ -0,0 +1,217 @@
+from app import db
+from app.models.process import Person, Organization, Property, SearchDocument, SearchNgram
+from app.services.db_helpers import dialect_insert, KeysetPage
+from flask import request
+from sqlalchemy import event, inspect
+from datetime import datetime
+import math
+import re
+import unicodedata
+
+# Entity type -> (model, columns folded into its search document)
+SEARCH_FIELDS = {
+    'person': (Person, ['first_name', 'middle_name', 'last_name', 'national_id', 'passport_number']),
+    'organization': (Organization, ['name', 'registration_number', 'tax_identifier']),
+    'property': (Property, ['property_identifier', 'description', 'address']),
+}
+
+# Ranked matches considered per search; refine the term to reach anything beyond
+MAX_SEARCH_RESULTS = 500
+
+# Share of the term's trigrams a document must contain in the n-gram fallback,
+# so small typos still match (pg_trgm's similarity operator plays this role on PostgreSQL)
+NGRAM_MATCH_THRESHOLD = 0.7
+
+def normalize_text(value):
+    """Lowercase, strip accents and collapse everything but letters and digits to single spaces"""
+    if not value:
+        return ''
+    value = unicodedata.normalize('NFKD', str(value))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return re.sub(r'[^0-9a-z]+', ' ', value.lower()).strip()
+
+def trigrams(text):
+    """Distinct three-character substrings of normalized text, spaces included"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def build_document(entity_type, entity):
+    """Build the normalized search document for an entity"""
+    model, fields = SEARCH_FIELDS[entity_type]
+    return ' '.join(filter(None, (normalize_text(getattr(entity, field)) for field in fields)))
+
+def _write_documents(connection, entity_type, documents):
+    """Upsert (entity_id, document) pairs and, off PostgreSQL, their trigram rows"""
+    if not documents:
+        return
+    
+    now = datetime.utcnow()
+    entity_ids = [entity_id for entity_id, document in documents]
+    rows = [{
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'document': document,
+        'ngram_count': len(trigrams(document)),
+        'updated_at': now,
+    } for entity_id, document in documents]
+    
+    insert = dialect_insert(SearchDocument.__table__)
+    if insert is not None:
+        connection.execute(insert.values(rows).on_conflict_do_update(
+            index_elements=['entity_type', 'entity_id'],
+            set_={
+                'document': insert.excluded.document,
+                'ngram_count': insert.excluded.ngram_count,
+                'updated_at': insert.excluded.updated_at,
+            }
+        ))
+    else:
+        connection.execute(db.delete(SearchDocument).where(
+            SearchDocument.entity_type == entity_type, SearchDocument.entity_id.in_(entity_ids)
+        ))
+        connection.execute(SearchDocument.__table__.insert(), rows)
+    
+    if connection.dialect.name != 'postgresql':
+        connection.execute(db.delete(SearchNgram).where(
+            SearchNgram.entity_type == entity_type, SearchNgram.entity_id.in_(entity_ids)
+        ))
+        ngram_rows = [{'entity_type': entity_type, 'entity_id': entity_id, 'ngram': ngram}
+                      for entity_id, document in documents for ngram in trigrams(document)]
+        if ngram_rows:
+            connection.execute(SearchNgram.__table__.insert(), ngram_rows)
+
+def _delete_documents(connection, entity_type, entity_ids):
+    connection.execute(db.delete(SearchDocument).where(
+        SearchDocument.entity_type == entity_type, SearchDocument.entity_id.in_(entity_ids)
+    ))
+    connection.execute(db.delete(SearchNgram).where(
+        SearchNgram.entity_type == entity_type, SearchNgram.entity_id.in_(entity_ids)
+    ))
+
+def rebuild_search_index(entity_types=None, batch_size=1000):
+    """
+    Rebuild the search documents for the given entity types (all by default),
+    streaming entities in batches. Returns a dict of documents written per type;
+    the caller commits.
+    """
+    connection = db.session.connection()
+    counts = {}
+    for entity_type in entity_types or SEARCH_FIELDS:
+        model, fields = SEARCH_FIELDS[entity_type]
+        _delete_documents(connection, entity_type, db.select(model.id))
+    
+        rows = db.session.query(model.id, *[getattr(model, field) for field in fields]).order_by(model.id)
+        batch = []
+        counts[entity_type] = 0
+        for row in rows.yield_per(batch_size):
+            batch.append((row[0], ' '.join(filter(None, (normalize_text(value) for value in row[1:])))))
+            if len(batch) >= batch_size:
+                _write_documents(connection, entity_type, batch)
+                counts[entity_type] += len(batch)
+                batch = []
+        _write_documents(connection, entity_type, batch)
+        counts[entity_type] += len(batch)
+    return counts
+
+def ranked_matches(entity_type, term):
+    """
+    Return a select of (entity_id, rank) for the best matches of term, or None
+    when the term has nothing searchable. PostgreSQL combines full-text prefix
+    matching with pg_trgm substring and similarity matching; other databases use
+    the trigram table, ranked by Jaccard similarity to the term.
+    """
+    normalized = normalize_text(term)
+    if not normalized:
+        return None
+    
+    if db.engine.dialect.name == 'postgresql':
+        vector = db.literal_column('search_documents.search_vector')
+        tsquery = db.func.to_tsquery('simple', ' & '.join(f'{token}:*' for token in normalized.split()))
+        rank = db.func.ts_rank(vector, tsquery) + db.func.similarity(SearchDocument.document, normalized)
+        return db.select(SearchDocument.entity_id, rank.label('rank')).where(
+            SearchDocument.entity_type == entity_type,
+            db.or_(
+                vector.op('@@')(tsquery),
+                SearchDocument.document.like(f'%{normalized}%'),
+                SearchDocument.document.op('%')(normalized)
+            )
+        ).order_by(rank.desc()).limit(MAX_SEARCH_RESULTS)
+    
+    grams = trigrams(normalized)
+    if not grams:
+        # Too short for trigrams; rank substring hits by how much of the document they cover
+        rank = db.literal(len(normalized)) * 1.0 / db.func.length(SearchDocument.document)
+        return db.select(SearchDocument.entity_id, rank.label('rank')).where(
+            SearchDocument.entity_type == entity_type,
+            SearchDocument.document.like(f'%{normalized}%')
+        ).order_by(rank.desc()).limit(MAX_SEARCH_RESULTS)
+    
+    matched = db.select(
+        SearchNgram.entity_id.label('entity_id'),
+        db.func.count(SearchNgram.id).label('matched')
+    ).where(
+        SearchNgram.entity_type == entity_type,
+        SearchNgram.ngram.in_(grams)
+    ).group_by(SearchNgram.entity_id).having(
+        db.func.count(SearchNgram.id) >= max(1, math.ceil(len(grams) * NGRAM_MATCH_THRESHOLD))
+    ).subquery()
+    
+    rank = matched.c.matched * 1.0 / (SearchDocument.ngram_count + len(grams) - matched.c.matched)
+    return db.select(SearchDocument.entity_id, rank.label('rank')).join(
+        matched, db.and_(matched.c.entity_id == SearchDocument.entity_id,
+                         SearchDocument.entity_type == entity_type)
+    ).order_by(rank.desc()).limit(MAX_SEARCH_RESULTS)
+
+def search_page(query, entity_type, term, per_page=20, after=None, before=None):
+    """
+    Run a ranked search and return one page of entities, best match first, as a
+    KeysetPage. query is the entity's model query with any extra filters applied.
+    Cursors are offsets into the bounded ranked result set.
+    """
+    model = SEARCH_FIELDS[entity_type][0]
+    matches = ranked_matches(entity_type, term)
+    if matches is None:
+        return KeysetPage([], per_page, False, False, None, None)
+    
+    ranked = matches.subquery()
+    query = query.join(ranked, ranked.c.entity_id == model.id).order_by(None).order_by(ranked.c.rank.desc(), model.id)
+    
+    try:
+        offset = int(after) if after else max(0, int(before) - per_page) if before else 0
+    except ValueError:
+        offset = 0
+    offset = max(0, offset)
+    
+    items = query.offset(offset).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    return KeysetPage(
+        items=items[:per_page],
+        per_page=per_page,
+        has_next=has_next,
+        has_prev=offset > 0,
+        next_cursor=str(offset + per_page),
+        prev_cursor=str(offset)
+    )
+
+def search_page_request(query, entity_type, term, per_page=20):
+    """search_page with the after/before cursors of the current request"""
+    return search_page(query, entity_type, term, per_page=per_page,
+                       after=request.args.get('after') or None,
+                       before=request.args.get('before') or None)
+
+def _register_index_listeners(entity_type, model, fields):
+    @event.listens_for(model, 'after_insert')
+    def index_inserted(mapper, connection, entity):
+        _write_documents(connection, entity_type, [(entity.id, build_document(entity_type, entity))])
+    
+    @event.listens_for(model, 'after_update')
+    def index_updated(mapper, connection, entity):
+        state = inspect(entity)
+        if any(state.attrs[field].history.has_changes() for field in fields):
+            _write_documents(connection, entity_type, [(entity.id, build_document(entity_type, entity))])
+    
+    @event.listens_for(model, 'after_delete')
+    def unindex_deleted(mapper, connection, entity):
+        _delete_documents(connection, entity_type, [entity.id])
+
+for _entity_type, (_model, _fields) in SEARCH_FIELDS.items():
+    _register_index_listeners(_entity_type, _model, _fields)
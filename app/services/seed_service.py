@@ -0,0 +1,122 @@
+from app import db
+from app.models.user import User, UserType
+from app.models.tax import TaxType, TaxPeriod, TaxRateSchedule
+from app.services.db_helpers import dialect_insert
+from app.services.rate_service import set_rate_schedule
+from datetime import date
+
+DEFAULT_USER_TYPES = [
+    {'name': 'Individual', 'description': 'Individual taxpayer'},
+    {'name': 'Non-Individual', 'description': 'Business or organization'},
+    {'name': 'Agent', 'description': 'Tax agent or representative'},
+    {'name': 'Administrator', 'description': 'System administrator'},
+]
+
+DEFAULT_TAX_TYPES = [
+    {'code': 'VAT', 'name': 'Value Added Tax', 'description': 'Tax on goods and services', 'is_core': True},
+    {'code': 'PIT', 'name': 'Personal Income Tax', 'description': 'Tax on individual income', 'is_core': True},
+    {'code': 'CIT', 'name': 'Corporate Income Tax', 'description': 'Tax on corporate profits', 'is_core': True},
+    {'code': 'WHT', 'name': 'Withholding Tax', 'description': 'Tax withheld at source', 'is_core': True},
+]
+
+# Rate schedules seeded for tax types that have none: code -> (lower_bound, marginal rate) brackets
+DEFAULT_RATE_SCHEDULES = {
+    'VAT': [(0, '0.15')],
+    'PIT': [(0, '0.10'), (50000, '0.15'), (100000, '0.25'), (250000, '0.35')],
+    'CIT': [(0, '0.28')],
+    'WT': [(0, '0.15')],
+    'WHT': [(0, '0.15')],
+    'PT': [(0, '0.02')],
+    'EXT': [(0, '0.10')],
+}
+DEFAULT_RATE_EFFECTIVE_FROM = date(2000, 1, 1)
+
+def _insert_missing(model, rows, key):
+    """
+    Insert rows whose unique key column is not already present, in one statement
+    where the dialect supports ON CONFLICT DO NOTHING. Returns the number of rows inserted.
+    """
+    if not rows:
+        return 0
+    
+    insert = dialect_insert(model.__table__)
+    if insert is not None:
+        result = db.session.execute(insert.values(rows).on_conflict_do_nothing(index_elements=[key]))
+        return result.rowcount
+    
+    existing = {value for (value,) in db.session.query(getattr(model, key)).filter(
+        getattr(model, key).in_([row[key] for row in rows])
+    )}
+    missing = [row for row in rows if row[key] not in existing]
+    if missing:
+        db.session.execute(model.__table__.insert(), missing)
+    return len(missing)
+
+def quarterly_periods(year):
+    """Return (period_code, start_date, end_date) for each quarter of a year"""
+    return [
+        (f'{year}-Q1', date(year, 1, 1), date(year, 3, 31)),
+        (f'{year}-Q2', date(year, 4, 1), date(year, 6, 30)),
+        (f'{year}-Q3', date(year, 7, 1), date(year, 9, 30)),
+        (f'{year}-Q4', date(year, 10, 1), date(year, 12, 31)),
+    ]
+
+def seed_reference_data(year=2025, admin_password='admin'):
+    """
+    Idempotently seed user types, the default admin user, tax types, the
+    quarterly tax periods for a year and default rate schedules. Safe to run
+    repeatedly; existing rows are left untouched. Returns a dict of inserted row counts; the caller commits.
+    """
+    counts = {}
+    counts['user_types'] = _insert_missing(UserType, DEFAULT_USER_TYPES, 'name')
+    counts['tax_types'] = _insert_missing(TaxType, DEFAULT_TAX_TYPES, 'code')
+    
+    # Create the admin user only if missing, so the password hash is computed at most once.
+    # Built through the model so User.__init__ gives it a two-factor secret.
+    counts['users'] = 0
+    if not db.session.query(User.query.filter_by(username='admin').exists()).scalar():
+        admin_type_id = db.session.query(UserType.id).filter_by(name='Administrator').scalar()
+        admin = User(
+            username='admin',
+            email='admin@example.com',
+            first_name='Admin',
+            last_name='User',
+            is_admin=True,
+            is_active=True,
+            user_type_id=admin_type_id
+        )
+        admin.set_password(admin_password)
+        db.session.add(admin)
+        db.session.flush()
+        counts['users'] = 1
+    
+    # Tax periods have no unique key, so compare against the existing codes in one query
+    tax_type_ids = [tax_type_id for (tax_type_id,) in db.session.query(TaxType.id)]
+    quarters = quarterly_periods(year)
+    existing = {tuple(row) for row in db.session.query(TaxPeriod.tax_type_id, TaxPeriod.period_code).filter(
+        TaxPeriod.period_code.in_([code for code, start, end in quarters])
+    )}
+    periods = [{
+        'period_code': code,
+        'start_date': start,
+        'end_date': end,
+        'due_date': end,
+        'tax_type_id': tax_type_id,
+        'status': 'Open',
+    } for tax_type_id in tax_type_ids for code, start, end in quarters if (tax_type_id, code) not in existing]
+    if periods:
+        db.session.execute(TaxPeriod.__table__.insert(), periods)
+    counts['tax_periods'] = len(periods)
+    
+    # Rate schedules for tax types without any, so calculations never fall back silently
+    scheduled = {tax_type_id for (tax_type_id,) in db.session.query(TaxRateSchedule.tax_type_id).distinct()}
+    unscheduled = db.session.query(TaxType.id, TaxType.code).filter(
+        TaxType.code.in_(list(DEFAULT_RATE_SCHEDULES))
+    ).all()
+    counts['tax_rate_schedules'] = 0
+    for tax_type_id, code in unscheduled:
+        if tax_type_id not in scheduled:
+            set_rate_schedule(tax_type_id, DEFAULT_RATE_EFFECTIVE_FROM, DEFAULT_RATE_SCHEDULES[code], 'Default rates')
+            counts['tax_rate_schedules'] += 1
+    
+    return counts
@@ -0,0 +1,301 @@
+from app import db
+from app.models.user import User, UserType, Account
+from app.models.tax import TaxType, TaxPeriod, TaxReturn
+from app.models.registration import TaxpayerLedger
+from app.services.rate_service import (compile_schedule, rate_schedules, schedule_in_force,
+                                       taxable_income_for_tax, calculate_tax_batch)
+from app.services.report_job_service import POLICY_SIMULATION, submit_report_job
+from flask import current_app
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from decimal import Decimal, InvalidOperation
+import json
+import multiprocessing
+import os
+import time
+
+# Ways to break the revenue delta down
+SIMULATION_SEGMENTS = {
+    'tax_type': 'Tax type',
+    'taxpayer_type': 'Taxpayer type',
+    'income_band': 'Taxable income band',
+}
+
+# Lower bounds of the taxable income bands used by the income_band segment
+SIMULATION_INCOME_BANDS = (0, 50000, 100000, 250000, 1000000)
+
+# Only filed returns carry a liability to re-price
+SIMULATED_RETURN_STATUSES = ('Filed', 'Assessed', 'Finalized')
+
+# Liability changes up to this are rounding from inverting the current schedule,
+# and count as neither an increase nor a decrease
+SIMULATION_CHANGE_TOLERANCE = Decimal('0.01')
+
+# Per-process inputs of _simulate_range, set by _init_worker in each pool process
+_worker = {}
+
+def parse_brackets(text):
+    """
+    Parse brackets written as LOWER_BOUND:RATE pairs separated by commas or new
+    lines, e.g. "0:0.10, 50000:0.15". Raises ValueError on malformed input.
+    """
+    brackets = []
+    for part in text.replace('\n', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        lower, separator, rate = part.partition(':')
+        try:
+            brackets.append((Decimal(lower.strip().replace(' ', '')), Decimal(rate.strip())))
+        except InvalidOperation:
+            raise ValueError(f'Bracket "{part}" is not written LOWER_BOUND:RATE')
+    compile_schedule(brackets)
+    return brackets
+
+def format_brackets(schedule):
+    """Write a CompiledSchedule back as LOWER_BOUND:RATE pairs"""
+    return ', '.join(f'{lower.normalize():f}:{rate.normalize():f}'
+                     for lower, rate in zip(schedule.lower_bounds, schedule.rates))
+
+def _income_band(income):
+    index = max(0, bisect_right(SIMULATION_INCOME_BANDS, income) - 1)
+    if index + 1 < len(SIMULATION_INCOME_BANDS):
+        return f'{SIMULATION_INCOME_BANDS[index]:,} - {SIMULATION_INCOME_BANDS[index + 1]:,}'
+    return f'{SIMULATION_INCOME_BANDS[index]:,}+'
+
+def _init_worker(current_schedules, alternatives, segment_by, periods, database_url=None):
+    """
+    Set the inputs of _simulate_range for this process. Pool processes get a
+    database_url and open their own engine; the parent process reuses db.session.
+    """
+    _worker.update(current=current_schedules, alternatives=alternatives, segment_by=segment_by, periods=periods,
+                   engine=create_engine(database_url) if database_url else None)
+
+def _simulate_chunk(rows):
+    """
+    Re-price one chunk of (tax_type_id, period_end, taxpayer_type, liability)
+    rows. Each liability is turned back into the taxable income the schedule in
+    force at its period end implies, then taxed under the alternative
+    schedule. Returns {segment: [returns, current, simulated, increased, decreased]}.
+    """
+    current, alternatives, segment_by = _worker['current'], _worker['alternatives'], _worker['segment_by']
+    positions = {}
+    for position, row in enumerate(rows):
+        positions.setdefault(row[0], []).append(position)
+    
+    # Re-price each tax type's rows in one batch
+    incomes = [None] * len(rows)
+    simulated = [None] * len(rows)
+    for tax_type_id, type_positions in positions.items():
+        type_incomes = [taxable_income_for_tax(schedule_in_force(current, tax_type_id, rows[position][1]),
+                                               rows[position][3]) for position in type_positions]
+        taxes = calculate_tax_batch(None, type_incomes, schedule=alternatives[tax_type_id])
+        for position, income, tax in zip(type_positions, type_incomes, taxes):
+            incomes[position] = income
+            simulated[position] = tax
+    
+    totals = {}
+    for (tax_type_id, period_end, taxpayer_type, liability), income, new_liability in zip(rows, incomes, simulated):
+        if segment_by == 'tax_type':
+            segment = tax_type_id
+        elif segment_by == 'taxpayer_type':
+            segment = taxpayer_type or 'Unknown'
+        else:
+            segment = _income_band(income)
+        total = totals.setdefault(segment, [0, Decimal('0'), Decimal('0'), 0, 0])
+        total[0] += 1
+        total[1] += liability
+        total[2] += new_liability
+        total[3] += new_liability - liability > SIMULATION_CHANGE_TOLERANCE
+        total[4] += liability - new_liability > SIMULATION_CHANGE_TOLERANCE
+    return totals
+
+def _merge(totals, chunk_totals):
+    for segment, values in chunk_totals.items():
+        total = totals.setdefault(segment, [0, Decimal('0'), Decimal('0'), 0, 0])
+        for index, value in enumerate(values):
+            total[index] += value
+
+def _simulated_returns(session, periods):
+    """Query of the ids of the filed returns of the given periods"""
+    return session.query(TaxReturn.id).filter(
+        TaxReturn.tax_period_id.in_(list(periods)),
+        TaxReturn.status.in_(SIMULATED_RETURN_STATUSES)
+    )
+
+def _chunk_bounds(periods, chunk_size):
+    """
+    Yield (after_id, last_id) ranges holding chunk_size simulated returns each.
+    The database skips to each boundary itself, so only the boundary ids are read here.
+    """
+    query = _simulated_returns(db.session, periods)
+    after_id = 0
+    while True:
+        last_id = query.filter(TaxReturn.id > after_id).order_by(TaxReturn.id).offset(chunk_size - 1).limit(1).scalar()
+        if last_id is None:
+            last_id = query.filter(TaxReturn.id > after_id).with_entities(db.func.max(TaxReturn.id)).scalar()
+            if last_id is not None:
+                yield after_id, last_id
+            return
+        yield after_id, last_id
+        after_id = last_id
+
+def _load_chunk(session, periods, with_taxpayer_type, after_id, last_id):
+    """
+    Read (tax_type_id, period_end, taxpayer_type, liability) for the simulated
+    returns with ids in (after_id, last_id]. The liability is the return's
+    Assessment ledger debits, falling back to its due amount when none were posted.
+    """
+    columns = [TaxReturn.tax_type_id, TaxReturn.tax_period_id, TaxReturn.due_amount, TaxReturn.reference_number]
+    if with_taxpayer_type:
+        columns.append(UserType.name)
+    query = _simulated_returns(session, periods).with_entities(*columns).filter(
+        TaxReturn.id > after_id, TaxReturn.id <= last_id
+    )
+    if with_taxpayer_type:
+        query = query.outerjoin(Account, Account.id == TaxReturn.account_id).outerjoin(
+            User, User.id == Account.user_id
+        ).outerjoin(UserType, UserType.id == User.user_type_id)
+    rows = query.all()
+    
+    references = [row.reference_number for row in rows if row.reference_number]
+    assessed = dict(session.query(
+        TaxpayerLedger.reference_number, db.func.sum(TaxpayerLedger.debit_amount)
+    ).filter(
+        TaxpayerLedger.reference_number.in_(references),
+        TaxpayerLedger.transaction_type == 'Assessment'
+    ).group_by(TaxpayerLedger.reference_number).all()) if references else {}
+    
+    return [(
+        row.tax_type_id,
+        periods[row.tax_period_id],
+        row.name if with_taxpayer_type else None,
+        Decimal(str(assessed.get(row.reference_number, row.due_amount) or 0))
+    ) for row in rows]
+
+def _simulate_range(after_id, last_id):
+    """Read and re-price the returns with ids in (after_id, last_id]"""
+    with_taxpayer_type = _worker['segment_by'] == 'taxpayer_type'
+    if _worker['engine'] is None:
+        return _simulate_chunk(_load_chunk(db.session, _worker['periods'], with_taxpayer_type, after_id, last_id))
+    with Session(_worker['engine']) as session:
+        return _simulate_chunk(_load_chunk(session, _worker['periods'], with_taxpayer_type, after_id, last_id))
+
+def run_simulation(schedules, start_date, end_date, segment_by='tax_type', processes=1, chunk_size=10000):
+    """
+    Re-price the filed returns of the tax types in schedules ({tax_type_id:
+    [(lower_bound, rate), ...]}) for periods ending between start_date and
+    end_date, and report the revenue delta overall and per segment. Returns
+    are split into id ranges of chunk_size; with processes > 1 each range is
+    read and re-priced by a pool process on its own connection, with at most
+    two ranges in flight per process, so memory stays bounded however many
+    returns there are.
+    """
+    if segment_by not in SIMULATION_SEGMENTS:
+        raise ValueError(f'Unknown segment: {segment_by}')
+    if not schedules:
+        raise ValueError('Give an alternative schedule for at least one tax type')
+    
+    started = time.perf_counter()
+    alternatives = {int(tax_type_id): compile_schedule(brackets) for tax_type_id, brackets in schedules.items()}
+    current = rate_schedules()
+    periods = dict(db.session.query(TaxPeriod.id, TaxPeriod.end_date).filter(
+        TaxPeriod.tax_type_id.in_(list(alternatives)),
+        TaxPeriod.end_date >= start_date,
+        TaxPeriod.end_date <= end_date
+    ).all())
+    bounds = _chunk_bounds(periods, chunk_size) if periods else iter(())
+    
+    totals = {}
+    if processes <= 1:
+        _init_worker(current, alternatives, segment_by, periods)
+        for after_id, last_id in bounds:
+            _merge(totals, _simulate_range(after_id, last_id))
+    else:
+        # Spawned workers start without the parent's database connections and open their own
+        context = multiprocessing.get_context('spawn')
+        database_url = db.engine.url.render_as_string(hide_password=False)
+        with ProcessPoolExecutor(processes, mp_context=context, initializer=_init_worker,
+                                 initargs=(current, alternatives, segment_by, periods, database_url)) as pool:
+            in_flight = set()
+            for after_id, last_id in bounds:
+                in_flight.add(pool.submit(_simulate_range, after_id, last_id))
+                if len(in_flight) >= processes * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _merge(totals, future.result())
+            for future in wait(in_flight).done:
+                _merge(totals, future.result())
+    
+    return _simulation_result(totals, alternatives, start_date, end_date, segment_by,
+                              time.perf_counter() - started)
+
+def _simulation_result(totals, alternatives, start_date, end_date, segment_by, elapsed):
+    codes = dict(db.session.query(TaxType.id, TaxType.code).filter(TaxType.id.in_(list(alternatives))).all())
+    current_revenue = sum((values[1] for values in totals.values()), Decimal('0'))
+    simulated_revenue = sum((values[2] for values in totals.values()), Decimal('0'))
+    delta = simulated_revenue - current_revenue
+    
+    segments = []
+    for segment, (returns, current, simulated, increased, decreased) in totals.items():
+        segments.append({
+            'segment': codes.get(segment, segment) if segment_by == 'tax_type' else segment,
+            'returns': returns,
+            'current_revenue': current,
+            'simulated_revenue': simulated,
+            'delta': simulated - current,
+            'delta_percent': (simulated - current) / current * 100 if current else None,
+            'share_of_delta': (simulated - current) / delta * 100 if delta else None,
+            'increased': increased,
+            'decreased': decreased,
+        })
+    if segment_by == 'income_band':
+        band_order = [_income_band(lower) for lower in SIMULATION_INCOME_BANDS]
+        segments.sort(key=lambda row: band_order.index(row['segment']))
+    else:
+        segments.sort(key=lambda row: str(row['segment']))
+    
+    return {
+        'title': 'Tax Policy Simulation',
+        'period': f'{start_date.strftime("%Y-%m-%d")} to {end_date.strftime("%Y-%m-%d")}',
+        'segment_by': segment_by,
+        'schedules': {codes.get(tax_type_id, tax_type_id): format_brackets(schedule)
+                      for tax_type_id, schedule in alternatives.items()},
+        'summary': {
+            'returns': sum(values[0] for values in totals.values()),
+            'current_revenue': current_revenue,
+            'simulated_revenue': simulated_revenue,
+            'delta': delta,
+            'delta_percent': delta / current_revenue * 100 if current_revenue else None,
+            'elapsed_seconds': round(elapsed, 2),
+        },
+        'segments': segments,
+    }
+
+def simulation_parameters(schedules, segment_by):
+    """The JSON stored on a simulation job; sorted so identical requests share a job"""
+    return json.dumps({
+        'schedules': {str(tax_type_id): [[str(lower), str(rate)] for lower, rate in brackets]
+                      for tax_type_id, brackets in schedules.items()},
+        'segment_by': segment_by,
+    }, sort_keys=True)
+
+def submit_simulation_job(schedules, start_date, end_date, segment_by='tax_type', user=None):
+    """Queue a simulation for the report worker and return its ReportJob. The caller commits."""
+    if segment_by not in SIMULATION_SEGMENTS:
+        raise ValueError(f'Unknown segment: {segment_by}')
+    for brackets in schedules.values():
+        compile_schedule(brackets)
+    return submit_report_job(POLICY_SIMULATION, start_date, end_date, user=user,
+                             parameters=simulation_parameters(schedules, segment_by))
+
+def run_simulation_job(job):
+    """Run the simulation stored on a claimed report job and return its result"""
+    parameters = json.loads(job.parameters)
+    schedules = {int(tax_type_id): [(Decimal(lower), Decimal(rate)) for lower, rate in brackets]
+                 for tax_type_id, brackets in parameters['schedules'].items()}
+    processes = current_app.config.get('SIMULATION_PROCESSES') or os.cpu_count() or 1
+    return run_simulation(schedules, job.start_date, job.end_date, parameters['segment_by'], processes=processes,
+                          chunk_size=current_app.config.get('SIMULATION_CHUNK_SIZE', 10000))
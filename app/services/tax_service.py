@@ -1,33 +1,37 @@
 from app import db
 from app.models.tax import TaxType, TaxPeriod, TaxReturn, Payment, Refund, Objection
 from app.models.registration import TaxpayerLedger
+from app.services.ledger_service import post_ledger_entry, get_balance
+from app.services.reference_service import generate_reference
+from app.services.payment_service import post_payment
+from app.services.rate_service import calculate_tax
+from app.services.flagging_service import build_chunk, evaluate_flag_rules, latest_refund_amounts
 from datetime import datetime
 from decimal import Decimal
-import uuid
 
 
+def return_flag_reasons(due_amount, filing_date=None, period_due_date=None, recent_refund_amount=None, account_id=None):
+    """
+    Return the compliance reasons to flag a return for, given its assessed due
+    amount, filing date, the due date of its period and the account's most
+    recent refund.
+    Evaluates the rules registered in flagging_service on a one-row chunk.
+    """
+    chunk = build_chunk([(None, account_id, due_amount, filing_date, period_due_date, recent_refund_amount)])
+    return evaluate_flag_rules(chunk)[0]
+
 def auto_flag_return(tax_return):
     """
     Automatically flag a tax return if it violates certain compliance conditions.
     Sets is_flagged and flag_reason on the tax_return instance.
     """
-    reasons = []
-    # Example rule 1: Negative or zero due amount
-    if tax_return.due_amount is None or Decimal(tax_return.due_amount) <= 0:
-        reasons.append("Due amount is zero or negative.")
-    # Example rule 2: Excessive refund (if refund > 80% of due)
-    refund = Refund.query.filter_by(account_id=tax_return.account_id).order_by(Refund.request_date.desc()).first()
-    if refund and tax_return.due_amount and refund.amount:
-        try:
-            if Decimal(refund.amount) > Decimal(tax_return.due_amount) * Decimal('0.8'):
-                reasons.append(f"Recent refund ({refund.amount}) exceeds 80% of due amount ({tax_return.due_amount}).")
-        except Exception:
-            pass
-    # Example rule 3: Late filing (filed after period due date)
-    if tax_return.filing_date and tax_return.period and tax_return.period.due_date:
-        if tax_return.filing_date.date() > tax_return.period.due_date:
-            reasons.append("Return filed after due date.")
-    # Add more rules as needed
+    reasons = return_flag_reasons(
+        tax_return.due_amount,
+        tax_return.filing_date,
+        tax_return.period.due_date if tax_return.period else None,
+        latest_refund_amounts([tax_return.account_id]).get(tax_return.account_id),
+        tax_return.account_id
+    )
     if reasons:
         tax_return.is_flagged = True
         tax_return.flag_reason = "; ".join(reasons)
@@ -35,50 +39,13 @@ def auto_flag_return(tax_return):
         tax_return.is_flagged = False
         tax_return.flag_reason = None
 
-def calculate_tax_due(tax_type_id, income, deductions=0):
-    """
-    Calculate tax due based on tax type, income, and deductions
-    This is a simplified implementation - in a real system, this would be more complex
-    with progressive tax rates, etc.
-    """
-    tax_type = TaxType.query.get(tax_type_id)
-    taxable_income = max(0, income - deductions)
-    
-    # Simple tax calculation based on tax type
-    if tax_type.code == 'VAT':
-        # VAT is typically a flat percentage
-        return taxable_income * 0.15  # 15% VAT rate
-    elif tax_type.code == 'PIT':
-        # Personal Income Tax with progressive rates
-        if taxable_income <= 50000:
-            return taxable_income * 0.10
-        elif taxable_income <= 100000:
-            return 5000 + (taxable_income - 50000) * 0.15
-        elif taxable_income <= 250000:
-            return 12500 + (taxable_income - 100000) * 0.25
-        else:
-            return 50000 + (taxable_income - 250000) * 0.35
-    elif tax_type.code == 'CIT':
-        # Corporate Income Tax - typically flat rate
-        return taxable_income * 0.28  # 28% corporate tax rate
-    elif tax_type.code == 'WT':
-        # Withholding Tax - typically flat rate
-        return taxable_income * 0.15  # 15% withholding tax rate
-    elif tax_type.code == 'PT':
-        # Property Tax - typically based on property value
-        return taxable_income * 0.02  # 2% property tax rate
-    elif tax_type.code == 'EXT':
-        # Excise Tax - typically specific rates for specific goods
-        return taxable_income * 0.10  # 10% excise tax rate
-    else:
-        # Default rate for other tax types
-        return taxable_income * 0.15  # 15% default rate
-
-def generate_reference_number():
+def calculate_tax_due(tax_type_id, income, deductions=0, on_date=None):
     """
-    Generate a unique reference number for tax returns, payments, etc.
+    Calculate tax due based on tax type, income, and deductions, using the
+    tax type's rate schedule in force on on_date (today by default).
+    Returns a Decimal rounded to the cent.
     """
-    return f"TX-{uuid.uuid4().hex[:8].upper()}"
+    return calculate_tax(tax_type_id, income, deductions, on_date)
 
 def get_tax_periods_for_tax_type(tax_type_id):
     """
@@ -131,11 +98,67 @@ def get_total_paid_for_tax_return(tax_return_id):
 
 def get_balance_for_tax_return(tax_return_id):
     """
-    Calculate the remaining balance for a specific tax return
+    Calculate the remaining balance for a specific tax return. Payments reduce
+    due_amount as they are posted, so it already is the balance.
     """
     tax_return = TaxReturn.query.get(tax_return_id)
-    total_paid = get_total_paid_for_tax_return(tax_return_id)
-    return max(0, tax_return.due_amount - total_paid)
+    return max(0, tax_return.due_amount or 0)
+
+def return_balances_query(account_ids=None, outstanding_only=False, exclude_pending_objections=False):
+    """
+    Build a query of (TaxReturn, paid_amount, remaining, has_pending_objection) rows.
+    remaining is the return's due_amount, which payments reduce as they post;
+    paid_amount is for display. Completed payments and open objections are aggregated once for the whole result
+    set instead of per return, so callers can filter, order and paginate it directly.
+    account_ids may be a list or a select of account ids; None means all accounts.
+    """
+    paid = db.session.query(
+        Payment.tax_return_id.label('tax_return_id'),
+        db.func.sum(Payment.amount).label('paid_amount')
+    ).filter(Payment.status == 'Completed').group_by(Payment.tax_return_id).subquery()
+    
+    pending = db.session.query(
+        Objection.tax_return_id.label('tax_return_id'),
+        db.func.count(Objection.id).label('pending_count')
+    ).filter(Objection.status.in_(['Pending', 'In Progress'])).group_by(Objection.tax_return_id).subquery()
+    
+    paid_amount = db.func.coalesce(paid.c.paid_amount, 0)
+    remaining = db.func.coalesce(TaxReturn.due_amount, 0)
+    has_pending_objection = pending.c.pending_count.isnot(None)
+    
+    query = db.session.query(
+        TaxReturn,
+        paid_amount.label('paid_amount'),
+        remaining.label('remaining'),
+        has_pending_objection.label('has_pending_objection')
+    ).outerjoin(paid, paid.c.tax_return_id == TaxReturn.id
+    ).outerjoin(pending, pending.c.tax_return_id == TaxReturn.id)
+    
+    if account_ids is not None:
+        query = query.filter(TaxReturn.account_id.in_(account_ids))
+    
+    if outstanding_only:
+        query = query.filter(remaining > 0)
+    
+    if exclude_pending_objections:
+        query = query.filter(pending.c.pending_count.is_(None))
+    
+    return query
+
+def get_returns_under_audit(tax_return_ids):
+    """
+    Return the subset of tax_return_ids that have an open audit, using the indexed
+    audits.tax_return_id link rather than scanning all audits or notifications.
+    """
+    if not tax_return_ids:
+        return set()
+    
+    from app.models.process import Audit
+    rows = db.session.query(Audit.tax_return_id).filter(
+        Audit.tax_return_id.in_(tax_return_ids),
+        Audit.status.notin_(['Completed', 'Cancelled'])
+    ).distinct()
+    return {row.tax_return_id for row in rows}
 
 def get_refunds_for_account(account_id, status=None):
     """
@@ -178,66 +201,20 @@ def get_ledger_entries_for_account(account_id, tax_type_id=None, start_date=None
 
 def get_account_balance(account_id, tax_type_id=None):
     """
-    Calculate the current balance for an account, optionally for a specific tax type
+    Get the current balance for an account, optionally for a specific tax type.
+    Reads the account_balances snapshot maintained by ledger_service.post_ledger_entry.
     """
-    query = db.session.query(db.func.sum(TaxpayerLedger.debit_amount).label('debits'),
-                           db.func.sum(TaxpayerLedger.credit_amount).label('credits'))\
-                    .filter_by(account_id=account_id)
-    
-    if tax_type_id:
-        query = query.filter_by(tax_type_id=tax_type_id)
-    
-    result = query.first()
-    debits = result.debits or 0
-    credits = result.credits or 0
-    
-    return debits - credits
+    return get_balance(account_id, tax_type_id)
 
-def process_payment(tax_return_id, amount, payment_method, reference_number=None):
+def process_payment(tax_return_id, amount, payment_method, reference_number=None, idempotency_key=None):
     """
     Process a payment for a tax return
     """
-    tax_return = TaxReturn.query.get(tax_return_id)
-    
-    if not tax_return:
-        return False, "Tax return not found"
-    
-    if not reference_number:
-        reference_number = f"PMT-{uuid.uuid4().hex[:8].upper()}"
-    
-    # Create payment
-    payment = Payment(
-        tax_return_id=tax_return_id,
-        amount=amount,
-        payment_date=datetime.utcnow(),
-        payment_method=payment_method,
-        reference_number=reference_number,
-        status='Completed'
-    )
-    
-    db.session.add(payment)
-    
-    # Create ledger entry
-    ledger_entry = TaxpayerLedger(
-        account_id=tax_return.account_id,
-        tax_type_id=tax_return.tax_type_id,
-        tax_period_id=tax_return.tax_period_id,
-        transaction_date=datetime.utcnow().date(),
-        transaction_type='Payment',
-        description=f'Payment for {tax_return.reference_number}',
-        debit_amount=0,
-        credit_amount=amount,
-        balance=tax_return.due_amount - amount,  # This is simplified, should consider previous payments
-        reference_number=reference_number
-    )
-    
-    db.session.add(ledger_entry)
-    
-    # Update tax return status if fully paid
-    total_paid = get_total_paid_for_tax_return(tax_return_id) + amount
-    
-    if total_paid >= tax_return.due_amount:
-        tax_return.status = 'Finalized'
+    try:
+        post_payment(tax_return_id, Decimal(str(amount)), payment_method, idempotency_key=idempotency_key,
+                     reference_number=reference_number)
+    except ValueError as e:
+        return False, str(e)
     
     db.session.commit()
     
@@ -247,7 +224,7 @@ def process_refund_request(account_id, amount, reason):
     """
     Process a refund request
     """
-    reference_number = f"REF-{uuid.uuid4().hex[:8].upper()}"
+    reference_number = generate_reference('REF')
     
     # Create refund request
     refund = Refund(
@@ -274,19 +251,17 @@ def approve_refund(refund_id):
     refund.status = 'Approved'
     refund.approval_date = datetime.utcnow()
     
-    # Create ledger entry for approved refund
-    ledger_entry = TaxpayerLedger(
+    # Create ledger entry for approved refund (refunds are not tied to a tax type,
+    # so post against the first tax type as the refund routes do)
+    default_tax_type = TaxType.query.first()
+    post_ledger_entry(
         account_id=refund.account_id,
-        transaction_date=datetime.utcnow().date(),
+        tax_type_id=default_tax_type.id,
         transaction_type='Refund',
         description=f'Approved refund: {refund.reference_number}',
-        debit_amount=0,
         credit_amount=refund.amount,
-        balance=-refund.amount,  # This is simplified, should consider account balance
         reference_number=refund.reference_number
     )
-    
-    db.session.add(ledger_entry)
     db.session.commit()
     
     return True, "Refund approved successfully"
@@ -300,7 +275,7 @@ def process_objection(tax_return_id, reason):
     if not tax_return:
         return False, "Tax return not found"
     
-    reference_number = f"OBJ-{uuid.uuid4().hex[:8].upper()}"
+    reference_number = generate_reference('OBJ')
     
     # Create objection
     objection = Objection(
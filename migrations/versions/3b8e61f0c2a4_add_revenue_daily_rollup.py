@@ -0,0 +1,43 @@
+"""Add revenue_daily_rollup table
+
+Revision ID: 3b8e61f0c2a4
+Revises: d3f6c8cd8758
+Create Date: 2026-10-18 09:12:40.118302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8e61f0c2a4'
+down_revision = 'd3f6c8cd8758'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('revenue_daily_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('rollup_date', sa.Date(), nullable=False),
+        sa.Column('tax_type_id', sa.Integer(), nullable=False),
+        sa.Column('payment_method', sa.String(length=20), nullable=False),
+        sa.Column('total_amount', sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column('payment_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tax_type_id'], ['tax_types.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('rollup_date', 'tax_type_id', 'payment_method', name='uq_revenue_daily_rollup_key')
+    )
+    # Backfill from existing completed payments
+    op.execute("""
+        INSERT INTO revenue_daily_rollup (rollup_date, tax_type_id, payment_method, total_amount, payment_count, updated_at)
+        SELECT DATE(p.payment_date), r.tax_type_id, p.payment_method, SUM(p.amount), COUNT(p.id), CURRENT_TIMESTAMP
+        FROM payments p JOIN tax_returns r ON p.tax_return_id = r.id
+        WHERE p.status = 'Completed'
+        GROUP BY DATE(p.payment_date), r.tax_type_id, p.payment_method
+    """)
+
+
+def downgrade():
+    op.drop_table('revenue_daily_rollup')
@@ -0,0 +1,82 @@
+"""Add composite indexes for hot listing and report paths
+
+Revision ID: 5d1f0a8e62c7
+Revises: 9e4a7b13d6f2
+Create Date: 2026-10-18 12:04:31.271590
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f0a8e62c7'
+down_revision = '9e4a7b13d6f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_accounts_user_id', 'accounts', ['user_id'], unique=False)
+    op.create_index('ix_tax_periods_tax_type_start_date', 'tax_periods', ['tax_type_id', 'start_date'], unique=False)
+    op.create_index('ix_tax_periods_due_date', 'tax_periods', ['due_date'], unique=False)
+    op.create_index('ix_tax_obligations_account_tax_type', 'tax_obligations', ['account_id', 'tax_type_id'], unique=False)
+    op.create_index('ix_tax_returns_account_status_created_at', 'tax_returns', ['account_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_tax_returns_tax_type_status', 'tax_returns', ['tax_type_id', 'status'], unique=False)
+    op.create_index('ix_tax_returns_tax_period_id', 'tax_returns', ['tax_period_id'], unique=False)
+    op.create_index('ix_tax_returns_created_at', 'tax_returns', ['created_at'], unique=False)
+    op.create_index('ix_payments_tax_return_status', 'payments', ['tax_return_id', 'status'], unique=False)
+    op.create_index('ix_payments_payment_date', 'payments', ['payment_date'], unique=False)
+    op.create_index('ix_payments_collection_id', 'payments', ['collection_id'], unique=False)
+    op.create_index('ix_refunds_account_request_date', 'refunds', ['account_id', 'request_date'], unique=False)
+    op.create_index('ix_refunds_status_request_date', 'refunds', ['status', 'request_date'], unique=False)
+    op.create_index('ix_objections_tax_return_status', 'objections', ['tax_return_id', 'status'], unique=False)
+    op.create_index('ix_registrations_account_id', 'registrations', ['account_id'], unique=False)
+    op.create_index('ix_taxpayer_ledgers_account_tax_type_date', 'taxpayer_ledgers', ['account_id', 'tax_type_id', 'transaction_date'], unique=False)
+    op.create_index('ix_audit_cases_audit_id', 'audit_cases', ['audit_id'], unique=False)
+    op.create_index('ix_account_holders_account_id', 'account_holders', ['account_id'], unique=False)
+    op.create_index('ix_properties_account_id', 'properties', ['account_id'], unique=False)
+    op.create_index('ix_requests_account_submission_date', 'requests', ['account_id', 'submission_date'], unique=False)
+    op.create_index('ix_requests_status_submission_date', 'requests', ['status', 'submission_date'], unique=False)
+    op.create_index('ix_audits_account_id', 'audits', ['account_id'], unique=False)
+    op.create_index('ix_audits_auditor_status', 'audits', ['auditor_id', 'status'], unique=False)
+    op.create_index('ix_audits_status_start_date', 'audits', ['status', 'start_date'], unique=False)
+    op.create_index('ix_collections_account_id', 'collections', ['account_id'], unique=False)
+    op.create_index('ix_collections_status_start_date', 'collections', ['status', 'start_date'], unique=False)
+    op.create_index('ix_notifications_user_read_created_at', 'notifications', ['user_id', 'is_read', 'created_at'], unique=False)
+    op.create_index('ix_work_items_assigned_status_due_date', 'work_items', ['assigned_to', 'status', 'due_date'], unique=False)
+    op.create_index('ix_cases_assigned_status_created_at', 'cases', ['assigned_to', 'status', 'created_at'], unique=False)
+    op.create_index('ix_correspondences_account_id', 'correspondences', ['account_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_correspondences_account_id', table_name='correspondences')
+    op.drop_index('ix_cases_assigned_status_created_at', table_name='cases')
+    op.drop_index('ix_work_items_assigned_status_due_date', table_name='work_items')
+    op.drop_index('ix_notifications_user_read_created_at', table_name='notifications')
+    op.drop_index('ix_collections_status_start_date', table_name='collections')
+    op.drop_index('ix_collections_account_id', table_name='collections')
+    op.drop_index('ix_audits_status_start_date', table_name='audits')
+    op.drop_index('ix_audits_auditor_status', table_name='audits')
+    op.drop_index('ix_audits_account_id', table_name='audits')
+    op.drop_index('ix_requests_status_submission_date', table_name='requests')
+    op.drop_index('ix_requests_account_submission_date', table_name='requests')
+    op.drop_index('ix_properties_account_id', table_name='properties')
+    op.drop_index('ix_account_holders_account_id', table_name='account_holders')
+    op.drop_index('ix_audit_cases_audit_id', table_name='audit_cases')
+    op.drop_index('ix_taxpayer_ledgers_account_tax_type_date', table_name='taxpayer_ledgers')
+    op.drop_index('ix_registrations_account_id', table_name='registrations')
+    op.drop_index('ix_objections_tax_return_status', table_name='objections')
+    op.drop_index('ix_refunds_status_request_date', table_name='refunds')
+    op.drop_index('ix_refunds_account_request_date', table_name='refunds')
+    op.drop_index('ix_payments_collection_id', table_name='payments')
+    op.drop_index('ix_payments_payment_date', table_name='payments')
+    op.drop_index('ix_payments_tax_return_status', table_name='payments')
+    op.drop_index('ix_tax_returns_created_at', table_name='tax_returns')
+    op.drop_index('ix_tax_returns_tax_period_id', table_name='tax_returns')
+    op.drop_index('ix_tax_returns_tax_type_status', table_name='tax_returns')
+    op.drop_index('ix_tax_returns_account_status_created_at', table_name='tax_returns')
+    op.drop_index('ix_tax_obligations_account_tax_type', table_name='tax_obligations')
+    op.drop_index('ix_tax_periods_due_date', table_name='tax_periods')
+    op.drop_index('ix_tax_periods_tax_type_start_date', table_name='tax_periods')
+    op.drop_index('ix_accounts_user_id', table_name='accounts')
@@ -0,0 +1,46 @@
+"""Add account_balances snapshot table
+
+Revision ID: 7c2d94a1e5b3
+Revises: 3b8e61f0c2a4
+Create Date: 2026-10-18 10:41:07.552816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2d94a1e5b3'
+down_revision = '3b8e61f0c2a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('account_balances',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('tax_type_id', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('last_ledger_id', sa.Integer(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ),
+        sa.ForeignKeyConstraint(['tax_type_id'], ['tax_types.id'], ),
+        sa.ForeignKeyConstraint(['last_ledger_id'], ['taxpayer_ledgers.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('account_id', 'tax_type_id', name='uq_account_balances_account_tax_type')
+    )
+    # Backfill snapshots from the existing ledger; per-row running balances
+    # are repaired separately with `flask verify-ledger-balances --fix`
+    op.execute("""
+        INSERT INTO account_balances (account_id, tax_type_id, balance, last_ledger_id, updated_at)
+        SELECT account_id, tax_type_id,
+               SUM(COALESCE(debit_amount, 0) - COALESCE(credit_amount, 0)),
+               MAX(id), CURRENT_TIMESTAMP
+        FROM taxpayer_ledgers
+        GROUP BY account_id, tax_type_id
+    """)
+
+
+def downgrade():
+    op.drop_table('account_balances')
@@ -0,0 +1,33 @@
+"""Backfill tax_returns.created_at and make it NOT NULL for keyset pagination
+
+Revision ID: 8d3b6f1e9a42
+Revises: b7e2f94d0c13
+Create Date: 2026-10-19 10:12:05.481927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3b6f1e9a42'
+down_revision = 'b7e2f94d0c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows without a creation time fall back to when they were filed, or now;
+    # a NULL sort key would drop them out of the listing's seek predicate
+    op.execute("""
+        UPDATE tax_returns SET created_at = COALESCE(filing_date, CURRENT_TIMESTAMP)
+        WHERE created_at IS NULL
+    """)
+
+    with op.batch_alter_table('tax_returns', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tax_returns', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
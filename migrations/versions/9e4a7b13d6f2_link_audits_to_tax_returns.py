@@ -0,0 +1,69 @@
+"""Link audits and audit cases to tax returns
+
+Revision ID: 9e4a7b13d6f2
+Revises: 7c2d94a1e5b3
+Create Date: 2026-10-18 11:26:53.904417
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4a7b13d6f2'
+down_revision = '7c2d94a1e5b3'
+branch_labels = None
+depends_on = None
+
+
+NOTIFICATION_PATTERN = re.compile(r'Your tax return (.+?) for .* Reference: (\S+)')
+
+
+def upgrade():
+    with op.batch_alter_table('audits', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tax_return_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_audits_tax_return_id'), ['tax_return_id'], unique=False)
+        batch_op.create_foreign_key('fk_audits_tax_return_id', 'tax_returns', ['tax_return_id'], ['id'])
+
+    with op.batch_alter_table('audit_cases', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tax_return_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_audit_cases_tax_return_id'), ['tax_return_id'], unique=False)
+        batch_op.create_foreign_key('fk_audit_cases_tax_return_id', 'tax_returns', ['tax_return_id'], ['id'])
+
+    # Backfill existing audits from the "Tax Return Under Audit" notifications,
+    # which carry both the tax return and the audit reference numbers
+    bind = op.get_bind()
+    notifications = bind.execute(sa.text(
+        "SELECT message FROM notifications WHERE title = 'Tax Return Under Audit'"
+    ))
+    for (message,) in notifications:
+        match = NOTIFICATION_PATTERN.search(message or '')
+        if not match:
+            continue
+        bind.execute(sa.text("""
+            UPDATE audits SET tax_return_id = (
+                SELECT id FROM tax_returns WHERE reference_number = :return_ref
+            )
+            WHERE reference_number = :audit_ref AND tax_return_id IS NULL
+        """), {'return_ref': match.group(1), 'audit_ref': match.group(2)})
+
+    op.execute("""
+        UPDATE audit_cases SET tax_return_id = (
+            SELECT tax_return_id FROM audits WHERE audits.id = audit_cases.audit_id
+        )
+        WHERE tax_return_id IS NULL
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('audit_cases', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_audit_cases_tax_return_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_audit_cases_tax_return_id'))
+        batch_op.drop_column('tax_return_id')
+
+    with op.batch_alter_table('audits', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_audits_tax_return_id', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_audits_tax_return_id'))
+        batch_op.drop_column('tax_return_id')
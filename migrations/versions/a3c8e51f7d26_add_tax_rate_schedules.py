@@ -0,0 +1,69 @@
+"""Add tax rate schedules and brackets
+
+Revision ID: a3c8e51f7d26
+Revises: f6c2d9e38b15
+Create Date: 2026-10-18 20:24:11.402615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import date, datetime
+from decimal import Decimal
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c8e51f7d26'
+down_revision = 'f6c2d9e38b15'
+branch_labels = None
+depends_on = None
+
+# The rates previously hardcoded in calculate_tax_due, as (lower_bound, marginal rate) brackets
+DEFAULT_RATE_SCHEDULES = {
+    'VAT': [(0, '0.15')],
+    'PIT': [(0, '0.10'), (50000, '0.15'), (100000, '0.25'), (250000, '0.35')],
+    'CIT': [(0, '0.28')],
+    'WT': [(0, '0.15')],
+    'WHT': [(0, '0.15')],
+    'PT': [(0, '0.02')],
+    'EXT': [(0, '0.10')],
+}
+
+
+def upgrade():
+    schedules = op.create_table('tax_rate_schedules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tax_type_id', sa.Integer(), nullable=False),
+        sa.Column('effective_from', sa.Date(), nullable=False),
+        sa.Column('description', sa.String(length=200), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['tax_type_id'], ['tax_types.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('tax_type_id', 'effective_from', name='uq_tax_rate_schedules_tax_type_effective_from')
+    )
+    brackets = op.create_table('tax_rate_brackets',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('schedule_id', sa.Integer(), nullable=False),
+        sa.Column('lower_bound', sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column('rate', sa.Numeric(precision=7, scale=6), nullable=False),
+        sa.ForeignKeyConstraint(['schedule_id'], ['tax_rate_schedules.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('schedule_id', 'lower_bound', name='uq_tax_rate_brackets_schedule_lower_bound')
+    )
+
+    # Carry the existing rates over for the tax types already on file
+    connection = op.get_bind()
+    tax_types = connection.execute(sa.text('SELECT id, code FROM tax_types')).fetchall()
+    now = datetime.utcnow()
+    for tax_type_id, code in tax_types:
+        if code not in DEFAULT_RATE_SCHEDULES:
+            continue
+        schedule_id = connection.execute(schedules.insert().values(
+            tax_type_id=tax_type_id, effective_from=date(2000, 1, 1), description='Default rates', created_at=now
+        )).inserted_primary_key[0]
+        op.bulk_insert(brackets, [{'schedule_id': schedule_id, 'lower_bound': Decimal(lower), 'rate': Decimal(rate)}
+                                  for lower, rate in DEFAULT_RATE_SCHEDULES[code]])
+
+
+def downgrade():
+    op.drop_table('tax_rate_brackets')
+    op.drop_table('tax_rate_schedules')
@@ -0,0 +1,32 @@
+"""Add notification_counters table
+
+Revision ID: a6c3d8e14b90
+Revises: e47b2c9f1a38
+Create Date: 2026-10-18 15:11:42.508213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3d8e14b90'
+down_revision = 'e47b2c9f1a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Counters are backfilled by `flask reconcile-notification-counters`; until a
+    # user has a row their unread count is computed exactly on read.
+    op.create_table('notification_counters',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('unread_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('notification_counters')
@@ -0,0 +1,45 @@
+"""Add report_jobs table
+
+Revision ID: b2e9f47c1d65
+Revises: a6c3d8e14b90
+Create Date: 2026-10-18 16:37:05.914420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2e9f47c1d65'
+down_revision = 'a6c3d8e14b90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('report_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('request_key', sa.String(length=100), nullable=False),
+        sa.Column('report_type', sa.String(length=50), nullable=False),
+        sa.Column('start_date', sa.Date(), nullable=False),
+        sa.Column('end_date', sa.Date(), nullable=False),
+        sa.Column('tax_type_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('requested_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['requested_by'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['tax_type_id'], ['tax_types.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('request_key')
+    )
+    op.create_index('ix_report_jobs_status_id', 'report_jobs', ['status', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_report_jobs_status_id', table_name='report_jobs')
+    op.drop_table('report_jobs')
@@ -0,0 +1,30 @@
+"""Add report job parameters and a ledger reference index for policy simulations
+
+Revision ID: b7e2f94d0c13
+Revises: a3c8e51f7d26
+Create Date: 2026-10-18 21:07:52.618340
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f94d0c13'
+down_revision = 'a3c8e51f7d26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('report_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('parameters', sa.Text(), nullable=True))
+
+    op.create_index('ix_taxpayer_ledgers_reference_number', 'taxpayer_ledgers', ['reference_number'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_taxpayer_ledgers_reference_number', table_name='taxpayer_ledgers')
+
+    with op.batch_alter_table('report_jobs', schema=None) as batch_op:
+        batch_op.drop_column('parameters')
@@ -0,0 +1,57 @@
+"""Add registry search documents and trigram index
+
+Revision ID: c5a7e20d9f13
+Revises: b2e9f47c1d65
+Create Date: 2026-10-18 17:20:48.116352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e20d9f13'
+down_revision = 'b2e9f47c1d65'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('search_documents',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('document', sa.Text(), nullable=False),
+        sa.Column('ngram_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('entity_type', 'entity_id', name='uq_search_documents_entity')
+    )
+    op.create_table('search_ngrams',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity_type', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('ngram', sa.String(length=3), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_search_ngrams_lookup', 'search_ngrams', ['entity_type', 'ngram', 'entity_id'], unique=False)
+    op.create_index('ix_search_ngrams_entity', 'search_ngrams', ['entity_type', 'entity_id'], unique=False)
+    
+    # PostgreSQL searches through a generated tsvector and pg_trgm instead of search_ngrams
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            "ALTER TABLE search_documents ADD COLUMN search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', document)) STORED"
+        )
+        op.execute('CREATE INDEX ix_search_documents_vector ON search_documents USING gin (search_vector)')
+        op.execute('CREATE INDEX ix_search_documents_trgm ON search_documents USING gin (document gin_trgm_ops)')
+    
+    # Documents are backfilled with `flask rebuild-search-index`
+
+
+def downgrade():
+    op.drop_index('ix_search_ngrams_entity', table_name='search_ngrams')
+    op.drop_index('ix_search_ngrams_lookup', table_name='search_ngrams')
+    op.drop_table('search_ngrams')
+    op.drop_table('search_documents')
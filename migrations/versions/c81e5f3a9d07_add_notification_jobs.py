@@ -0,0 +1,40 @@
+"""Add notification_jobs queue table
+
+Revision ID: c81e5f3a9d07
+Revises: 5d1f0a8e62c7
+Create Date: 2026-10-18 13:17:42.680154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81e5f3a9d07'
+down_revision = '5d1f0a8e62c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audience', sa.String(length=20), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('notification_type', sa.String(length=50), nullable=True),
+        sa.Column('priority', sa.String(length=10), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('recipient_count', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_notification_jobs_status_id', 'notification_jobs', ['status', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notification_jobs_status_id', table_name='notification_jobs')
+    op.drop_table('notification_jobs')
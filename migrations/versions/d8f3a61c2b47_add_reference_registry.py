@@ -0,0 +1,37 @@
+"""Add reference registry
+
+Revision ID: d8f3a61c2b47
+Revises: c5a7e20d9f13
+Create Date: 2026-10-18 18:05:12.409771
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3a61c2b47'
+down_revision = 'c5a7e20d9f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reference_registry',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('reference_number', sa.String(length=50), nullable=False),
+        sa.Column('prefix', sa.String(length=10), nullable=False),
+        sa.Column('entity_type', sa.String(length=30), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('reference_number')
+    )
+    op.create_index(op.f('ix_reference_registry_prefix'), 'reference_registry', ['prefix'], unique=False)
+    
+    # Existing references are registered with `flask backfill-reference-registry`
+
+
+def downgrade():
+    op.drop_index(op.f('ix_reference_registry_prefix'), table_name='reference_registry')
+    op.drop_table('reference_registry')
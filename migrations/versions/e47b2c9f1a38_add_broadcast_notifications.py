@@ -0,0 +1,46 @@
+"""Add broadcast_notifications and notification_receipts tables
+
+Revision ID: e47b2c9f1a38
+Revises: c81e5f3a9d07
+Create Date: 2026-10-18 14:02:19.337051
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e47b2c9f1a38'
+down_revision = 'c81e5f3a9d07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('broadcast_notifications',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('audience', sa.String(length=20), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('notification_type', sa.String(length=50), nullable=True),
+        sa.Column('priority', sa.String(length=10), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_broadcast_notifications_audience_created_at', 'broadcast_notifications', ['audience', 'created_at'], unique=False)
+    op.create_table('notification_receipts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('broadcast_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('read_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['broadcast_id'], ['broadcast_notifications.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'broadcast_id', name='uq_notification_receipts_user_broadcast')
+    )
+
+
+def downgrade():
+    op.drop_table('notification_receipts')
+    op.drop_index('ix_broadcast_notifications_audience_created_at', table_name='broadcast_notifications')
+    op.drop_table('broadcast_notifications')
@@ -0,0 +1,62 @@
+"""Add bank imports and suspense payments
+
+Revision ID: e5b1c8d27a94
+Revises: d8f3a61c2b47
+Create Date: 2026-10-18 19:02:37.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b1c8d27a94'
+down_revision = 'd8f3a61c2b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('bank_imports',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=200), nullable=False),
+        sa.Column('file_format', sa.String(length=20), nullable=False),
+        sa.Column('checksum', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('total_lines', sa.Integer(), nullable=False),
+        sa.Column('matched_lines', sa.Integer(), nullable=False),
+        sa.Column('suspense_lines', sa.Integer(), nullable=False),
+        sa.Column('matched_amount', sa.Numeric(precision=16, scale=2), nullable=False),
+        sa.Column('imported_by', sa.Integer(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['imported_by'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('checksum')
+    )
+    op.create_table('suspense_payments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bank_import_id', sa.Integer(), nullable=False),
+        sa.Column('line_number', sa.Integer(), nullable=False),
+        sa.Column('bank_reference', sa.String(length=50), nullable=True),
+        sa.Column('payment_reference', sa.String(length=50), nullable=True),
+        sa.Column('amount', sa.Numeric(precision=14, scale=2), nullable=True),
+        sa.Column('value_date', sa.Date(), nullable=True),
+        sa.Column('payer_name', sa.String(length=120), nullable=True),
+        sa.Column('reason', sa.String(length=200), nullable=False),
+        sa.Column('raw_line', sa.Text(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['bank_import_id'], ['bank_imports.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_suspense_payments_status_created_at', 'suspense_payments', ['status', 'created_at'], unique=False)
+    op.create_index('ix_suspense_payments_bank_import_id', 'suspense_payments', ['bank_import_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_suspense_payments_bank_import_id', table_name='suspense_payments')
+    op.drop_index('ix_suspense_payments_status_created_at', table_name='suspense_payments')
+    op.drop_table('suspense_payments')
+    op.drop_table('bank_imports')
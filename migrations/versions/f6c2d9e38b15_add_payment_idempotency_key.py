@@ -0,0 +1,28 @@
+"""Add payment idempotency key
+
+Revision ID: f6c2d9e38b15
+Revises: e5b1c8d27a94
+Create Date: 2026-10-18 19:41:05.553920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c2d9e38b15'
+down_revision = 'e5b1c8d27a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_payments_idempotency_key', ['idempotency_key'])
+
+
+def downgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_payments_idempotency_key', type_='unique')
+        batch_op.drop_column('idempotency_key')